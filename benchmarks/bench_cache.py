@@ -0,0 +1,91 @@
+"""
+Microbenchmark for `utils.cache.LRUCache` at 10^5 - 10^6 entries.
+
+Measures set/get throughput for a full cache under a stream of unique keys
+(every insert forces an eviction) and for a hot-key read workload, and reports
+the cache's hit/miss/eviction counters. `--legacy` additionally times the old
+dict + full-scan cleanup for comparison; it is quadratic, so it is capped at
+`--legacy-max` inserts.
+
+Usage:
+    python benchmarks/bench_cache.py --sizes 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cache import LRUCache
+
+def _rate(ops: int, elapsed: float) -> str:
+    return f"{ops / elapsed / 1e6:6.2f} M ops/s ({elapsed / ops * 1e9:6.0f} ns/op)"
+
+def bench_lru(size: int, max_bytes: bool) -> None:
+    value = "x" * 200
+    cache = LRUCache(max_entries=size, ttl_seconds=3600, max_bytes=size * 220 if max_bytes else None)
+
+    started = time.perf_counter()
+    for i in range(size):
+        cache.set(f"prompt {i}", value)
+    fill = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(size, 2 * size):
+        cache.set(f"prompt {i}", value)
+    churn = time.perf_counter() - started
+
+    keys = [f"prompt {random.randrange(size, 2 * size)}" for _ in range(size)]
+    started = time.perf_counter()
+    for key in keys:
+        cache.get(key)
+    hits = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(size):
+        cache.get(f"missing {i}")
+    misses = time.perf_counter() - started
+
+    label = f"LRUCache n={size:,}" + (" +bytes" if max_bytes else "")
+    print(f"{label}")
+    print(f"  fill        {_rate(size, fill)}")
+    print(f"  set+evict   {_rate(size, churn)}")
+    print(f"  get (hit)   {_rate(size, hits)}")
+    print(f"  get (miss)  {_rate(size, misses)}")
+    print(f"  stats       {cache.stats()}")
+
+def bench_legacy(size: int, max_size: int = 1000) -> None:
+    # The previous implementation: a plain dict plus an O(n) TTL scan on every insert past max_size.
+    cache = {}
+    value = "x" * 200
+    started = time.perf_counter()
+    for i in range(size):
+        cache[f"prompt {i}"] = (value, datetime.utcnow())
+        if len(cache) > max_size:
+            for key, (_, timestamp) in list(cache.items()):
+                if (datetime.utcnow() - timestamp).total_seconds() > 3600:
+                    del cache[key]
+    elapsed = time.perf_counter() - started
+    print(f"legacy dict n={size:,}")
+    print(f"  set         {_rate(size, elapsed)}   final entries {len(cache):,} (unbounded)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="Cache sizes to benchmark")
+    parser.add_argument("--legacy", action="store_true", help="Also time the old dict + full-scan cache")
+    parser.add_argument("--legacy-max", type=int, default=5_000, help="Insert count for the legacy run")
+    args = parser.parse_args()
+
+    random.seed(0)
+    for size in args.sizes:
+        bench_lru(size, max_bytes=False)
+        bench_lru(size, max_bytes=True)
+    if args.legacy:
+        bench_legacy(args.legacy_max)
+
+if __name__ == "__main__":
+    main()
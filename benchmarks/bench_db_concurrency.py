@@ -0,0 +1,147 @@
+"""
+Concurrent throughput of the POST /requests persistence path, before and after
+moving the database layer onto `AsyncSession`.
+
+Both modes run the same handler shape as `routers.requests.create_request`:
+an awaited upstream call (simulated with `asyncio.sleep`) followed by
+`add` / `commit` / `refresh`. The "sync" mode drives a plain SQLAlchemy
+`Session` from inside the coroutine, exactly like the old router did; the
+"async" mode uses the engine built by `database.build_engine`.
+
+Database round-trip latency is injected inside the driver (an SQLite trace
+callback), so it blocks whichever thread actually talks to the database: the
+event loop for the sync session, the aiosqlite worker thread for the async one.
+COMMIT is exempt so the single SQLite writer lock is never held across the
+simulated network wait. SQLite still serializes writers, so the async tail
+latency here is pessimistic compared to PostgreSQL.
+
+Usage:
+    python benchmarks/bench_db_concurrency.py --requests 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import Base, build_engine
+
+def _install_latency(sync_engine, latency_s: float) -> None:
+    """
+    Adds `latency_s` of driver-side delay to every statement except COMMIT/ROLLBACK.
+    """
+    def trace(statement: str) -> None:
+        if not statement.lstrip().upper().startswith(("COMMIT", "ROLLBACK")):
+            time.sleep(latency_s)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+        if hasattr(dbapi_connection, "await_"):
+            dbapi_connection.await_(dbapi_connection.driver_connection.set_trace_callback(trace))
+        else:
+            dbapi_connection.set_trace_callback(trace)
+
+async def _loop_lag_probe(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """
+    Measures the worst scheduling delay seen by a task that wakes every `interval` seconds.
+    """
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+async def _run(mode: str, url: str, total: int, concurrency: int, upstream_s: float, db_latency_s: float) -> dict:
+    if mode == "sync":
+        sync_engine = create_engine(url, connect_args={"check_same_thread": False})
+        _install_latency(sync_engine, db_latency_s)
+        Base.metadata.create_all(bind=sync_engine)
+        SessionLocal = sessionmaker(bind=sync_engine, autoflush=False)
+    else:
+        async_engine = build_engine(url)
+        _install_latency(async_engine.sync_engine, db_latency_s)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def handle(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await asyncio.sleep(upstream_s)  # the awaited OpenAI call
+            new_request = models.Request(text=f"prompt {i}", response="response", created_at=datetime.utcnow())
+            if mode == "sync":
+                db = SessionLocal()
+                try:
+                    db.add(new_request)
+                    db.commit()
+                    db.refresh(new_request)
+                finally:
+                    db.close()
+            else:
+                async with AsyncSessionLocal() as db:
+                    db.add(new_request)
+                    await db.commit()
+                    await db.refresh(new_request)
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_loop_lag_probe(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await probe
+
+    if mode == "sync":
+        sync_engine.dispose()
+    else:
+        await async_engine.dispose()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "rps": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "max_loop_lag_ms": worst_lag * 1000,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Total simulated POST /requests calls")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight at once")
+    parser.add_argument("--upstream-ms", type=float, default=50.0, help="Simulated OpenAI latency")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="Simulated database round-trip latency")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("sync", "async"):
+            url = f"sqlite:///{os.path.join(tmp, mode + '.db')}"
+            result = asyncio.run(_run(mode, url, args.requests, args.concurrency, args.upstream_ms / 1000, args.db_latency_ms / 1000))
+            print(
+                f"{result['mode']:>5}: {result['rps']:8.1f} req/s  "
+                f"p50={result['p50_ms']:7.1f} ms  p99={result['p99_ms']:7.1f} ms  "
+                f"max loop lag={result['max_loop_lag_ms']:6.1f} ms"
+            )
+
+if __name__ == "__main__":
+    main()
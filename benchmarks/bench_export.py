@@ -0,0 +1,69 @@
+"""
+Memory use and throughput of the streaming export in `database/export.py`.
+
+Seeds a throwaway SQLite database, then exports it at several table sizes while
+tracing Python allocations, to check that peak memory stays flat as the table
+grows (it is bounded by `--chunk-size` rows, not by the table).
+
+Usage:
+    python benchmarks/bench_export.py --rows 1000000 --format csv --gzip
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-export-'), 'bench.db')}"
+
+from sqlalchemy import insert
+
+import models
+from database import engine, init_db
+from database.export import export_stream
+
+async def seed(start: int, stop: int, batch: int = 10_000) -> None:
+    for offset in range(start, stop, batch):
+        values = [
+            {"request_key": f"key-{i}", "text": f"Prompt number {i} " * 5, "response": f"Answer number {i} " * 30, "created_at": datetime(2024, 1, 1) + timedelta(seconds=i)}
+            for i in range(offset, min(offset + batch, stop))
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(models.Request), values)
+
+async def measure(args: argparse.Namespace) -> tuple:
+    bytes_out = 0
+    started = time.perf_counter()
+    tracemalloc.start()
+    async for data in export_stream(engine, args.format, compress=args.gzip, chunk_size=args.chunk_size):
+        bytes_out += len(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - started
+    return bytes_out, peak, elapsed
+
+async def main_async(args: argparse.Namespace) -> None:
+    await init_db()
+    seeded = 0
+    for rows in (args.rows // 100, args.rows // 10, args.rows):
+        await seed(seeded, rows)
+        seeded = rows
+        bytes_out, peak, elapsed = await measure(args)
+        print(f"{rows:>10} rows  {bytes_out / 1e6:9.1f} MB out  {rows / elapsed:10.0f} rows/s  peak traced memory {peak / 1e6:6.2f} MB")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="Largest table size")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Latency of GET /requests (keyset pagination) and GET /requests/search on a large table.
+
+Seeds a throwaway SQLite database with `--rows` requests, then times the first
+page, a page deep into the table (reached through its cursor, as a client paging
+through would), a time-range page and a full-text search, all through the app
+in-process over ASGI. Also prints SQLite's query plans, to check the
+`(created_at, id)` index and the FTS5 table are used.
+
+Usage:
+    python benchmarks/bench_listing.py --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-listing-'), 'bench.db')}"
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import insert, select, text
+
+import models
+from database import AsyncSessionLocal, engine, init_db
+from database.fulltext import match_condition
+from routers import requests
+from routers.requests import encode_cursor
+
+WORDS = "alpha bravo charlie delta echo foxtrot golf hotel india juliett kilo lima mike november oscar papa".split()
+
+async def seed(rows: int, batch: int = 10_000) -> None:
+    rng = random.Random(0)
+    started = datetime(2024, 1, 1)
+    for offset in range(0, rows, batch):
+        values = [
+            {
+                "request_key": f"key-{i}",
+                "text": " ".join(rng.choices(WORDS, k=6)) + f" item{i}",
+                "response": " ".join(rng.choices(WORDS, k=20)),
+                "created_at": started + timedelta(seconds=i),
+            }
+            for i in range(offset, min(offset + batch, rows))
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(models.Request), values)
+
+async def timed(client: httpx.AsyncClient, label: str, path: str, params: dict, repeat: int) -> None:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await client.get(path, params=params)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    print(f"{label:<28}{min(timings) * 1000:8.2f} ms best, {sorted(timings)[len(timings) // 2] * 1000:8.2f} ms median")
+
+async def explain(label: str, query) -> None:
+    async with engine.connect() as conn:
+        compiled = query.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+        plan = (await conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))).all()
+    print(f"{label}: " + "; ".join(row[-1] for row in plan))
+
+async def main_async(args: argparse.Namespace) -> None:
+    await init_db()
+    started = time.perf_counter()
+    await seed(args.rows)
+    print(f"seeded {args.rows} rows in {time.perf_counter() - started:.1f} s")
+
+    app = FastAPI()
+    app.include_router(requests.router, prefix="/requests")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async with AsyncSessionLocal() as db:
+            deep = (await db.execute(
+                select(models.Request).order_by(models.Request.created_at.desc(), models.Request.id.desc()).offset(args.rows * 9 // 10).limit(1)
+            )).scalar_one()
+        await timed(client, "first page", "/requests/", {"limit": args.limit}, args.repeat)
+        await timed(client, "page at 90% depth", "/requests/", {"limit": args.limit, "cursor": encode_cursor(deep.created_at, deep.id)}, args.repeat)
+        await timed(client, "one-hour range", "/requests/", {"limit": args.limit, "created_after": "2024-01-01T05:00:00", "created_before": "2024-01-01T06:00:00"}, args.repeat)
+        await timed(client, "search, common words", "/requests/search", {"q": "alpha bravo", "limit": args.limit}, args.repeat)
+        await timed(client, "search, rare word", "/requests/search", {"q": f"item{args.rows // 2}", "limit": args.limit}, args.repeat)
+
+    listing = select(models.Request).order_by(models.Request.created_at.desc(), models.Request.id.desc()).limit(args.limit)
+    await explain("list plan", listing)
+    await explain("search plan", listing.where(match_condition("sqlite", "alpha bravo")))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows to seed")
+    parser.add_argument("--limit", type=int, default=50, help="Page size")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per query")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
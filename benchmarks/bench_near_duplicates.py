@@ -0,0 +1,161 @@
+"""
+Replays a prompt trace against the response-cache key schemes and reports hit rates and false positives.
+
+The trace is replayed once per scheme: with exact keys, with normalized keys
+(`--normalization`, as CACHE_KEY_NORMALIZATION) and, for every `--thresholds` value,
+with normalized keys plus the SimHash near-duplicate tier (as NEAR_DUPLICATE_THRESHOLD).
+Misses are added to the simulated cache, which never expires. A near-duplicate hit is
+a false positive when the matched prompt carries a different label (`--label-field`,
+e.g. an intent or FAQ id); without labels, false positives are not counted. "Missed"
+counts misses whose label had been seen before, i.e. duplicates the scheme did not catch.
+
+The trace is JSON Lines with a `text` field per line, such as the NDJSON of
+GET /requests/export or `python cli.py export`. Without `--trace`, a synthetic trace
+of templated prompts and lightly edited repeats is generated; prompts from the same
+template about different topics are the likely false positives.
+
+Usage:
+    python benchmarks/bench_near_duplicates.py --thresholds 0.95 0.9 0.85
+    python benchmarks/bench_near_duplicates.py --trace requests.ndjson --label-field intent
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.near_duplicates import SimHashIndex, max_distance_for, normalize_prompt, parse_normalization, simhash
+
+TEMPLATES = [
+    "What is the capital of {topic}? Please answer in one sentence.",
+    "Summarize the history of {topic} in three short bullet points.",
+    "Write a short product description for a {topic} aimed at busy parents.",
+    "Explain how {topic} works to a ten year old, using a simple analogy.",
+    "List five common mistakes people make when learning about {topic}.",
+]
+TOPICS = [
+    "France", "Japan", "Brazil", "Kenya", "Canada", "the electric kettle", "the bicycle", "the heat pump",
+    "photosynthesis", "compound interest", "vaccines", "blockchain", "the stock market", "jazz music",
+    "the Roman Empire", "machine learning", "sourdough bread", "solar panels", "the immune system", "chess openings",
+]
+
+def perturb(text: str, rng: random.Random) -> str:
+    """
+    Applies one of the edits seen in real traffic: case, whitespace, punctuation, a typo or a dropped word.
+    """
+    edit = rng.choice(("case", "whitespace", "punctuation", "typo", "drop"))
+    if edit == "case":
+        return text.lower() if rng.random() < 0.5 else text.upper()
+    if edit == "whitespace":
+        return "  " + text.replace(" ", "  ", 2) + "\n"
+    if edit == "punctuation":
+        return text.replace("?", "").replace(",", "").replace(".", "") + rng.choice(("", "!", "??"))
+    words = text.split()
+    position = rng.randrange(len(words))
+    if edit == "typo" and len(words[position]) > 3:
+        word = list(words[position])
+        i = rng.randrange(len(word) - 1)
+        word[i], word[i + 1] = word[i + 1], word[i]
+        words[position] = "".join(word)
+    elif edit == "drop" and len(words) > 4:
+        del words[position]
+    return " ".join(words)
+
+def synthetic_trace(size: int, seed: int) -> List[Tuple[str, str]]:
+    """
+    Generates `size` prompts: exact repeats, perturbed repeats and new prompts, with Zipf-like popularity.
+    """
+    rng = random.Random(seed)
+    base = [(template.format(topic=topic), f"{t}:{i}") for t, template in enumerate(TEMPLATES) for i, topic in enumerate(TOPICS)]
+    rng.shuffle(base)
+    weights = [1 / (rank + 1) for rank in range(len(base))]
+    trace = []
+    for _ in range(size):
+        text, label = rng.choices(base, weights)[0]
+        trace.append((perturb(text, rng) if rng.random() < 0.5 else text, label))
+    return trace
+
+def read_trace(path: str, label_field: Optional[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                label = record.get(label_field) if label_field else None
+                yield record["text"], (str(label) if label is not None else None)
+
+def replay(trace: List[Tuple[str, Optional[str]]], normalization: Tuple[str, ...], threshold: float, min_chars: int, max_entries: int) -> Dict[str, float]:
+    """
+    Replays the trace through a simulated cache keyed as the service keys it; returns the counts and ratios.
+    """
+    cache: Dict[str, Optional[str]] = {}  # Cache key -> label of the prompt it was answered for
+    index = SimHashIndex(max_distance=max_distance_for(threshold), max_entries=max_entries) if threshold > 0 else None
+    labels_seen = set()
+    counts = {"key_hits": 0, "near_hits": 0, "false_positives": 0, "misses": 0, "missed": 0}
+    lookup_seconds = 0.0
+    for text, label in trace:
+        key = normalize_prompt(text, normalization) if normalization else text
+        if key in cache:
+            counts["key_hits"] += 1
+            continue
+        if index is not None and len(text) >= min_chars:
+            started = time.perf_counter()
+            match = index.find(simhash(text))
+            lookup_seconds += time.perf_counter() - started
+            if match is not None:
+                counts["near_hits"] += 1
+                if label is not None and cache[match[0]] is not None and cache[match[0]] != label:
+                    counts["false_positives"] += 1
+                continue
+        counts["misses"] += 1
+        if label is not None and label in labels_seen:
+            counts["missed"] += 1
+        labels_seen.add(label)
+        cache[key] = label
+        if index is not None and len(text) >= min_chars:
+            index.add(key, simhash(text))
+    total = len(trace)
+    return {
+        **counts,
+        "hit_ratio": (total - counts["misses"]) / total if total else 0.0,
+        "false_positive_ratio": counts["false_positives"] / counts["near_hits"] if counts["near_hits"] else 0.0,
+        "lookup_us": lookup_seconds / index.lookups * 1e6 if index is not None and index.lookups else 0.0,
+        "compared_per_lookup": index.stats()["compared_per_lookup"] if index is not None else 0.0,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", help="JSON Lines file with a `text` field per prompt (default: a synthetic trace).")
+    parser.add_argument("--label-field", default="label", help="Field identifying prompts that deserve the same answer.")
+    parser.add_argument("--size", type=int, default=20000, help="Prompts in the synthetic trace.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic trace.")
+    parser.add_argument("--normalization", default="case,punctuation,whitespace", help="As CACHE_KEY_NORMALIZATION.")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.95, 0.9, 0.85], help="Near-duplicate thresholds to compare.")
+    parser.add_argument("--min-chars", type=int, default=40, help="As NEAR_DUPLICATE_MIN_CHARS.")
+    parser.add_argument("--max-entries", type=int, default=100000, help="As NEAR_DUPLICATE_MAX_ENTRIES.")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = list(read_trace(args.trace, args.label_field))
+    else:
+        trace = synthetic_trace(args.size, args.seed)
+    normalization = parse_normalization(args.normalization)
+    print(f"{len(trace):,} prompts, normalization: {', '.join(normalization) or 'none'}")
+
+    schemes = [("exact", (), 0.0), ("normalized", normalization, 0.0)]
+    schemes += [(f"near >= {threshold}", normalization, threshold) for threshold in args.thresholds]
+    print(f"{'scheme':>14}  {'hit ratio':>9}  {'key hits':>8}  {'near hits':>9}  {'false +':>7}  {'missed':>6}  {'lookup':>9}  {'compared':>8}")
+    for name, scheme_normalization, threshold in schemes:
+        result = replay(trace, scheme_normalization, threshold, args.min_chars, args.max_entries)
+        print(
+            f"{name:>14}  {result['hit_ratio']:9.1%}  {result['key_hits']:8d}  {result['near_hits']:9d}"
+            f"  {result['false_positives']:7d} ({result['false_positive_ratio']:4.0%})  {result['missed']:6d}"
+            f"  {result['lookup_us']:7.1f}us  {result['compared_per_lookup']:8.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
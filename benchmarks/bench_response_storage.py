@@ -0,0 +1,98 @@
+"""
+Storage size and throughput of inline vs deduplicated, compressed response storage.
+
+For each layout a fresh SQLite database is filled with `--rows` requests whose
+answers are drawn from `--distinct` bodies with Zipf-distributed popularity (as
+cache hits and popular prompts produce), inserted in write-behind sized batches
+through `database.response_store.to_storage_rows`. It then reports the database
+size, insert rate, and the rate of reading full rows back as ORM objects (which
+decompresses deduplicated bodies).
+
+Usage:
+    python benchmarks/bench_response_storage.py --rows 100000 --distinct 2000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import Base, build_engine
+from database.response_store import to_storage_rows, zstandard
+
+LAYOUTS = [("inline", None), ("dedup", "none"), ("dedup", "zlib")] + ([("dedup", "zstd")] if zstandard is not None else [])
+
+def make_rows(rows: int, distinct: int, zipf: float, seed: int) -> list:
+    rng = random.Random(seed)
+    words = "the model answered with a detailed explanation covering context examples caveats and a short summary".split()
+    bodies = [" ".join(rng.choices(words, k=rng.randint(80, 400))) + f" (answer {i})" for i in range(distinct)]
+    weights = [1 / (rank + 1) ** zipf for rank in range(distinct)]
+    now = datetime.utcnow()
+    return [
+        {"request_key": f"key-{i}", "text": f"Prompt {i}", "response": body, "created_at": now}
+        for i, body in enumerate(rng.choices(bodies, weights, k=rows))
+    ]
+
+async def bench_layout(storage: str, codec: str, rows: list, batch_size: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-storage-"), "bench.db")
+    engine = build_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # 1. Insert in batches, as the write-behind flusher does
+    started = time.perf_counter()
+    for offset in range(0, len(rows), batch_size):
+        async with AsyncSession(engine) as db:
+            await db.execute(insert(models.Request), await to_storage_rows(db, rows[offset:offset + batch_size], storage, codec))
+            await db.commit()
+    insert_rate = len(rows) / (time.perf_counter() - started)
+
+    # 2. Read every row back as an ORM object and touch its response
+    started = time.perf_counter()
+    read = 0
+    async with AsyncSession(engine) as db:
+        for offset in range(0, len(rows), batch_size):
+            page = (await db.execute(select(models.Request).where(models.Request.id > offset).order_by(models.Request.id).limit(batch_size))).scalars()
+            read += sum(len(row.response) for row in page)
+            db.expunge_all()
+    read_rate = len(rows) / (time.perf_counter() - started)
+
+    async with engine.connect() as conn:
+        await conn.execute(text("VACUUM"))
+        pages = (await conn.execute(text("PRAGMA page_count"))).scalar()
+        page_size = (await conn.execute(text("PRAGMA page_size"))).scalar()
+        bodies = (await conn.execute(text("SELECT count(*) FROM response_bodies"))).scalar()
+    await engine.dispose()
+    label = storage if storage == "inline" else f"{storage}/{codec}"
+    print(f"{label:<12}{pages * page_size / 1e6:10.1f} MB{bodies:>10} bodies{insert_rate:12.0f} rows/s in{read_rate:12.0f} rows/s out")
+
+async def main_async(args: argparse.Namespace) -> None:
+    rows = make_rows(args.rows, args.distinct, args.zipf, args.seed)
+    raw = sum(len(row["response"]) for row in rows)
+    print(f"{args.rows} rows, {args.distinct} distinct answers, {raw / 1e6:.1f} MB of response text")
+    for storage, codec in LAYOUTS:
+        await bench_layout(storage, codec, rows, args.batch_size)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000, help="Requests to store")
+    parser.add_argument("--distinct", type=int, default=2_000, help="Distinct answers among them")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of answer popularity")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per insert and per read")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
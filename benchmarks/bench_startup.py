@@ -0,0 +1,75 @@
+"""
+Cold-start cost of the application: import time, startup (lifespan) time and first-request latency.
+
+Each run is a fresh interpreter, so nothing is cached between runs except what the
+operating system keeps (the first run is usually slower and is reported separately).
+The app is started against a throwaway SQLite database; `--no-init-db` starts it
+with schema setup turned off, as workers would when `python cli.py init-db` runs once
+before them.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --runs 10 --no-init-db
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints the measured durations (in seconds) as JSON
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+from settings import Settings
+app = main.create_app(Settings(database_url=sys.argv[1], openai_api_key="sk-bench", init_db=sys.argv[2] == "1"))
+with TestClient(app) as client:
+    ready = time.perf_counter()
+    first = client.get("/requests/?limit=1")
+    served = time.perf_counter()
+    client.get("/requests/?limit=1")
+    second = time.perf_counter()
+assert first.status_code == 200, first.text
+print(json.dumps({
+    "import": imported - started,
+    "startup": ready - imported,
+    "first_request": served - ready,
+    "second_request": second - served,
+}))
+"""
+
+def run_once(database_url: str, init_db: bool) -> dict:
+    env = {**os.environ, "DATABASE_URL": database_url}
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, database_url, "1" if init_db else "0"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start.")
+    parser.add_argument("--database-url", help="Database to start against (default: a throwaway SQLite file).")
+    parser.add_argument("--no-init-db", action="store_true", help="Start without schema setup (the schema is created once beforehand).")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-startup-'), 'bench.db')}"
+    if args.no_init_db:
+        run_once(database_url, init_db=True)  # Create the schema, as `cli.py init-db` would
+
+    runs = [run_once(database_url, init_db=not args.no_init_db) for _ in range(args.runs + 1)]
+    print(f"first run: " + "  ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in runs[0].items()))
+    for name in runs[0]:
+        values = sorted(run[name] * 1000 for run in runs[1:])
+        print(f"{name:>15}  median {statistics.median(values):7.1f} ms  min {values[0]:7.1f} ms  max {values[-1]:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+A local fake of the OpenAI chat-completions API for benchmarks and load tests.
+
+Answers `POST /v1/chat/completions` (plain and `stream=True`) after a configurable
+latency, streams its answer in configurable chunks, and injects 5xx/429 errors at a
+configurable rate. It can be used in-process through `httpx.ASGITransport`, as
+`benchmarks/load_test.py` does, or served over HTTP for a separately started app
+(the OpenAI client reads `OPENAI_BASE_URL`, e.g. `http://127.0.0.1:9000/v1`).
+
+Usage:
+    python benchmarks/fake_openai.py --port 9000 --latency-ms 300 --jitter-ms 100 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+class FakeOpenAI:
+    """
+    Configuration, counters and ASGI app of one fake upstream.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 200.0,
+        jitter_ms: float = 50.0,
+        chunk_delay_ms: float = 5.0,
+        response_tokens: int = 50,
+        chunk_tokens: int = 5,
+        error_rate: float = 0.0,
+        rate_limit_share: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            latency_ms (float): Mean time before the answer (or the first streamed chunk).
+            jitter_ms (float): Half-width of the uniform jitter around `latency_ms`.
+            chunk_delay_ms (float): Delay between streamed chunks.
+            response_tokens (int): Words in every answer (one word is counted as one token).
+            chunk_tokens (int): Words per streamed chunk.
+            error_rate (float): Share of calls that fail.
+            rate_limit_share (float): Share of the failures answered with 429 instead of 500.
+            seed (Optional[int]): Seed for reproducible latencies and errors.
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_delay_ms = chunk_delay_ms
+        self.response_tokens = response_tokens
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.app = self._build_app()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors, "peak_in_flight": self.peak_in_flight}
+
+    def _latency(self) -> float:
+        return max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def _answer(self, prompt: str) -> list:
+        words = prompt.split() or ["ok"]
+        return [words[i % len(words)] for i in range(self.response_tokens)]
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            self.calls += 1
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                await asyncio.sleep(self._latency() / 2)
+                if self._random.random() < self.rate_limit_share:
+                    return JSONResponse(
+                        {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+                        status_code=429,
+                        headers={"retry-after": "0.1"},
+                    )
+                return JSONResponse({"error": {"message": "Injected failure (fake)", "type": "server_error"}}, status_code=500)
+
+            prompt = body["messages"][-1]["content"]
+            words = self._answer(prompt)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if not body.get("stream"):
+                try:
+                    await asyncio.sleep(self._latency())
+                finally:
+                    self.in_flight -= 1
+                return {
+                    "id": f"chatcmpl-fake-{self.calls}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "gpt-3.5-turbo"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                    "usage": {
+                        "prompt_tokens": len(prompt.split()),
+                        "completion_tokens": len(words),
+                        "total_tokens": len(prompt.split()) + len(words),
+                    },
+                }
+
+            async def events():
+                try:
+                    await asyncio.sleep(self._latency())
+                    for start in range(0, len(words), self.chunk_tokens):
+                        piece = " ".join(words[start:start + self.chunk_tokens]) + " "
+                        chunk = {
+                            "id": f"chatcmpl-fake-{self.calls}",
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": body.get("model", "gpt-3.5-turbo"),
+                            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                        }
+                        yield f"data: {json.dumps(chunk)}\n\n"
+                        await asyncio.sleep(self.chunk_delay_ms / 1000)
+                    yield "data: [DONE]\n\n"
+                finally:
+                    self.in_flight -= 1
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        @app.get("/stats")
+        async def get_stats():
+            return self.stats()
+
+        return app
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the fake upstream's settings to a command-line parser (shared with `load_test.py`).
+    """
+    group = parser.add_argument_group("fake OpenAI upstream")
+    group.add_argument("--latency-ms", type=float, default=200.0, help="Mean upstream latency")
+    group.add_argument("--jitter-ms", type=float, default=50.0, help="Uniform jitter around the mean latency")
+    group.add_argument("--chunk-delay-ms", type=float, default=5.0, help="Delay between streamed chunks")
+    group.add_argument("--response-tokens", type=int, default=50, help="Words per answer")
+    group.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream calls that fail")
+    group.add_argument("--rate-limit-share", type=float, default=0.0, help="Share of failures answered with 429")
+    group.add_argument("--seed", type=int, default=0, help="Random seed")
+
+def from_arguments(args: argparse.Namespace) -> FakeOpenAI:
+    return FakeOpenAI(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        chunk_delay_ms=args.chunk_delay_ms,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        rate_limit_share=args.rate_limit_share,
+        seed=args.seed,
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(from_arguments(args).app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
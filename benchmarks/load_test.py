@@ -0,0 +1,247 @@
+"""
+Load generator for POST /requests (and /requests/stream) against `main.app`.
+
+By default the app runs in-process over ASGI, with a throwaway SQLite database and
+its OpenAI client pointed at the fake upstream from `benchmarks/fake_openai.py`, so
+no network or API key is needed. `--target` benchmarks an app that is already
+running instead (start it with `OPENAI_BASE_URL` pointing at `fake_openai.py`).
+
+Two modes are supported:
+- closed: `--concurrency` clients each send their next request as soon as the
+  previous one finishes. This measures capacity.
+- open: requests arrive as a Poisson process at `--rate` per second regardless of
+  how fast they are answered. Latency is measured from the scheduled arrival, so
+  queueing delay is not hidden (no coordinated omission).
+
+Prompts are drawn from `--unique-prompts` texts with Zipf-distributed popularity
+(`--zipf`; 0 is uniform), which drives the cache hit ratio.
+
+Reports RPS, p50/p95/p99 latency, the error rate and the cache hit ratios (from
+GET /requests/stats). `--output` saves the results as JSON; `--compare` prints
+them next to a previous run's JSON.
+
+Usage:
+    python benchmarks/load_test.py --mode closed --concurrency 50 --duration 10 --output base.json
+    python benchmarks/load_test.py --mode open --rate 200 --duration 10 --compare base.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+import fake_openai
+
+# Metrics compared by --compare, and whether a higher value is better
+COMPARED_METRICS = {
+    "rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "error_rate": False,
+    "cache_hit_ratio": True,
+}
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Returns the `q`-th percentile (0-100) of already sorted values, by nearest rank.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class LoadResult:
+    """
+    Latencies and status codes collected during one run.
+    """
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.started = 0.0
+        self.finished = 0.0
+
+    def record(self, latency: float, status: int) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+
+    def summary(self) -> Dict[str, float]:
+        latencies = sorted(self.latencies)
+        total = len(latencies)
+        errors = total - self.statuses.get(200, 0)
+        elapsed = self.finished - self.started
+        return {
+            "requests": total,
+            "errors": errors,
+            "error_rate": errors / total if total else 0.0,
+            "duration_s": elapsed,
+            "rps": total / elapsed if elapsed else 0.0,
+            "mean_ms": sum(latencies) / total * 1000 if total else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+        }
+
+def prompt_sampler(unique_prompts: int, zipf: float, seed: int) -> Callable[[], str]:
+    """
+    Returns a function drawing prompt texts with Zipf-distributed popularity.
+    """
+    rng = random.Random(seed)
+    prompts = [f"Benchmark prompt number {i}: explain topic {i} briefly." for i in range(unique_prompts)]
+    weights = [1 / (rank + 1) ** zipf for rank in range(unique_prompts)]
+    return lambda: rng.choices(prompts, weights)[0]
+
+async def run_closed_loop(send: Callable[[float], Awaitable[None]], concurrency: int, duration: float, max_requests: Optional[int]) -> None:
+    deadline = time.perf_counter() + duration
+    sent = 0
+
+    async def client() -> None:
+        nonlocal sent
+        while time.perf_counter() < deadline and (max_requests is None or sent < max_requests):
+            sent += 1
+            await send(time.perf_counter())
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+async def run_open_loop(send: Callable[[float], Awaitable[None]], rate: float, duration: float, seed: int) -> None:
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    arrival = started
+    tasks = []
+    while True:
+        arrival += rng.expovariate(rate)
+        if arrival - started >= duration:
+            break
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(arrival)))
+    await asyncio.gather(*tasks)
+
+def _hit_ratio(before: dict, after: dict) -> float:
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    return hits / (hits + misses) if hits + misses else 0.0
+
+async def run(args: argparse.Namespace) -> dict:
+    fake = None
+    if args.target:
+        client = httpx.AsyncClient(base_url=args.target, timeout=args.timeout)
+    else:
+        # Point the in-process app at a throwaway database and the fake upstream before importing it
+        os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'load.db')}")
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        import main
+        from services.openai_service import create_http_client
+
+        fake = fake_openai.from_arguments(args)
+        openai_service = main.app.state.openai_service
+        openai_service.base_url = "http://fake-openai/v1"
+        openai_service._http_client = create_http_client(transport=httpx.ASGITransport(app=fake.app))
+        lifespan = main.app.router.lifespan_context(main.app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app", timeout=args.timeout)
+
+    path = "/requests/stream" if args.stream else "/requests/"
+    next_prompt = prompt_sampler(args.unique_prompts, args.zipf, args.seed)
+    result = LoadResult()
+
+    async def send(scheduled_at: float) -> None:
+        try:
+            response = await client.post(path, json={"text": next_prompt()})
+            status = response.status_code
+            if status == 200 and args.stream and "event: error" in response.text:
+                status = 599  # The stream started but failed part-way
+        except httpx.HTTPError:
+            status = 0
+        result.record(time.perf_counter() - scheduled_at, status)
+
+    try:
+        before = (await client.get("/requests/stats")).json()
+        result.started = time.perf_counter()
+        if args.mode == "closed":
+            await run_closed_loop(send, args.concurrency, args.duration, args.requests)
+        else:
+            await run_open_loop(send, args.rate, args.duration, args.seed)
+        result.finished = time.perf_counter()
+        after = (await client.get("/requests/stats")).json()
+    finally:
+        await client.aclose()
+        if fake is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    summary = result.summary()
+    summary["cache_hit_ratio"] = _hit_ratio(before["cache"], after["cache"])
+    summary["l2_hit_ratio"] = _hit_ratio(before["l2_cache"], after["l2_cache"])
+    summary["coalesced"] = after["single_flight"]["coalesced"] - before["single_flight"]["coalesced"]
+    if fake is not None:
+        summary["upstream"] = fake.stats()
+    return {
+        "name": args.name,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": summary,
+    }
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    results = report["results"]
+    print(f"{report['name']}: {results['requests']} requests in {results['duration_s']:.1f} s, statuses {results['statuses']}")
+    print(f"  cache hit ratio {results['cache_hit_ratio']:.1%}, L2 hit ratio {results['l2_hit_ratio']:.1%}, coalesced {results['coalesced']}")
+    if baseline is None:
+        for key in COMPARED_METRICS:
+            print(f"  {key:<16}{results[key]:>12.3f}")
+        return
+    print(f"  {'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline["results"][key], results[key]
+        change = (new - old) / old * 100 if old else 0.0
+        worse = (change < 0) if higher_is_better else (change > 0)
+        flag = "  worse" if worse and abs(change) >= 5 else ""
+        print(f"  {key:<16}{old:>12.3f}{new:>12.3f}{change:>+9.1f}%{flag}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", default="load-test", help="Label stored with the results")
+    parser.add_argument("--target", help="Base URL of a running app (default: run main.app in-process)")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed", help="Closed-loop or open-loop load")
+    parser.add_argument("--concurrency", type=int, default=50, help="Clients in closed-loop mode")
+    parser.add_argument("--rate", type=float, default=100.0, help="Arrivals per second in open-loop mode")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+    parser.add_argument("--requests", type=int, help="Stop closed-loop mode after this many requests")
+    parser.add_argument("--stream", action="store_true", help="Use POST /requests/stream")
+    parser.add_argument("--unique-prompts", type=int, default=1000, help="Distinct prompt texts")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of prompt popularity (0 = uniform)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against the results in this JSON file")
+    fake_openai.add_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
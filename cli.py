@@ -0,0 +1,168 @@
+"""
+Command-line tools for operating the service.
+
+Usage:
+    python cli.py init-db
+    python cli.py export --format csv --gzip --output requests.csv.gz
+    python cli.py export --since-id 120000 > new-requests.ndjson
+    python cli.py migrate-responses --to dedup
+    python cli.py partition-requests
+    python cli.py apply-retention --days 90 --archive-dir /var/backups/requests
+    python cli.py warm-cache --top 1000 --output /var/cache/requests/cache-snapshot.gz
+"""
+
+import asyncio
+
+import click
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file before the database URL is read
+
+from database import get_engine, init_db
+from database.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_stream
+from database.partitions import PARTITION_INTERVALS, REQUESTS_PARTITION_INTERVAL, convert_to_partitioned
+from database.response_store import CODECS, STORAGE_MODES, migrate_responses
+from database.retention import REQUESTS_ARCHIVE_DIR, REQUESTS_RETENTION_DAYS, RetentionJob
+from services.openai_service import CACHE_MAX_BYTES, CACHE_MAX_SIZE, L2_CACHE_TTL_SECONDS, openai_service
+from settings import CACHE_SNAPSHOT_PATH, CACHE_WARM_TOP
+from utils.cache import LRUCache, load_snapshot, save_snapshot
+
+@click.group()
+def cli():
+    """
+    AI Powered Request Response System tools.
+    """
+
+@cli.command("init-db")
+def init_db_command():
+    """
+    Creates missing tables, columns and indexes, e.g. before starting workers with DB_INIT_ON_STARTUP=false.
+    """
+    async def run():
+        try:
+            await init_db()
+        finally:
+            await get_engine().dispose()
+
+    asyncio.run(run())
+    click.echo("Database schema is up to date", err=True)
+
+@cli.command()
+@click.option("--format", "format_", type=click.Choice(EXPORT_FORMATS), default="ndjson", show_default=True, help="Output format.")
+@click.option("--since-id", type=int, help="Only export rows with a larger id.")
+@click.option("--since", type=click.DateTime(), help="Only export rows created at or after this UTC time.")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip the output.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), default="-", help="Output file (default: stdout).")
+@click.option("--chunk-size", type=click.IntRange(min=1), default=EXPORT_CHUNK_SIZE, show_default=True, help="Rows fetched per round trip.")
+def export(format_, since_id, since, compress, output, chunk_size):
+    """
+    Streams the requests table as NDJSON or CSV with constant memory.
+
+    Prints the number of rows and the last exported id to stderr; pass that id
+    as --since-id to the next run for an incremental export.
+    """
+    exported = {"rows": 0, "last_id": since_id}
+
+    def count(rows):
+        exported["rows"] += len(rows)
+        exported["last_id"] = rows[-1][0]
+
+    async def run(out):
+        try:
+            async for data in export_stream(get_engine(), format_, since_id, since, compress, chunk_size, on_rows=count):
+                out.write(data)
+        finally:
+            await get_engine().dispose()
+
+    with click.open_file(output, "wb") as out:
+        asyncio.run(run(out))
+    click.echo(f"Exported {exported['rows']} rows (last id: {exported['last_id']})", err=True)
+
+@cli.command("migrate-responses")
+@click.option("--to", type=click.Choice(STORAGE_MODES), default="dedup", show_default=True, help="Target response storage.")
+@click.option("--batch-size", type=click.IntRange(min=1), default=1000, show_default=True, help="Rows per transaction.")
+@click.option("--codec", type=click.Choice(CODECS), help="Codec for new bodies (default: RESPONSE_COMPRESSION).")
+def migrate_responses_command(to, batch_size, codec):
+    """
+    Moves existing responses into (or back out of) compressed, deduplicated storage.
+
+    Safe to interrupt and re-run. Set RESPONSE_STORAGE to the same mode so new rows match.
+    """
+    async def run():
+        try:
+            await init_db()
+            return await migrate_responses(get_engine(), to, batch_size, codec)
+        finally:
+            await get_engine().dispose()
+
+    click.echo(f"Migrated {asyncio.run(run())} rows to {to} storage", err=True)
+
+@cli.command("partition-requests")
+@click.option("--interval", type=click.Choice(PARTITION_INTERVALS), default=REQUESTS_PARTITION_INTERVAL or "month", show_default=True, help="Partition period.")
+def partition_requests_command(interval):
+    """
+    Converts a plain PostgreSQL `requests` table into one range-partitioned by `created_at`.
+
+    Existing rows stay where they are, as the `requests_legacy` partition; new periods get
+    their own partitions. Set REQUESTS_PARTITION_INTERVAL to the same period afterwards.
+    """
+    async def run():
+        try:
+            await init_db()
+            return await convert_to_partitioned(get_engine(), interval)
+        finally:
+            await get_engine().dispose()
+
+    statements = asyncio.run(run())
+    click.echo("Converted `requests` to a partitioned table" if statements else "`requests` is already partitioned", err=True)
+
+@cli.command("apply-retention")
+@click.option("--days", type=click.IntRange(min=1), default=REQUESTS_RETENTION_DAYS or None, required=not REQUESTS_RETENTION_DAYS, help="Remove requests older than this many days (default: REQUESTS_RETENTION_DAYS).")
+@click.option("--archive-dir", default=REQUESTS_ARCHIVE_DIR, help="Archive removed requests here as gzipped NDJSON (default: REQUESTS_ARCHIVE_DIR).")
+def apply_retention_command(days, archive_dir):
+    """
+    Runs partition maintenance and retention once, e.g. from cron instead of the app's background job.
+    """
+    job = RetentionJob(retention_days=days, archive_dir=archive_dir)
+
+    async def run():
+        try:
+            await init_db()
+            await job.run_once()
+        finally:
+            await get_engine().dispose()
+
+    asyncio.run(run())
+    stats = job.stats()
+    click.echo(
+        f"Deleted {stats['rows_deleted']} rows, dropped {stats['partitions_dropped']} partitions, wrote {stats['archives_written']} archives",
+        err=True,
+    )
+
+@cli.command("warm-cache")
+@click.option("--top", type=click.IntRange(min=1), default=CACHE_WARM_TOP or 1000, show_default=True, help="Number of most frequent prompts.")
+@click.option("--max-age", type=click.FloatRange(min=0, min_open=True), default=L2_CACHE_TTL_SECONDS, show_default=True, help="Only count requests from the last this many seconds.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), default=CACHE_SNAPSHOT_PATH or None, required=not CACHE_SNAPSHOT_PATH, help="Snapshot file (default: CACHE_SNAPSHOT_PATH).")
+def warm_cache_command(top, max_age, output):
+    """
+    Adds the stored answers to the most frequent recent prompts to the cache snapshot that workers load at startup.
+
+    Run it after the old workers have stopped (they save the snapshot on shutdown) and before
+    the new ones start. Entries already in the snapshot are kept; the popular prompts become
+    the most recently used, so they are the last to be evicted.
+    """
+    async def run():
+        try:
+            return await openai_service.popular_responses(top, max_age)
+        finally:
+            await get_engine().dispose()
+
+    entries = asyncio.run(run())
+    cache = LRUCache(max_entries=CACHE_MAX_SIZE, ttl_seconds=None, max_bytes=CACHE_MAX_BYTES)
+    load_snapshot(cache, output)
+    cache.restore(entries)
+    written = save_snapshot(cache, output)
+    click.echo(f"Added {len(entries)} popular prompts; the snapshot holds {written} entries", err=True)
+
+if __name__ == "__main__":
+    cli()
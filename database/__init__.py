@@ -0,0 +1,7 @@
+from .database import AsyncSessionLocal, Base, SQLALCHEMY_DATABASE_URL, build_engine, configure_engine, get_db, get_engine, init_db, to_async_url
+
+def __getattr__(name: str):
+    # `from database import engine` creates the shared engine on first access (see `get_engine`)
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
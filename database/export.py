@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import models
+from database.response_store import resolve_response
+
+# Supported export formats
+EXPORT_FORMATS = ("ndjson", "csv")
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_SIZE = 1000
+
+# Exported columns, in table order (deduplicated bodies are exported inline as `response`)
+EXPORT_COLUMNS = tuple(column.name for column in models.Request.__table__.columns if column.name != "response_hash")
+_RESPONSE_INDEX = EXPORT_COLUMNS.index("response")
+
+def export_query(since_id: Optional[int] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Builds the query for an export, in id order so an export can be resumed from its last id.
+
+    Args:
+        since_id (Optional[int]): Only export rows with a larger id.
+        since (Optional[datetime]): Only export rows created at or after this (naive UTC) time.
+        until (Optional[datetime]): Only export rows created before this (naive UTC) time.
+    """
+    table = models.Request.__table__
+    bodies = models.ResponseBody.__table__
+    query = (
+        select(*(table.c[name] for name in EXPORT_COLUMNS), bodies.c.codec, bodies.c.data)
+        .outerjoin(bodies, bodies.c.hash == table.c.response_hash)
+        .order_by(table.c.id)
+    )
+    if since_id is not None:
+        query = query.where(table.c.id > since_id)
+    if since is not None:
+        query = query.where(table.c.created_at >= since)
+    if until is not None:
+        query = query.where(table.c.created_at < until)
+    return query
+
+async def iter_row_chunks(engine: AsyncEngine, query, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[Sequence]:
+    """
+    Yields the rows of `query` in lists of at most `chunk_size`, without loading the whole result.
+
+    Rows are plain tuples (no ORM objects or identity map), fetched through a
+    server-side cursor on PostgreSQL and with `fetchmany` on SQLite.
+    """
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+
+def _resolve_rows(rows: Iterable[Sequence]) -> list:
+    # Replace each row's inline response with its decompressed body where it has one, and drop the body columns
+    resolved = []
+    for row in rows:
+        values = list(row[:-2])
+        values[_RESPONSE_INDEX] = resolve_response(values[_RESPONSE_INDEX], row[-2], row[-1])
+        resolved.append(values)
+    return resolved
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def ndjson_chunk(rows: Iterable[Sequence]) -> bytes:
+    """
+    Serializes rows as newline-delimited JSON objects.
+    """
+    lines = (json.dumps(dict(zip(EXPORT_COLUMNS, map(_json_value, row))), ensure_ascii=False) for row in rows)
+    return "".join(line + "\n" for line in lines).encode()
+
+class CsvSerializer:
+    """
+    Serializes chunks of rows as CSV, with the header before the first chunk.
+    """
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow(EXPORT_COLUMNS)
+
+    def __call__(self, rows: Iterable[Sequence]) -> bytes:
+        self._writer.writerows([_json_value(value) for value in row] for row in rows)
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+async def export_stream(
+    engine: AsyncEngine,
+    format: str = "ndjson",
+    since_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    compress: bool = False,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    on_rows: Optional[Callable[[Sequence], None]] = None,
+    until: Optional[datetime] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Streams the `requests` table as NDJSON or CSV, optionally gzipped.
+
+    At most one chunk of rows is held in memory at a time, whatever the size of the table.
+
+    Args:
+        engine (AsyncEngine): The database to export from.
+        format (str): `ndjson` or `csv`.
+        since_id (Optional[int]): Only export rows with a larger id (incremental exports).
+        since (Optional[datetime]): Only export rows created at or after this time.
+        compress (bool): Gzip the output on the fly.
+        chunk_size (int): Rows fetched and serialized at a time.
+        on_rows (Optional[Callable]): Called with each chunk of rows, e.g. to report progress.
+        until (Optional[datetime]): Only export rows created before this time.
+
+    Yields:
+        bytes: Consecutive pieces of the export file.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {format}")
+    serialize = ndjson_chunk if format == "ndjson" else CsvSerializer()
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None  # gzip container
+
+    # 1. Emit the CSV header even when no rows match
+    if format == "csv":
+        header = serialize(())
+        yield compressor.compress(header) if compressor else header
+
+    # 2. Serialize (and compress) one chunk of rows at a time
+    async for rows in iter_row_chunks(engine, export_query(since_id, since, until), chunk_size):
+        if on_rows is not None:
+            on_rows(rows)
+        data = serialize(_resolve_rows(rows))
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    # 3. Flush the gzip trailer
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,92 @@
+import re
+
+import sqlalchemy.dialects.postgresql  # noqa: F401  (registers the typed to_tsvector / websearch_to_tsquery functions)
+
+from sqlalchemy import func, literal_column, or_, select, text as sql_text
+from sqlalchemy.sql.elements import ColumnElement
+
+# Text-search configuration used by the PostgreSQL index and queries (they must match for the index to be used)
+FTS_CONFIG = literal_column("'english'::regconfig")
+
+# SQLite: an external-content FTS5 table over requests(text, response), kept in sync by triggers
+_SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(text, response, content='requests', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS requests_fts_ai AFTER INSERT ON requests BEGIN
+        INSERT INTO requests_fts(rowid, text, response) VALUES (new.id, new.text, new.response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS requests_fts_ad AFTER DELETE ON requests BEGIN
+        INSERT INTO requests_fts(requests_fts, rowid, text, response) VALUES ('delete', old.id, old.text, old.response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS requests_fts_au AFTER UPDATE ON requests BEGIN
+        INSERT INTO requests_fts(requests_fts, rowid, text, response) VALUES ('delete', old.id, old.text, old.response);
+        INSERT INTO requests_fts(rowid, text, response) VALUES (new.id, new.text, new.response);
+    END""",
+)
+
+def search_vector(text_column, response_column) -> ColumnElement:
+    """
+    Builds the PostgreSQL `tsvector` expression over a request's text and response.
+
+    Used both by the GIN index on `models.Request` and by `match_condition`, so the
+    planner can answer searches from the index.
+    """
+    # Literals rather than bound parameters, so query and index expressions are identical
+    empty, space = literal_column("''"), literal_column("' '")
+    document = func.coalesce(text_column, empty).concat(space).concat(func.coalesce(response_column, empty))
+    return func.to_tsvector(FTS_CONFIG, document)
+
+def fts5_query(query: str) -> str:
+    """
+    Turns free text into a safe FTS5 query: every word must match, as a literal term.
+
+    Quoting each word keeps FTS5 operators and stray quotes in user input from causing syntax errors.
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join('"' + word + '"' for word in words)
+
+def match_condition(dialect_name: str, query: str) -> ColumnElement:
+    """
+    Builds the WHERE condition matching requests whose text or response contains every word of `query`.
+
+    Args:
+        dialect_name (str): The database dialect (`postgresql`, `sqlite`, ...).
+        query (str): Free-text search input.
+
+    Returns:
+        ColumnElement: A condition on `models.Request`.
+    """
+    import models
+
+    if dialect_name == "postgresql":
+        return search_vector(models.Request.text, models.Request.response).op("@@")(
+            func.websearch_to_tsquery(FTS_CONFIG, query)
+        )
+    if dialect_name == "sqlite":
+        matching = select(literal_column("rowid")).select_from(sql_text("requests_fts")).where(
+            sql_text("requests_fts MATCH :fts_query").bindparams(fts_query=fts5_query(query))
+        )
+        return models.Request.id.in_(matching)
+    # Other databases: unindexed substring match
+    pattern = f"%{query}%"
+    return or_(models.Request.text.ilike(pattern), models.Request.response.ilike(pattern))
+
+def create_search_index(sync_conn) -> None:
+    """
+    Creates the SQLite FTS5 table and its triggers if they are missing, indexing any existing rows.
+
+    PostgreSQL needs nothing here: its GIN index is declared on `models.Request`.
+
+    Args:
+        sync_conn (Connection): A synchronous connection, as passed by `AsyncConnection.run_sync`.
+    """
+    if sync_conn.dialect.name != "sqlite":
+        return
+    # The triggers disappear whenever `requests` is dropped, so their absence means the index is stale
+    has_triggers = sync_conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'requests_fts_ai'"
+    ).scalar()
+    if has_triggers:
+        return
+    for statement in _SQLITE_FTS_DDL:
+        sync_conn.exec_driver_sql(statement)
+    sync_conn.exec_driver_sql("INSERT INTO requests_fts(requests_fts) VALUES ('rebuild')")
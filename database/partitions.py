@@ -0,0 +1,241 @@
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, Table, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateTable
+
+# Range partitioning of `requests` by `created_at` (PostgreSQL only)
+REQUESTS_PARTITION_INTERVAL = os.getenv("REQUESTS_PARTITION_INTERVAL", "").lower()  # "day", "month", or empty for a plain table
+REQUESTS_PARTITIONS_AHEAD = int(os.getenv("REQUESTS_PARTITIONS_AHEAD", "3"))  # Future partitions kept ready
+
+PARTITION_INTERVALS = ("day", "month")
+LEGACY_PARTITION = "requests_legacy"
+
+_PARTITION_NAME = re.compile(r"^requests_p(\d{8}|\d{6})$")
+
+logger = logging.getLogger(__name__)
+
+def partition_start(day: date, interval: str) -> date:
+    """
+    Returns the first day of the partition period containing `day`.
+    """
+    if interval == "month":
+        return day.replace(day=1)
+    if interval == "day":
+        return day
+    raise ValueError(f"Unsupported partition interval: {interval}")
+
+def next_partition_start(start: date, interval: str) -> date:
+    """
+    Returns the first day of the period after the one starting on `start`.
+    """
+    if interval == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def partition_name(start: date, interval: str) -> str:
+    """
+    Names the partition of a period, e.g. `requests_p202401` (month) or `requests_p20240131` (day).
+    """
+    return "requests_p" + start.strftime("%Y%m" if interval == "month" else "%Y%m%d")
+
+def parse_partition_name(name: str) -> Optional[Tuple[date, date]]:
+    """
+    Returns the `[start, end)` dates of a partition named by `partition_name`, or None for other tables.
+    """
+    match = _PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    digits = match.group(1)
+    if len(digits) == 6:
+        start = datetime.strptime(digits, "%Y%m").date()
+        return start, next_partition_start(start, "month")
+    start = datetime.strptime(digits, "%Y%m%d").date()
+    return start, next_partition_start(start, "day")
+
+def upcoming_partitions(today: date, interval: str, ahead: int) -> List[Tuple[str, date, date]]:
+    """
+    Lists the partitions that should exist now: the current period and `ahead` future ones.
+
+    Returns:
+        List[Tuple[str, date, date]]: Name, first day and (exclusive) end of each partition.
+    """
+    partitions = []
+    start = partition_start(today, interval)
+    for _ in range(ahead + 1):
+        end = next_partition_start(start, interval)
+        partitions.append((partition_name(start, interval), start, end))
+        start = end
+    return partitions
+
+def _partitioned_table(metadata: MetaData) -> Table:
+    # A copy of `requests` whose primary key includes the partition key, as PostgreSQL requires
+    import models
+
+    source = models.Request.__table__
+    columns = []
+    for column in source.columns:
+        column = column._copy()
+        if column.name == "id":
+            column.autoincrement = True
+        if column.name == "created_at":
+            column.primary_key = True
+            column.nullable = False
+        columns.append(column)
+    return Table(source.name, metadata, *columns, PrimaryKeyConstraint("id", "created_at", name="requests_pkey"), postgresql_partition_by="RANGE (created_at)")
+
+def partitioned_table_ddl(dialect) -> List[str]:
+    """
+    Returns the statements creating `requests` as a table partitioned by `created_at` ranges.
+
+    Unique indexes on a partitioned table must include the partition key, so the
+    `request_key` index also covers `created_at` (lookups by key still use it). The
+    remaining model indexes are created by `init_db` as usual.
+    """
+    import models
+
+    table = _partitioned_table(MetaData())
+    request_key_index = next(index for index in models.Request.__table__.indexes if index.name == "ix_requests_request_key")
+    statements = [str(CreateTable(table).compile(dialect=dialect))]
+    statements.append(
+        f"CREATE UNIQUE INDEX {request_key_index.name} ON {table.name} (request_key, created_at)"
+    )
+    return statements
+
+def is_partitioned(sync_conn) -> bool:
+    """
+    Tells whether `requests` exists as a partitioned PostgreSQL table.
+    """
+    if sync_conn.dialect.name != "postgresql":
+        return False
+    return bool(sync_conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('requests')"
+    )).scalar())
+
+def list_partitions(sync_conn) -> List[str]:
+    """
+    Returns the names of the partitions currently attached to `requests`.
+    """
+    return list(sync_conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass('requests') ORDER BY child.relname"
+    )).scalars())
+
+def create_partitions(sync_conn, today: date, interval: str = REQUESTS_PARTITION_INTERVAL, ahead: int = REQUESTS_PARTITIONS_AHEAD) -> List[str]:
+    """
+    Creates the current and upcoming partitions that do not exist yet.
+
+    Periods already covered by another partition (the legacy partition of a converted
+    table) are skipped.
+
+    Returns:
+        List[str]: The names of the partitions created.
+    """
+    existing = set(list_partitions(sync_conn))
+    created = []
+    for name, start, end in upcoming_partitions(today, interval, ahead):
+        if name in existing:
+            continue
+        try:
+            with sync_conn.begin_nested():
+                sync_conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF requests FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+        except DBAPIError as e:
+            logger.info("Skipped partition %s: %s", name, e.orig)
+            continue
+        created.append(name)
+    return created
+
+def prepare_partitioned_table(sync_conn) -> None:
+    """
+    Creates `requests` as a partitioned table on a new PostgreSQL database when partitioning is enabled.
+
+    Runs before `create_all`, which then leaves the existing table alone. An existing
+    plain table is kept as it is; `python cli.py partition-requests` converts it.
+
+    Args:
+        sync_conn (Connection): A synchronous connection, as passed by `AsyncConnection.run_sync`.
+    """
+    if sync_conn.dialect.name != "postgresql" or not REQUESTS_PARTITION_INTERVAL:
+        return
+    if sync_conn.execute(text("SELECT to_regclass('requests')")).scalar() is not None:
+        if not is_partitioned(sync_conn):
+            logger.warning("REQUESTS_PARTITION_INTERVAL is set but `requests` is a plain table; run `python cli.py partition-requests` to convert it")
+        return
+    for statement in partitioned_table_ddl(sync_conn.dialect):
+        sync_conn.execute(text(statement))
+    create_partitions(sync_conn, datetime.utcnow().date())
+
+def conversion_statements(first_start: date, dialect) -> Tuple[List[str], List[str]]:
+    """
+    Returns the statements turning a plain `requests` table into a partitioned one.
+
+    The old table becomes the `requests_legacy` partition for everything before
+    `first_start`, which must lie in the future so rows written during the conversion
+    still satisfy the legacy range. No step holds a long exclusive lock on the data: the range and
+    NOT NULL checks are validated without blocking writes, and the indexes the
+    partitioned table needs are built concurrently beforehand, so the final ATTACH
+    only has to link them.
+
+    Returns:
+        Tuple[List[str], List[str]]: Statements to run one by one in autocommit mode
+        (CREATE INDEX CONCURRENTLY cannot run in a transaction), then the statements of
+        the short swap transaction.
+    """
+    import models
+
+    legacy_indexes = [index.name for index in models.Request.__table__.indexes]
+    bound = first_start.isoformat()
+    return [
+        # 1. Rows stored without a timestamp are routed to the legacy partition
+        "UPDATE requests SET created_at = '1970-01-01' WHERE created_at IS NULL",
+        f"ALTER TABLE requests ADD CONSTRAINT requests_legacy_range CHECK (created_at IS NOT NULL AND created_at < '{bound}') NOT VALID",
+        "ALTER TABLE requests VALIDATE CONSTRAINT requests_legacy_range",
+        "ALTER TABLE requests ALTER COLUMN created_at SET NOT NULL",
+        # 2. Build the indexes the partitioned parent requires
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS requests_legacy_pkey_new ON requests (id, created_at)",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS requests_legacy_request_key ON requests (request_key, created_at)",
+    ], [
+        # 3. Swap in the partitioned table
+        "ALTER TABLE requests DROP CONSTRAINT requests_pkey",
+        "ALTER TABLE requests ADD CONSTRAINT requests_legacy_pkey PRIMARY KEY USING INDEX requests_legacy_pkey_new",
+        *(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_legacy" for name in legacy_indexes),
+        f"ALTER TABLE requests RENAME TO {LEGACY_PARTITION}",
+        *partitioned_table_ddl(dialect),
+        f"ALTER TABLE requests ATTACH PARTITION {LEGACY_PARTITION} FOR VALUES FROM (MINVALUE) TO ('{bound}')",
+        "SELECT setval(pg_get_serial_sequence('requests', 'id'), (SELECT coalesce(max(id), 0) + 1 FROM requests_legacy), false)",
+    ]
+
+async def convert_to_partitioned(engine, interval: str = REQUESTS_PARTITION_INTERVAL) -> List[str]:
+    """
+    Converts an existing plain `requests` table into a partitioned one (see `conversion_statements`).
+
+    Returns:
+        List[str]: The statements that were run.
+    """
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("Partitioning is only supported on PostgreSQL")
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError("Set REQUESTS_PARTITION_INTERVAL to `day` or `month`")
+    async with engine.connect() as conn:
+        if await conn.run_sync(is_partitioned):
+            return []
+    today = datetime.utcnow().date()
+    # The legacy partition ends with the period after the current one (at least an hour away)
+    first_start = next_partition_start(partition_start((datetime.utcnow() + timedelta(hours=1)).date(), interval), interval)
+    online, swap = conversion_statements(first_start, engine.dialect)
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for statement in online:
+            await conn.execute(text(statement))
+    async with engine.begin() as conn:
+        for statement in swap:
+            await conn.execute(text(statement))
+        await conn.run_sync(create_partitions, today, interval)
+    return online + swap
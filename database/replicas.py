@@ -0,0 +1,212 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from database.database import AsyncSessionLocal, build_engine, get_engine
+from settings import DATABASE_REPLICA_URLS, parse_replica_urls
+
+# Read replicas for the read-only endpoints
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))  # Replicas further behind are skipped
+DB_REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("DB_REPLICA_CHECK_INTERVAL_SECONDS", "5"))  # Time between lag measurements
+
+# Replay delay of a PostgreSQL standby; 0 when it has replayed everything it received (an idle primary writes no WAL)
+_POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+logger = logging.getLogger(__name__)
+
+class _Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.engine: Optional[AsyncEngine] = None
+        self.sessions: Optional[async_sessionmaker] = None
+        self.lag: Optional[float] = None  # Unknown until measured, and after a failed measurement
+        self.checked_at: Optional[float] = None
+        self.check: Optional[asyncio.Task] = None
+        self.reads = 0
+        self.failed_checks = 0
+
+    def connect(self) -> AsyncEngine:
+        if self.engine is None:
+            self.engine = build_engine(self.url)
+            self.sessions = async_sessionmaker(bind=self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        return self.engine
+
+class ReadRouter:
+    """
+    Sends read-only queries to read replicas that are caught up, and to the primary otherwise.
+
+    Each replica's replication lag is measured in the background at most every
+    `check_interval` seconds, so routing a read never waits for a measurement. Replicas
+    whose lag is unknown (not measured yet, or unreachable) or above `max_lag` are
+    skipped; reads are spread round-robin over the others. Without usable replicas,
+    reads go to the primary.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str] = (),
+        max_lag: float = DB_REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = DB_REPLICA_CHECK_INTERVAL_SECONDS,
+    ):
+        """
+        Initializes the router; replica engines are created on first use.
+
+        Args:
+            urls (Sequence[str]): Database URLs of the read replicas.
+            max_lag (float): Largest acceptable replication lag in seconds.
+            check_interval (float): Seconds between lag measurements of a replica.
+        """
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.replicas: List[_Replica] = []
+        self._turn = itertools.count()
+        self.primary_reads = 0
+        self.fallbacks = 0
+        self.primary_retries = 0
+        self.configure(urls)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def configure(self, urls: Sequence[str]) -> None:
+        """
+        Sets the replicas to route to, keeping the current ones if the URLs are unchanged.
+
+        Engines of replaced replicas are not disposed; call `close()` first when reconfiguring a running app.
+        """
+        if [replica.url for replica in self.replicas] != list(urls):
+            self.replicas = [_Replica(f"replica{index}", url) for index, url in enumerate(urls)]
+
+    async def refresh(self) -> None:
+        """
+        Measures the lag of every replica now, e.g. at startup so the first reads can use them.
+        """
+        await asyncio.gather(*(self._measure(replica) for replica in self.replicas))
+
+    async def _measure(self, replica: _Replica) -> None:
+        try:
+            engine = replica.connect()
+            async with engine.connect() as conn:
+                lag = (await conn.execute(_POSTGRES_LAG)).scalar() if engine.dialect.name == "postgresql" else 0
+            replica.lag = None if lag is None else float(lag)
+        except Exception as e:
+            replica.lag = None
+            replica.failed_checks += 1
+            logger.warning("Lag check of %s failed: %s", replica.name, e)
+        finally:
+            replica.checked_at = time.monotonic()
+
+    def _schedule_checks(self) -> None:
+        now = time.monotonic()
+        for replica in self.replicas:
+            due = replica.checked_at is None or now - replica.checked_at >= self.check_interval
+            if due and (replica.check is None or replica.check.done()):
+                replica.check = asyncio.create_task(self._measure(replica))
+
+    def _choose(self) -> Optional[_Replica]:
+        if not self.replicas:
+            return None
+        self._schedule_checks()
+        usable = [replica for replica in self.replicas if replica.lag is not None and replica.lag <= self.max_lag]
+        if not usable:
+            self.fallbacks += 1
+            return None
+        return usable[next(self._turn) % len(usable)]
+
+    def session(self) -> AsyncSession:
+        """
+        Opens a session for read-only queries, on a caught-up replica when there is one.
+        """
+        replica = self._choose()
+        if replica is None:
+            self.primary_reads += 1
+            get_engine()  # Binds AsyncSessionLocal
+            return AsyncSessionLocal()
+        replica.reads += 1
+        db = replica.sessions()
+        db.info["read_router"] = self  # Charged with the lookups `first_or_primary` repeats on the primary
+        return db
+
+    def engine(self) -> AsyncEngine:
+        """
+        Returns the engine to run a read-only statement on, a caught-up replica when there is one.
+        """
+        replica = self._choose()
+        if replica is None:
+            self.primary_reads += 1
+            return get_engine()
+        replica.reads += 1
+        return replica.engine
+
+    def engines(self) -> List[Tuple[str, AsyncEngine]]:
+        """
+        Lists the primary and every replica engine created so far, by name.
+        """
+        return [("primary", get_engine())] + [(replica.name, replica.engine) for replica in self.replicas if replica.engine is not None]
+
+    async def close(self) -> None:
+        """
+        Stops pending lag checks and closes the replica connections.
+        """
+        for replica in self.replicas:
+            if replica.check is not None:
+                replica.check.cancel()
+                replica.check = None
+            if replica.engine is not None:
+                await replica.engine.dispose()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns routing counters and the last measured lag of each replica.
+        """
+        return {
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+            "primary_retries": self.primary_retries,
+            "replicas": {
+                replica.name: {"lag_seconds": replica.lag, "reads": replica.reads, "failed_checks": replica.failed_checks}
+                for replica in self.replicas
+            },
+        }
+
+# Shared read router for this worker (routes everything to the primary unless DATABASE_REPLICA_URLS is set)
+replicas = ReadRouter(parse_replica_urls(DATABASE_REPLICA_URLS))
+
+def get_replicas(request: Request) -> ReadRouter:
+    """
+    Returns the read router of the app serving `request` (see `main.create_app`), or the shared one for other apps.
+    """
+    return getattr(request.app.state, "replicas", replicas)
+
+async def get_read_db(request: Request):
+    """
+    Provides a database session for read-only endpoints, on a caught-up replica when one is configured.
+    """
+    async with get_replicas(request).session() as db:
+        yield db
+
+async def first_or_primary(db: AsyncSession, query):
+    """
+    Returns the first row of `query`, asking the primary when a replica session finds nothing.
+
+    A row written moments ago may not have reached the replica yet, so a lookup that
+    just created it (read-your-writes) still finds it.
+    """
+    row = (await db.execute(query)).scalars().first()
+    if row is None and db.bind is not get_engine():
+        db.info.get("read_router", replicas).primary_retries += 1
+        async with AsyncSessionLocal() as primary:
+            row = (await primary.execute(query)).scalars().first()
+    return row
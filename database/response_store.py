@@ -0,0 +1,211 @@
+import hashlib
+import os
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, only needed for RESPONSE_COMPRESSION=zstd
+    zstandard = None
+
+# Response storage settings
+RESPONSE_STORAGE = os.getenv("RESPONSE_STORAGE", "inline").lower()  # "inline" (in requests.response) or "dedup" (in response_bodies)
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "zlib").lower()  # Codec for new bodies: zlib, zstd or none
+RESPONSE_COMPRESSION_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_LEVEL", "6"))  # zlib 1-9, zstd 1-22
+
+STORAGE_MODES = ("inline", "dedup")
+CODECS = ("none", "zlib", "zstd")
+
+def body_hash(text: str) -> str:
+    """
+    Returns the content address of a response body (hex SHA-256 of its UTF-8 text).
+    """
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def encode_body(text: str, codec: Optional[str] = None, level: Optional[int] = None) -> Tuple[str, bytes]:
+    """
+    Compresses a response body.
+
+    Bodies that do not get smaller (typically short answers) are kept uncompressed.
+
+    Args:
+        text (str): The response text.
+        codec (Optional[str]): `zlib`, `zstd` or `none` (default: RESPONSE_COMPRESSION).
+        level (Optional[int]): Compression level for the codec (default: RESPONSE_COMPRESSION_LEVEL).
+
+    Returns:
+        Tuple[str, bytes]: The codec actually used and the stored bytes.
+    """
+    codec = codec or RESPONSE_COMPRESSION
+    level = RESPONSE_COMPRESSION_LEVEL if level is None else level
+    raw = text.encode()
+    if codec == "zlib":
+        data = zlib.compress(raw, level)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("RESPONSE_COMPRESSION=zstd requires the zstandard package")
+        data = zstandard.ZstdCompressor(level=level).compress(raw)
+    elif codec == "none":
+        return "none", raw
+    else:
+        raise ValueError(f"Unsupported response codec: {codec}")
+    return (codec, data) if len(data) < len(raw) else ("none", raw)
+
+def decode_body(codec: str, data: bytes) -> str:
+    """
+    Decompresses a body stored by `encode_body`.
+    """
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Reading zstd-compressed responses requires the zstandard package")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec != "none":
+        raise ValueError(f"Unsupported response codec: {codec}")
+    return data.decode()
+
+def resolve_response(inline: Optional[str], codec: Optional[str], data: Optional[bytes]) -> Optional[str]:
+    """
+    Returns a request's response from its inline column or, when that is empty, its joined body.
+    """
+    if inline is not None or data is None:
+        return inline
+    return decode_body(codec, data)
+
+async def store_bodies(db: AsyncSession, bodies: Dict[str, str], codec: Optional[str] = None) -> int:
+    """
+    Inserts the response bodies not stored yet, within the session's transaction.
+
+    Bodies already present are neither compressed nor written again; concurrent writers
+    of the same body are resolved with `ON CONFLICT DO NOTHING`.
+
+    Args:
+        db (AsyncSession): The session writing the requests that reference the bodies.
+        bodies (Dict[str, str]): Response texts by `body_hash`.
+        codec (Optional[str]): Codec for new bodies (default: RESPONSE_COMPRESSION).
+
+    Returns:
+        int: The number of bodies that were new.
+    """
+    import models
+
+    if not bodies:
+        return 0
+    # 1. Skip bodies that are already stored
+    existing = await db.execute(select(models.ResponseBody.hash).where(models.ResponseBody.hash.in_(list(bodies))))
+    missing = set(bodies) - set(existing.scalars())
+    if not missing:
+        return 0
+
+    # 2. Compress and insert the rest
+    values = []
+    for digest in missing:
+        body_codec, data = encode_body(bodies[digest], codec)
+        values.append({"hash": digest, "codec": body_codec, "data": data, "size": len(bodies[digest].encode())})
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(models.ResponseBody).on_conflict_do_nothing(index_elements=["hash"])
+    elif dialect == "sqlite":
+        statement = sqlite.insert(models.ResponseBody).on_conflict_do_nothing(index_elements=["hash"])
+    else:
+        statement = models.ResponseBody.__table__.insert()
+    await db.execute(statement, values)
+    return len(missing)
+
+async def to_storage_rows(
+    db: AsyncSession,
+    rows: Iterable[Dict[str, Any]],
+    storage: Optional[str] = None,
+    codec: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Turns request rows (with a `response` key) into rows ready for `insert(models.Request)`.
+
+    In `dedup` mode each distinct response is stored once in `response_bodies` and the rows
+    only reference it by hash; in `inline` mode the text stays in `requests.response`.
+    The input rows are not modified, so they can be retried or served as they are.
+
+    Args:
+        db (AsyncSession): The session the rows will be inserted with.
+        rows (Iterable[Dict[str, Any]]): Rows as built by the routers.
+        storage (Optional[str]): `inline` or `dedup` (default: RESPONSE_STORAGE).
+        codec (Optional[str]): Codec for new bodies in `dedup` mode.
+
+    Returns:
+        List[Dict[str, Any]]: New rows keyed by `models.Request` attribute names.
+    """
+    storage = storage or RESPONSE_STORAGE
+    prepared = []
+    bodies = {}
+    for row in rows:
+        row = dict(row)
+        response = row.pop("response", None)
+        if storage == "dedup" and response is not None:
+            digest = body_hash(response)
+            bodies[digest] = response
+            row["response_hash"] = digest
+        else:
+            row["stored_response"] = response
+        prepared.append(row)
+    await store_bodies(db, bodies, codec)
+    return prepared
+
+async def migrate_responses(
+    engine: AsyncEngine,
+    to: str = "dedup",
+    batch_size: int = 1000,
+    codec: Optional[str] = None,
+) -> int:
+    """
+    Moves existing responses between inline and deduplicated storage, one batch per transaction.
+
+    The migration can be interrupted and run again: every batch selects only rows still
+    in the old layout. Bodies left unreferenced by a migration back to `inline` are kept.
+
+    Args:
+        engine (AsyncEngine): The database to migrate.
+        to (str): `dedup` to move inline responses into `response_bodies`, `inline` to move them back.
+        batch_size (int): Rows per transaction.
+        codec (Optional[str]): Codec for new bodies (default: RESPONSE_COMPRESSION).
+
+    Returns:
+        int: The number of rows migrated.
+    """
+    import models
+
+    if to not in STORAGE_MODES:
+        raise ValueError(f"Unsupported response storage: {to}")
+    requests = models.Request.__table__
+    bodies = models.ResponseBody.__table__
+    if to == "dedup":
+        pending = select(requests.c.id, requests.c.response).where(requests.c.response.isnot(None))
+    else:
+        pending = (
+            select(requests.c.id, bodies.c.codec, bodies.c.data)
+            .join(bodies, bodies.c.hash == requests.c.response_hash)
+            .where(requests.c.response.is_(None))
+        )
+    set_row = update(requests).where(requests.c.id == bindparam("row_id"))
+
+    migrated = 0
+    last_id = 0
+    while True:
+        async with AsyncSession(engine) as db:
+            rows = (await db.execute(pending.where(requests.c.id > last_id).order_by(requests.c.id).limit(batch_size))).all()
+            if not rows:
+                return migrated
+            if to == "dedup":
+                hashes = {row.id: body_hash(row.response) for row in rows}
+                await store_bodies(db, {hashes[row.id]: row.response for row in rows}, codec)
+                values = [{"row_id": row.id, "response": None, "response_hash": hashes[row.id]} for row in rows]
+            else:
+                values = [{"row_id": row.id, "response": decode_body(row.codec, row.data), "response_hash": None} for row in rows]
+            await db.execute(set_row, values)
+            await db.commit()
+        migrated += len(rows)
+        last_id = rows[-1].id
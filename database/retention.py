@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import models
+from database.database import get_engine
+from database.export import export_stream
+from database.partitions import (
+    REQUESTS_PARTITION_INTERVAL,
+    REQUESTS_PARTITIONS_AHEAD,
+    create_partitions,
+    is_partitioned,
+    list_partitions,
+    parse_partition_name,
+)
+
+# Background retention of old requests
+REQUESTS_RETENTION_DAYS = int(os.getenv("REQUESTS_RETENTION_DAYS", "0"))  # Age after which requests are removed; 0 keeps them forever
+REQUESTS_ARCHIVE_DIR = os.getenv("REQUESTS_ARCHIVE_DIR", "")  # Directory for gzipped NDJSON archives of removed requests; empty removes without archiving
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))  # Time between maintenance runs
+RETENTION_DELETE_BATCH_SIZE = int(os.getenv("RETENTION_DELETE_BATCH_SIZE", "5000"))  # Rows per DELETE transaction
+
+# Session-level advisory lock so only one worker runs maintenance at a time (PostgreSQL)
+_ADVISORY_LOCK_KEY = 7_270_001
+
+logger = logging.getLogger(__name__)
+
+class RetentionJob:
+    """
+    Keeps the `requests` table's partitions ahead of time and removes requests past their retention.
+
+    Each run:
+    1. On a partitioned PostgreSQL table, creates the current and upcoming partitions.
+    2. Archives every partition that lies entirely before the retention cutoff to a
+       gzipped NDJSON file, then detaches it with `DETACH PARTITION ... CONCURRENTLY`
+       (no lock blocking reads or writes of the other partitions) and drops it.
+    3. Archives and deletes any other rows older than the cutoff (unpartitioned tables,
+       SQLite, the legacy partition of a converted table) in short batched transactions.
+
+    Archives are written to a temporary file and renamed into place once complete, and
+    rows are only removed after their archive is on disk.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        retention_days: int = REQUESTS_RETENTION_DAYS,
+        archive_dir: str = REQUESTS_ARCHIVE_DIR,
+        interval: float = RETENTION_INTERVAL_SECONDS,
+        batch_size: int = RETENTION_DELETE_BATCH_SIZE,
+        partition_interval: str = REQUESTS_PARTITION_INTERVAL,
+        partitions_ahead: int = REQUESTS_PARTITIONS_AHEAD,
+    ):
+        """
+        Initializes an idle job; call `start()` from the application's startup hook.
+
+        Args:
+            engine (Optional[AsyncEngine]): The database holding `requests` (default: the shared engine, resolved on first use).
+            retention_days (int): Age in days after which requests are removed; 0 keeps them.
+            archive_dir (str): Where archives are written; empty removes rows without archiving.
+            interval (float): Seconds between runs.
+            batch_size (int): Rows per DELETE transaction.
+            partition_interval (str): `day` or `month` to maintain partitions, empty otherwise.
+            partitions_ahead (int): Future partitions to keep ready.
+        """
+        self._engine = engine
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.batch_size = batch_size
+        self.partition_interval = partition_interval
+        self.partitions_ahead = partitions_ahead
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.runs = 0
+        self.failed_runs = 0
+        self.partitions_created = 0
+        self.partitions_dropped = 0
+        self.rows_deleted = 0
+        self.archives_written = 0
+        self.last_run_at: Optional[datetime] = None
+
+    @property
+    def engine(self) -> AsyncEngine:
+        return self._engine if self._engine is not None else get_engine()
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0 or bool(self.partition_interval)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """
+        Starts the periodic runs on the running event loop (the first one immediately).
+        """
+        if not self.running:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the periodic runs, waiting for a run in progress to finish its current step.
+        """
+        if not self.running:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=30)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns maintenance counters.
+        """
+        return {
+            "enabled": self.running,
+            "runs": self.runs,
+            "failed_runs": self.failed_runs,
+            "partitions_created": self.partitions_created,
+            "partitions_dropped": self.partitions_dropped,
+            "rows_deleted": self.rows_deleted,
+            "archives_written": self.archives_written,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception:
+                self.failed_runs += 1
+                logger.exception("Retention run failed")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self, now: Optional[datetime] = None) -> None:
+        """
+        Runs one round of partition maintenance and retention.
+
+        Args:
+            now (Optional[datetime]): The current (naive UTC) time; defaults to `datetime.utcnow()`.
+        """
+        now = now or datetime.utcnow()
+        postgres = self.engine.dialect.name == "postgresql"
+        async with self.engine.connect() as lock_conn:
+            # 1. Let a single worker run maintenance at a time
+            if postgres and not (await lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})).scalar():
+                return
+            try:
+                partitioned = await lock_conn.run_sync(is_partitioned)
+                await lock_conn.commit()
+
+                # 2. Keep partitions ready ahead of time
+                if partitioned and self.partition_interval:
+                    async with self.engine.begin() as conn:
+                        created = await conn.run_sync(create_partitions, now.date(), self.partition_interval, self.partitions_ahead)
+                    self.partitions_created += len(created)
+
+                # 3. Remove what is past its retention
+                if self.retention_days > 0:
+                    cutoff = now - timedelta(days=self.retention_days)
+                    if partitioned:
+                        await self._drop_expired_partitions(cutoff.date())
+                    await self._delete_expired_rows(cutoff)
+            finally:
+                if postgres:
+                    await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+                    await lock_conn.commit()
+        self.runs += 1
+        self.last_run_at = now
+
+    async def _drop_expired_partitions(self, cutoff: date) -> None:
+        async with self.engine.connect() as conn:
+            names = await conn.run_sync(list_partitions)
+        for name in names:
+            bounds = parse_partition_name(name)
+            if bounds is None or bounds[1] > cutoff:
+                continue
+            start, end = bounds
+            await self._archive(name, since=datetime.combine(start, datetime.min.time()), until=datetime.combine(end, datetime.min.time()))
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text(f"ALTER TABLE requests DETACH PARTITION {name} CONCURRENTLY"))
+                await conn.execute(text(f"DROP TABLE {name}"))
+            self.partitions_dropped += 1
+            logger.info("Dropped expired partition %s", name)
+
+    async def _delete_expired_rows(self, cutoff: datetime) -> None:
+        table = models.Request.__table__
+        conditions = [table.c.created_at < cutoff]
+        # Only delete what made it into the archive, should rows arrive meanwhile
+        last_archived_id = await self._archive(f"requests_before_{cutoff:%Y%m%dT%H%M%S}", until=cutoff)
+        if self.archive_dir:
+            if last_archived_id is None:
+                return
+            conditions.append(table.c.id <= last_archived_id)
+        expired = select(table.c.id).where(*conditions).order_by(table.c.id).limit(self.batch_size)
+        while True:
+            async with self.engine.begin() as conn:
+                deleted = (await conn.execute(delete(table).where(table.c.id.in_(expired)))).rowcount
+            self.rows_deleted += deleted
+            if deleted < self.batch_size:
+                return
+            await asyncio.sleep(0)  # Let other work run between batches
+
+    async def _archive(self, name: str, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Optional[int]:
+        """
+        Writes the requests created in `[since, until)` to `<archive_dir>/<name>.ndjson.gz`.
+
+        Returns:
+            Optional[int]: The last archived id, or None if no row matched or archiving is off.
+        """
+        if not self.archive_dir:
+            return None
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.ndjson.gz")
+        archived = {"last_id": None}
+
+        def track(rows):
+            archived["last_id"] = rows[-1][0]
+
+        with open(path + ".tmp", "wb") as f:
+            async for data in export_stream(self.engine, "ndjson", since=since, until=until, compress=True, on_rows=track):
+                await asyncio.to_thread(f.write, data)
+            await asyncio.to_thread(f.flush)
+            await asyncio.to_thread(os.fsync, f.fileno())
+        if archived["last_id"] is None:
+            os.remove(path + ".tmp")
+            return None
+        os.replace(path + ".tmp", path)
+        self.archives_written += 1
+        return archived["last_id"]
+
+# Shared retention job for this worker (started only when retention or partitioning is configured)
+retention = RetentionJob()
+
+
+def get_retention(request: Request) -> RetentionJob:
+    """
+    Returns the retention job of the app serving `request` (see `main.create_app`), or the shared one for other apps.
+    """
+    return getattr(request.app.state, "retention", retention)
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+import models
+from database.database import AsyncSessionLocal
+from database.response_store import to_storage_rows
+
+# Opt-in write-behind persistence for POST /requests (WRITE_BEHIND_ENABLED, see settings.py)
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))  # Rows buffered before backpressure
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))  # Rows per multi-row INSERT
+WRITE_BEHIND_FLUSH_INTERVAL_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_SECONDS", "0.05"))  # Max time a row waits
+WRITE_BEHIND_ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT_SECONDS", "1"))  # Wait for space when full
+WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS", "30"))  # Max shutdown flush time
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindFull(Exception):
+    """
+    Raised when a row cannot be queued because the write-behind queue stayed full.
+    """
+
+class WriteBehindClosed(Exception):
+    """
+    Raised when a row is submitted while the queue is not running or is draining.
+    """
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Tells whether a failed flush may succeed if the same batch is tried again later.
+
+    Connection problems and lock timeouts are transient; constraint violations and bad data are not.
+    """
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+class WriteBehindQueue:
+    """
+    Buffers `requests` rows in memory and persists them in batches from a background task.
+
+    Rows are flushed with one multi-row INSERT per batch once `batch_size` rows are waiting
+    or the oldest row has waited `flush_interval` seconds. Rows that are queued but not yet
+    committed stay visible through `get_pending`, so a client can read its own write.
+    Flushes that fail for transient reasons are retried with the same batch; while that
+    happens the queue fills up and `submit` pushes back on callers. Other failures split the
+    batch so that only the offending rows are dropped (and counted).
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        max_queue: int = WRITE_BEHIND_MAX_QUEUE,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL_SECONDS,
+        enqueue_timeout: float = WRITE_BEHIND_ENQUEUE_TIMEOUT_SECONDS,
+        retry_delay: float = 1.0,
+    ):
+        """
+        Initializes an idle queue; call `start()` from the application's startup hook.
+
+        Args:
+            session_factory (Callable): Factory returning an `AsyncSession` context manager.
+            max_queue (int): Maximum number of rows waiting to be flushed.
+            batch_size (int): Maximum number of rows per INSERT.
+            flush_interval (float): Maximum seconds a row waits before its batch is flushed.
+            enqueue_timeout (float): Seconds `submit` waits for space before giving up.
+            retry_delay (float): Seconds to wait before retrying a failed flush.
+        """
+        self._session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._closing = False
+        self.flushed_rows = 0
+        self.flushed_batches = 0
+        self.failed_flushes = 0
+        self.rejected_rows = 0
+        self.dropped_rows = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def accepting(self) -> bool:
+        """
+        True while `submit` accepts rows (running and not draining).
+        """
+        return self.running and not self._closing
+
+    def start(self) -> None:
+        """
+        Starts the background flush task on the running event loop.
+        """
+        if not self.running:
+            self._closing = False
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, row: Dict[str, Any]) -> None:
+        """
+        Queues a row for insertion.
+
+        Args:
+            row (Dict[str, Any]): Column values for `models.Request`, including `request_key`.
+
+        Raises:
+            WriteBehindFull: If the queue stays full for `enqueue_timeout` seconds.
+            WriteBehindClosed: If the queue is not running or is draining; the caller must write the row itself.
+        """
+        if not self.accepting:
+            raise WriteBehindClosed("Write-behind queue is not accepting rows")
+        self._pending[row["request_key"]] = row
+        try:
+            await asyncio.wait_for(self._queue.put(row), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            del self._pending[row["request_key"]]
+            self.rejected_rows += 1
+            raise WriteBehindFull("Write-behind queue is full")
+
+    def get_pending(self, request_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a queued row that has not been committed yet, if any.
+        """
+        return self._pending.get(request_key)
+
+    async def drain(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS) -> None:
+        """
+        Stops accepting rows, flushes every queued row and stops the background task.
+
+        Called from the application's shutdown hook. If the rows cannot be committed within
+        `timeout` seconds (e.g. the database is down), the task is cancelled and the number
+        of rows lost is logged.
+
+        Args:
+            timeout (float): Maximum seconds for the whole drain.
+        """
+        if not self.running:
+            return
+        self._closing = True
+        try:
+            # Wake an idle flusher; if the queue is full it is busy and checks `_closing` after each flush
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.error("Write-behind drain timed out; %d rows were not persisted", len(self._pending))
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns queue depth and flush counters.
+        """
+        return {
+            "enabled": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "pending": len(self._pending),
+            "flushed_rows": self.flushed_rows,
+            "flushed_batches": self.flushed_batches,
+            "failed_flushes": self.failed_flushes,
+            "rejected_rows": self.rejected_rows,
+            "dropped_rows": self.dropped_rows,
+        }
+
+    async def _run(self) -> None:
+        while not (self._closing and self._queue.empty()):
+            first = await self._queue.get()
+            if first is None:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    row = self._queue.get_nowait() if remaining <= 0 or self._closing else await asyncio.wait_for(self._queue.get(), remaining)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if row is not None:
+                    batch.append(row)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        while True:
+            try:
+                async with self._session_factory() as db:
+                    await db.execute(insert(models.Request), await to_storage_rows(db, batch))
+                    await db.commit()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_flushes += 1
+                if is_retryable(e):
+                    logger.warning("Write-behind flush of %d rows failed, retrying: %s", len(batch), e)
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+                if len(batch) > 1:
+                    # Bisect so the rows that can be written still are
+                    middle = len(batch) // 2
+                    await self._flush(batch[:middle])
+                    await self._flush(batch[middle:])
+                    return
+                self.dropped_rows += 1
+                self._pending.pop(batch[0]["request_key"], None)
+                logger.error("Write-behind dropped request %s: %s", batch[0]["request_key"], e)
+                return
+        for row in batch:
+            self._pending.pop(row["request_key"], None)
+        self.flushed_rows += len(batch)
+        self.flushed_batches += 1
+
+# Shared write-behind queue for this worker (started only when WRITE_BEHIND_ENABLED)
+write_behind = WriteBehindQueue(AsyncSessionLocal)
+
+
+def get_write_behind(request: Request) -> WriteBehindQueue:
+    """
+    Returns the write-behind queue of the app serving `request` (see `main.create_app`), or the shared one for other apps.
+    """
+    return getattr(request.app.state, "write_behind", write_behind)
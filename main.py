@@ -1,38 +1,119 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file before the settings are read
+
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
 
-from database import SessionLocal, engine
-import models
-import schemas
-from routers import requests
+from fastapi import FastAPI
+
+from database import AsyncSessionLocal, configure_engine, init_db, response_store
+from database.replicas import ReadRouter
+from database.retention import RetentionJob
+from database.write_behind import WriteBehindQueue
+from routers import metrics, requests
+from services.jobs import JobWorkers
 from services.openai_service import OpenAI
-from dotenv import load_dotenv
-import os
+from settings import Settings
+from utils.profiler import Profiler, ProfilingMiddleware
+
+logger = logging.getLogger(__name__)
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Builds the application.
+
+    Nothing is connected or created here: the database engine, the OpenAI client and the
+    background jobs are set up by the lifespan handler when the server starts, so
+    importing this module stays cheap and free of side effects.
+
+    Each app gets its own OpenAI service, job workers, write-behind queue, retention job
+    and read router, built from `settings` and kept on `app.state`, where the routers'
+    dependencies find them; the module-level instances are left alone. The database
+    engine and the in-memory caches remain shared by the process.
+
+    Args:
+        settings (Optional[Settings]): Application settings (default: read from the environment).
+
+    Returns:
+        FastAPI: The application.
+    """
+    settings = settings or Settings.from_env()
+    profiler = Profiler(settings.profile_sample_rate, settings.profile_slow_seconds)
+    openai_service = OpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
+    replicas = ReadRouter(settings.replica_urls)
+    write_behind = WriteBehindQueue(AsyncSessionLocal)
+    retention = RetentionJob()
+    jobs = JobWorkers(service=openai_service, workers=settings.job_workers)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # 1. Database engines and, unless applied separately, schema setup
+        engine = configure_engine(settings.database_url)
+        if settings.init_db:
+            await init_db()
+        await replicas.refresh()
+        if response_store.RESPONSE_STORAGE == "dedup":
+            # The search index is maintained by the database from `requests.response`, which is empty for deduplicated rows
+            logger.warning(
+                "RESPONSE_STORAGE=dedup: GET /requests/search only matches request texts, "
+                "responses stored in response_bodies are not indexed"
+            )
+
+        # 2. Open the pooled async OpenAI client for this worker
+        await openai_service.startup()
+
+        # 3. Warm the response cache before the first request: last run's snapshot, then the most frequent stored prompts
+        if settings.cache_snapshot_path:
+            openai_service.load_cache_snapshot(settings.cache_snapshot_path)
+        if settings.cache_warm_top > 0:
+            await openai_service.warm_cache(settings.cache_warm_top)
+
+        # 4. Start the background flusher for write-behind persistence, if enabled
+        if settings.write_behind_enabled:
+            write_behind.start()
+
+        # 5. Keep partitions ahead and remove requests past their retention, if configured
+        if retention.enabled:
+            retention.start()
+
+        # 6. Start the workers answering asynchronous requests, if configured
+        if settings.job_workers > 0:
+            jobs.start()
 
-load_dotenv()  # Load environment variables from .env file
+        yield
 
-# Database setup
-models.Base.metadata.create_all(bind=engine)
+        # Close database connections and clean up resources
+        profiler.stop()
+        await jobs.stop()  # Unfinished requests are claimed again by another worker once their lease expires
+        if settings.cache_snapshot_path:
+            openai_service.save_cache_snapshot(settings.cache_snapshot_path)
+        await retention.stop()
+        await write_behind.drain()  # Persist queued rows before the engine goes away
+        await openai_service.close()
+        await replicas.close()
+        await engine.dispose()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.profiler = profiler if profiler.enabled else None
+    app.state.openai_service = openai_service
+    app.state.replicas = replicas
+    app.state.write_behind = write_behind
+    app.state.retention = retention
+    app.state.jobs = jobs
 
-app = FastAPI()
+    # Record request latency and in-flight requests for GET /metrics
+    app.add_middleware(metrics.MetricsMiddleware)
 
-# Register API routers
-app.include_router(requests.router, prefix="/requests", tags=["requests"])
+    # Profile sampled and slow requests (see GET /debug/profile), only when configured
+    if profiler.enabled:
+        app.add_middleware(ProfilingMiddleware, profiler=profiler)
 
-@app.on_event("startup")
-async def startup_event():
-    # Initialize the OpenAI service with API key from .env
-    global openai_service
-    openai_service = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # Register API routers
+    app.include_router(requests.router, prefix="/requests", tags=["requests"])
+    app.include_router(metrics.router)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    # Close database connections and clean up resources
-    pass
\ No newline at end of file
+app = create_app()
@@ -0,0 +1,2 @@
+from database import Base
+from .models import Request, ResponseBody
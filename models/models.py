@@ -1,10 +1,72 @@
-from sqlalchemy import Column, Integer, String, DateTime
-from sqlalchemy.orm import relationship
+from functools import cached_property
+
+from sqlalchemy import Column, Integer, String, DateTime, Index, LargeBinary
+from sqlalchemy.orm import foreign, relationship, synonym
 from database import Base
+from database.fulltext import search_vector
+from database.response_store import decode_body
+
+class ResponseBody(Base):
+    __tablename__ = "response_bodies"
+    # Content address: SHA-256 of the uncompressed text (see database.response_store)
+    hash = Column(String(64), primary_key=True)
+    codec = Column(String(16), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer)  # Uncompressed size in bytes
+
+    # Decompressed once per loaded body; rows sharing an answer share the object within a session
+    @cached_property
+    def text(self) -> str:
+        return decode_body(self.codec, self.data)
 
 class Request(Base):
     __tablename__ = "requests"
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String)
-    response = Column(String)
-    created_at = Column(DateTime)
\ No newline at end of file
+    # Inline response text; NULL when the body is deduplicated into `response_bodies`
+    stored_response = Column("response", String)
+    created_at = Column(DateTime)
+    # Client-facing key assigned before the row is written (see database.write_behind)
+    request_key = Column(String(64), unique=True, index=True)
+    # SHA-256 of the prompt and completion parameters; lets stored answers serve as a cache
+    prompt_hash = Column(String(64))
+    model = Column(String)
+    # Deduplicated, compressed response body (RESPONSE_STORAGE=dedup)
+    response_hash = Column(String(64), index=True)
+    # Asynchronous requests (see services.jobs): NULL for requests answered synchronously
+    status = Column(String(16))  # pending, running, done or failed
+    error = Column(String)
+    hint = Column(String)  # Routing inputs kept for the worker that generates the response
+    max_tokens = Column(Integer)
+    attempts = Column(Integer)
+    claimed_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    body = relationship(ResponseBody, primaryjoin=lambda: foreign(Request.response_hash) == ResponseBody.hash, lazy="joined", viewonly=True)
+
+    def _get_response(self):
+        # Bodies are decompressed only when the response is read
+        if self.stored_response is None and self.body is not None:
+            return self.body.text
+        return self.stored_response
+
+    def _set_response(self, value):
+        self.stored_response = value
+
+    # The response text, wherever it is stored
+    response = synonym("stored_response", descriptor=property(_get_response, _set_response))
+
+    __table_args__ = (
+        Index("ix_requests_prompt_hash_created_at", "prompt_hash", "created_at"),
+        # Keyset pagination for GET /requests (newest first)
+        Index("ix_requests_created_at_id", "created_at", "id"),
+        # Claiming asynchronous requests; partial, so it only holds the unfinished ones
+        Index(
+            "ix_requests_unfinished",
+            "status",
+            "id",
+            postgresql_where=status.in_(("pending", "running")),
+            sqlite_where=status.in_(("pending", "running")),
+        ),
+        # Full-text search on PostgreSQL; SQLite uses an FTS5 table instead (see database.fulltext)
+        Index("ix_requests_search", search_vector(text, stored_response), postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
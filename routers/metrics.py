@@ -0,0 +1,207 @@
+import time
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from database.replicas import ReadRouter, get_replicas
+from database.write_behind import WriteBehindQueue, get_write_behind
+from services.jobs import JobWorkers, get_jobs
+from services.openai_service import OpenAI, get_openai_service
+from utils.admission import admission
+from utils.metrics import HTTP_REQUEST_DURATION_SECONDS, HTTP_REQUESTS_IN_FLIGHT, REGISTRY, Family
+
+router = APIRouter()
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    """
+    Serves this worker's metrics in the Prometheus text format.
+    """
+    families = [
+        *collect_service_stats(get_openai_service(request), get_write_behind(request), get_jobs(request)),
+        *collect_pool_stats(get_replicas(request)),
+    ]
+    return PlainTextResponse(REGISTRY.render(families), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/debug/profile", include_in_schema=False)
+async def get_profile(request: Request):
+    """
+    Returns the profiler's counters and the functions with the most self time in profiled requests.
+    """
+    profiler = getattr(request.app.state, "profiler", None)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled.")
+    return profiler.stats()
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request and the number in flight.
+
+    Requests are labelled with the matched route template (e.g. `/requests/{request_id}`),
+    not the raw path, so the number of series stays bounded. Written as plain ASGI rather
+    than `BaseHTTPMiddleware` to keep the per-request cost to a few attribute updates.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION_SECONDS.labels(
+                method=scope["method"], route=route.path if route is not None else "unmatched", status=status
+            ).observe(time.perf_counter() - started)
+
+def _family(name: str, type_name: str, documentation: str, value: float, **labels) -> Family:
+    return name, type_name, documentation, [("_total" if type_name == "counter" else "", labels, value)]
+
+def collect_service_stats(openai_service: OpenAI, write_behind: WriteBehindQueue, jobs: JobWorkers):
+    """
+    Exposes the counters kept by the cache, rate limiter, circuit breaker, model router, write-behind queue, job workers and admission control.
+
+    Evaluated only when `/metrics` is scraped.
+    """
+    stats = openai_service.stats()
+    cache, l2_cache, single_flight = stats["cache"], stats["l2_cache"], stats["single_flight"]
+    rate_limit, resilience = stats["rate_limit"], stats["resilience"]
+    yield _family("response_cache_hits", "counter", "In-memory response cache hits.", cache["hits"])
+    yield _family("response_cache_misses", "counter", "In-memory response cache misses.", cache["misses"])
+    yield _family("response_cache_evictions", "counter", "Entries evicted to stay within the cache limits.", cache["evictions"])
+    yield _family("response_cache_expirations", "counter", "Entries dropped after their TTL.", cache["expirations"])
+    yield _family("response_cache_entries", "gauge", "Entries in the in-memory response cache.", cache["entries"])
+    yield _family("response_cache_bytes", "gauge", "Estimated size of the in-memory response cache.", cache["bytes"])
+    yield _family("l2_cache_hits", "counter", "Prompts answered from stored requests.", l2_cache["hits"])
+    yield _family("l2_cache_misses", "counter", "Stored-request lookups that found nothing fresh.", l2_cache["misses"])
+    yield _family("l2_cache_errors", "counter", "Stored-request lookups that failed.", l2_cache["errors"])
+    near_duplicates = stats["near_duplicates"]
+    yield _family("near_duplicate_hits", "counter", "Cache misses answered with the cached answer to a similar prompt.", near_duplicates["hits"])
+    yield _family("near_duplicate_misses", "counter", "Near-duplicate lookups that found no similar cached prompt.", near_duplicates["misses"])
+    yield _family("near_duplicate_entries", "gauge", "Prompt fingerprints in the near-duplicate index.", near_duplicates.get("entries", 0))
+    yield _family("single_flight_executions", "counter", "Upstream resolutions started.", single_flight["executions"])
+    yield _family("single_flight_coalesced", "counter", "Calls that joined an identical call in flight.", single_flight["coalesced"])
+    yield _family("single_flight_in_flight", "gauge", "Distinct prompts being resolved.", single_flight["in_flight"])
+    yield _family("openai_rate_limit_queue_depth", "gauge", "Calls waiting for the outbound rate limiter.", rate_limit["queue_depth"])
+    yield _family("openai_rate_limit_delayed", "counter", "Calls that had to wait for the rate limiter.", rate_limit["delayed"])
+    yield _family("openai_rate_limit_timeouts", "counter", "Calls that gave up waiting for the rate limiter.", rate_limit["timeouts"])
+    yield _family("openai_rate_limit_backoffs", "counter", "Pauses after an upstream 429.", rate_limit["backoffs"])
+    yield _family("openai_retries", "counter", "Retried OpenAI calls.", resilience["retries"])
+    yield _family("openai_hedges", "counter", "Hedged second attempts started.", resilience["hedges"])
+    yield _family("openai_hedge_wins", "counter", "Hedged attempts that answered first.", resilience["hedge_wins"])
+    yield _family("openai_stale_served", "counter", "Stale stored answers served while upstream was unavailable.", resilience["stale_served"])
+    circuit = resilience["circuit"]["state"]
+    yield (
+        "openai_circuit_state",
+        "gauge",
+        "1 for the current state of the OpenAI circuit breaker.",
+        [("", {"state": state}, 1 if state == circuit else 0) for state in ("closed", "open", "half_open")],
+    )
+
+    routes = stats["routing"]
+    for name, type_name, documentation, key in (
+        ("model_route_requests", "counter", "Prompts routed, by the route they matched.", "requests"),
+        ("model_route_diverted", "counter", "Prompts sent to a fallback route because the matched route was over its latency budget.", "diverted"),
+        ("model_route_tokens", "counter", "Prompt and completion tokens used, by route.", None),
+        ("model_route_truncated", "counter", "Answers cut off by max_tokens, by route.", "truncated"),
+        ("model_route_cost", "counter", "Estimated spend, by route (from cost_per_1k_tokens).", "cost"),
+    ):
+        if key is None:
+            samples = [
+                ("_total", {"route": route, "model": info["model"], "kind": kind}, info[f"{kind}_tokens"])
+                for route, info in routes.items() for kind in ("prompt", "completion")
+            ]
+        else:
+            samples = [("_total", {"route": route, "model": info["model"]}, info[key]) for route, info in routes.items()]
+        yield name, type_name, documentation, samples
+    yield (
+        "model_route_latency_seconds",
+        "gauge",
+        "Smoothed upstream latency of each route (absent until a call completes).",
+        [("", {"route": route, "model": info["model"]}, info["latency_seconds"]) for route, info in routes.items() if info["latency_seconds"] is not None],
+    )
+    yield (
+        "model_route_max_tokens",
+        "gauge",
+        "Current max_tokens of each route (adapted when MODEL_ROUTER_ADAPTIVE_MAX_TOKENS is on).",
+        [("", {"route": route, "model": info["model"]}, info["max_tokens"]) for route, info in routes.items()],
+    )
+
+    queue = write_behind.stats()
+    yield _family("write_behind_queued", "gauge", "Rows waiting in the write-behind queue.", queue["queued"])
+    yield _family("write_behind_flushed_rows", "counter", "Rows inserted by the write-behind flusher.", queue["flushed_rows"])
+    yield _family("write_behind_failed_flushes", "counter", "Write-behind flushes that failed.", queue["failed_flushes"])
+    yield _family("write_behind_rejected_rows", "counter", "Rows refused because the queue was full.", queue["rejected_rows"])
+    yield _family("write_behind_dropped_rows", "counter", "Rows dropped because they could not be inserted.", queue["dropped_rows"])
+
+    workers = jobs.stats()
+    yield _family("jobs_busy_workers", "gauge", "Workers generating the response of an asynchronous request.", workers["busy"])
+    yield _family("jobs_claimed", "counter", "Asynchronous requests claimed by this worker process.", workers["claimed"])
+    yield _family("jobs_reclaimed", "counter", "Claims of requests whose previous worker did not finish them.", workers["reclaimed"])
+    yield _family("jobs_completed", "counter", "Asynchronous requests answered.", workers["completed"])
+    yield _family("jobs_failed", "counter", "Asynchronous requests that failed.", workers["failed"])
+
+    gate = admission.stats()
+    yield _family("admission_active", "gauge", "Generations holding an admission slot.", gate["active"])
+    yield _family("admission_waiting", "gauge", "Generations waiting for an admission slot.", gate["waiting"])
+    yield _family("admission_overloaded", "gauge", "1 while the admission queue is not draining (shedding early).", int(gate["overloaded"]))
+    yield _family("admission_admitted", "counter", "Generations given an admission slot.", gate["admitted"])
+    yield _family("admission_bypassed", "counter", "Cached generations let through without a slot.", gate["bypassed"])
+    yield (
+        "admission_rejected",
+        "counter",
+        "Generations rejected at admission, by reason (429 client_limit, 503 queue_full or shed).",
+        [("_total", {"reason": reason}, gate[key]) for reason, key in (("client_limit", "rejected_client"), ("queue_full", "rejected_queue_full"), ("shed", "shed"))],
+    )
+
+def collect_pool_stats(replicas: ReadRouter):
+    """
+    Exposes the connection pools' usage per database (pools without these counters, like SQLite's `NullPool`, are skipped)
+    and the routing of reads between the primary and its read replicas.
+    """
+    pools = [(name, engine.pool) for name, engine in replicas.engines() if hasattr(engine.pool, "checkedout")]
+    if pools:
+        for name, type_name, documentation, read in (
+            ("db_pool_size", "gauge", "Configured size of the database connection pool.", lambda pool: pool.size()),
+            ("db_pool_checked_out", "gauge", "Database connections in use.", lambda pool: pool.checkedout()),
+            ("db_pool_checked_in", "gauge", "Idle database connections in the pool.", lambda pool: pool.checkedin()),
+            ("db_pool_overflow", "gauge", "Connections open beyond the pool size.", lambda pool: max(0, pool.overflow())),
+        ):
+            yield name, type_name, documentation, [("", {"database": database}, read(pool)) for database, pool in pools]
+
+    if not replicas.enabled:
+        return
+    stats = replicas.stats()
+    yield (
+        "db_reads",
+        "counter",
+        "Read-only sessions opened, by database.",
+        [("_total", {"database": "primary"}, stats["primary_reads"])]
+        + [("_total", {"database": name}, replica["reads"]) for name, replica in stats["replicas"].items()],
+    )
+    yield _family("db_replica_fallbacks", "counter", "Reads sent to the primary because no replica was caught up.", stats["fallbacks"])
+    yield _family("db_replica_primary_retries", "counter", "Lookups repeated on the primary after a replica found nothing.", stats["primary_retries"])
+    yield (
+        "db_replica_lag_seconds",
+        "gauge",
+        "Last measured replication lag of each replica (absent while unknown).",
+        [("", {"database": name}, replica["lag_seconds"]) for name, replica in stats["replicas"].items() if replica["lag_seconds"] is not None],
+    )
@@ -1,31 +1,546 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+from openai import OpenAIError
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
 
 import models, schemas
-from database import get_db
-from services.openai_service import openai_service
+from database import AsyncSessionLocal, get_db
+from database.export import EXPORT_FORMATS, export_stream
+from database.fulltext import match_condition
+from database.replicas import ReadRouter, first_or_primary, get_read_db, get_replicas
+from database.response_store import to_storage_rows
+from database.retention import RetentionJob, get_retention
+from database.write_behind import WriteBehindClosed, WriteBehindFull, WriteBehindQueue, get_write_behind
+from services.jobs import JOB_MAX_WAIT_SECONDS, PENDING, UNFINISHED, JobWorkers, get_jobs
+from services.model_router import RouteChoice
+from services.openai_service import OpenAI, get_openai_service
+from utils.admission import Overloaded, admission, client_id
+from utils.cache import LRUCache, default_size_of
+from utils.ids import generate_unique_id
+from utils.metrics import STAGE_DURATION_SECONDS
 
 router = APIRouter()
 
-@router.post("/", response_model=schemas.RequestResponse)
-async def create_request(request: schemas.RequestCreate, db: Session = Depends(get_db)):
+# Limits for POST /requests/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))  # Largest accepted batch
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))  # Concurrent OpenAI calls per batch
+
+# Page sizes for GET /requests and GET /requests/search
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "50"))  # Page size when `limit` is not given
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "500"))  # Largest accepted `limit`
+
+# HTTP caching of GET /requests/{request_id} (stored requests never change)
+REQUEST_CACHE_CONTROL = os.getenv("REQUEST_CACHE_CONTROL", "private, max-age=86400, immutable")  # Cache-Control of stored requests
+REQUEST_CACHE_MAX_ENTRIES = int(os.getenv("REQUEST_CACHE_MAX_ENTRIES", "10000"))  # Serialized requests kept in memory; 0 disables
+REQUEST_CACHE_MAX_BYTES = int(os.getenv("REQUEST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Limit on their total size
+REQUEST_CACHE_TTL_SECONDS = float(os.getenv("REQUEST_CACHE_TTL_SECONDS", "3600"))  # Bounds how long a request removed by retention is still served
+
+# Recently read requests as (ETag, JSON body), so repeat reads skip the database, the ORM and serialization
+REQUEST_CACHE = LRUCache(
+    max_entries=REQUEST_CACHE_MAX_ENTRIES,
+    ttl_seconds=REQUEST_CACHE_TTL_SECONDS,
+    max_bytes=REQUEST_CACHE_MAX_BYTES or None,
+    size_of=lambda value: sum(map(default_size_of, value)) if isinstance(value, tuple) else default_size_of(value),
+)
+
+# Per-stage latency histograms for the persistence path (see utils.metrics)
+DB_COMMIT_SECONDS = STAGE_DURATION_SECONDS.labels(stage="db_commit")
+DB_REFRESH_SECONDS = STAGE_DURATION_SECONDS.labels(stage="db_refresh")
+DB_BULK_INSERT_SECONDS = STAGE_DURATION_SECONDS.labels(stage="db_bulk_insert")
+WRITE_BEHIND_SUBMIT_SECONDS = STAGE_DURATION_SECONDS.labels(stage="write_behind_submit")
+
+def _rejected(error: Overloaded) -> HTTPException:
+    return HTTPException(status_code=error.status_code, detail=error.detail, headers={"Retry-After": str(error.retry_after)})
+
+def _prefers_async(prefer: Optional[str]) -> bool:
+    # `Prefer: respond-async` (RFC 7240); preferences are comma-separated and may carry `;` parameters
+    return bool(prefer) and any(token.split(";")[0].strip().lower() == "respond-async" for token in prefer.split(","))
+
+@router.post("/", response_model=schemas.RequestResponse, responses={202: {"description": "Accepted; the response is generated in the background"}})
+async def create_request(
+    request: schemas.RequestCreate,
+    http_request: Request,
+    http_response: Response,
+    prefer: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    openai_service: OpenAI = Depends(get_openai_service),
+    jobs: JobWorkers = Depends(get_jobs),
+    write_behind: WriteBehindQueue = Depends(get_write_behind),
+):
+    """
+    Creates a request and generates its response.
+
+    With `Prefer: respond-async` (and JOB_WORKERS set) the request is only stored, as
+    `pending`, and answered with 202 and its `Location`; a background worker generates
+    the response, which GET /requests/{request_id} returns once the status is `done`.
+
+    Generations not answered from the cache wait for an admission slot, and are rejected
+    with 429 or 503 and `Retry-After` when the client or the worker is overloaded.
+    """
+    if _prefers_async(prefer) and jobs.accepting:
+        return await _create_pending(request, http_request, http_response, db, jobs)
     try:
-        response = await openai_service.generate_response(request.text)
-        new_request = models.Request(text=request.text, response=response, created_at=datetime.utcnow())
+        choice = openai_service.route(request.text, request.hint, request.max_tokens)
+        async with admission.slot(client_id(http_request), cheap=openai_service.is_cached(request.text, choice)):
+            response = await openai_service.generate_response(request.text, choice)
+        row = {
+            "request_key": generate_unique_id(),
+            "text": request.text,
+            "response": response,
+            "created_at": datetime.utcnow(),
+            "prompt_hash": openai_service.prompt_hash(request.text, choice),
+            "model": choice.model,
+        }
+        # Write-behind mode: hand the row to the background flusher and answer with its key
+        if write_behind.accepting:
+            try:
+                with WRITE_BEHIND_SUBMIT_SECONDS.time():
+                    await write_behind.submit(row)
+                return schemas.RequestResponse(**row)
+            except WriteBehindClosed:
+                pass  # The queue started draining meanwhile; write the row directly
+        new_request = models.Request(**(await to_storage_rows(db, [row]))[0])
         db.add(new_request)
-        db.commit()
-        db.refresh(new_request)
+        with DB_COMMIT_SECONDS.time():
+            await db.commit()
+        with DB_REFRESH_SECONDS.time():
+            await db.refresh(new_request)
         return new_request
-    except openai.error.OpenAIError as e:
+    except Overloaded as e:
+        raise _rejected(e)
+    except WriteBehindFull:
+        raise HTTPException(status_code=503, detail="Server busy, please retry.", headers={"Retry-After": "1"})
+    except OpenAIError as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API request failed: {e}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+
+async def _create_pending(request: schemas.RequestCreate, http_request: Request, http_response: Response, db: AsyncSession, jobs: JobWorkers) -> models.Request:
+    """
+    Stores a request for the background workers and returns it with status 202.
+    """
+    new_request = models.Request(
+        request_key=generate_unique_id(),
+        text=request.text,
+        created_at=datetime.utcnow(),
+        status=PENDING,
+        hint=request.hint,
+        max_tokens=request.max_tokens,
+        attempts=0,
+    )
+    try:
+        db.add(new_request)
+        with DB_COMMIT_SECONDS.time():
+            await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+    jobs.notify()
+    http_response.status_code = 202
+    http_response.headers["Location"] = str(http_request.url_for("get_request", request_id=new_request.id))
+    http_response.headers["Preference-Applied"] = "respond-async"
+    return new_request
+
+@router.post("/batch", response_model=List[schemas.BatchItemResult])
+async def create_requests_batch(
+    requests: List[schemas.RequestCreate],
+    http_request: Request,
+    db: AsyncSession = Depends(get_db),
+    openai_service: OpenAI = Depends(get_openai_service),
+):
+    """
+    Creates many requests in one call.
+
+    Identical texts are generated once, uncached texts are sent to OpenAI with bounded
+    concurrency, and all successful items are stored with a single multi-row INSERT.
+    Items that fail carry an `error` instead of failing the whole batch. A batch with
+    uncached texts holds one admission slot while it is generated.
+    """
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {BATCH_MAX_ITEMS} items).")
+
+    # Route each item, then generate every group of items sharing a route together
+    choices = [openai_service.route(item.text, item.hint, item.max_tokens) for item in requests]
+    groups = {}
+    for item, choice in zip(requests, choices):
+        groups.setdefault(choice, []).append(item.text)
+    responses = {}
+    cheap = all(openai_service.is_cached(text, choice) for choice, texts in groups.items() for text in texts)
+    try:
+        async with admission.slot(client_id(http_request), cheap=cheap):
+            for choice, texts in groups.items():
+                outcomes = await openai_service.generate_responses(texts, max_concurrency=BATCH_MAX_CONCURRENCY, choice=choice)
+                responses.update(((text, choice), outcome) for text, outcome in outcomes.items())
+    except Overloaded as e:
+        raise _rejected(e)
+
+    created_at = datetime.utcnow()
+    results = []
+    rows = []
+    for index, (item, choice) in enumerate(zip(requests, choices)):
+        outcome = responses[(item.text, choice)]
+        if isinstance(outcome, HTTPException):
+            results.append(schemas.BatchItemResult(index=index, text=item.text, error=outcome.detail))
+        elif isinstance(outcome, Exception):
+            results.append(schemas.BatchItemResult(index=index, text=item.text, error=f"Internal server error: {outcome}"))
+        else:
+            result = schemas.BatchItemResult(index=index, text=item.text, response=outcome, created_at=created_at)
+            results.append(result)
+            rows.append((result, choice))
+
+    if rows:
+        try:
+            started = time.perf_counter()
+            values = await to_storage_rows(db, (
+                {
+                    "request_key": generate_unique_id(),
+                    "text": row.text,
+                    "response": row.response,
+                    "created_at": row.created_at,
+                    "prompt_hash": openai_service.prompt_hash(row.text, choice),
+                    "model": choice.model,
+                }
+                for row, choice in rows
+            ))
+            inserted = await db.execute(insert(models.Request).returning(models.Request.id, sort_by_parameter_order=True), values)
+            for (row, _), request_id in zip(rows, inserted.scalars()):
+                row.id = request_id
+            await db.commit()
+            DB_BULK_INSERT_SECONDS.observe(time.perf_counter() - started)
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+    return results
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    """
+    Formats one server-sent event.
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _stream_events(
+    text: str,
+    choice: RouteChoice,
+    prompt_hash: str,
+    first_chunk: str,
+    chunks: AsyncIterator[str],
+    release: Callable[[], Awaitable[None]],
+) -> AsyncIterator[str]:
+    """
+    Relays response deltas as SSE `data` events, then stores the request and emits a final `done` event.
+
+    If the client disconnects, the task running this generator is cancelled; the `finally`
+    block then closes the upstream stream and nothing is persisted. `release` frees the
+    admission slot once the upstream stream is closed.
+    """
+    parts = []
+    try:
+        if first_chunk:
+            parts.append(first_chunk)
+            yield _sse({"delta": first_chunk})
+        async for delta in chunks:
+            parts.append(delta)
+            yield _sse({"delta": delta})
+    except HTTPException as e:
+        yield _sse({"detail": e.detail}, event="error")
+        return
+    finally:
+        try:
+            await chunks.aclose()
+        finally:
+            await release()
+
+    # The request-scoped session is already closed once streaming starts, so use a fresh one.
+    # Headers are already sent, so a failure here can only be reported as an `error` event.
+    try:
+        async with AsyncSessionLocal() as db:
+            row = {
+                "request_key": generate_unique_id(),
+                "text": text,
+                "response": "".join(parts),
+                "created_at": datetime.utcnow(),
+                "prompt_hash": prompt_hash,
+                "model": choice.model,
+            }
+            new_request = models.Request(**(await to_storage_rows(db, [row]))[0])
+            db.add(new_request)
+            await db.commit()
+            await db.refresh(new_request)
+    except Exception as e:
+        yield _sse({"detail": f"Internal server error: {e}"}, event="error")
+        return
+    yield _sse(schemas.RequestResponse.model_validate(new_request, from_attributes=True).model_dump(mode="json"), event="done")
+
+@router.post("/stream")
+async def create_request_stream(
+    request: schemas.RequestCreate,
+    http_request: Request,
+    openai_service: OpenAI = Depends(get_openai_service),
+):
+    """
+    Streams the response to a new request as server-sent events.
+
+    Each `data` event carries a `delta` with the next piece of text; the final `done`
+    event carries the stored request (same shape as POST /requests). An uncached
+    prompt holds an admission slot until its stream ends.
+    """
+    choice = openai_service.route(request.text, request.hint, request.max_tokens)
+    # The slot (and later the upstream stream) belongs to this handler until the response takes it over; `aclose` is idempotent
+    slot = AsyncExitStack()
+    try:
+        await slot.enter_async_context(
+            admission.slot(client_id(http_request), cheap=openai_service.is_cached(request.text, choice))
+        )
+    except Overloaded as e:
+        raise _rejected(e)
+    try:
+        chunks = openai_service.stream_response(request.text, choice)
+        slot.push_async_callback(chunks.aclose)
+        # Wait for the first delta so upstream failures still surface as an HTTP error status
+        try:
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = ""
+        except OpenAIError as e:
+            raise HTTPException(status_code=500, detail=f"OpenAI API request failed: {e}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+    except BaseException:  # Including cancellation while waiting for the first delta
+        await slot.aclose()
+        raise
+    # The body releases the slot when the stream ends; the background task covers a
+    # client that disconnects before the body starts, when the generator never runs
+    return StreamingResponse(
+        _stream_events(request.text, choice, openai_service.prompt_hash(request.text, choice), first_chunk, chunks, slot.aclose),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(slot.aclose),
+    )
+
+def encode_cursor(created_at: datetime, request_id: int) -> str:
+    """
+    Encodes the position after a row as an opaque pagination cursor.
+    """
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{request_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decodes a cursor from `encode_cursor`.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed.
+    """
+    try:
+        created_at, request_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(request_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+def _as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # `created_at` is stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def _keyset_page(
+    db: AsyncSession,
+    query,
+    limit: int,
+    cursor: Optional[str],
+    created_after: Optional[datetime],
+    created_before: Optional[datetime],
+) -> dict:
+    """
+    Runs `query` as one page of requests, newest first, continuing after `cursor`.
+
+    Pages are selected with a `(created_at, id) < cursor` range on the
+    `ix_requests_created_at_id` index, so any page costs the same as the first one.
+    """
+    conditions = [models.Request.created_at.isnot(None)]
+    if created_after is not None:
+        conditions.append(models.Request.created_at >= _as_naive_utc(created_after))
+    if created_before is not None:
+        conditions.append(models.Request.created_at < _as_naive_utc(created_before))
+    if cursor is not None:
+        conditions.append(tuple_(models.Request.created_at, models.Request.id) < tuple_(*decode_cursor(cursor)))
+    query = query.where(*conditions).order_by(models.Request.created_at.desc(), models.Request.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).scalars().all()
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+@router.get("/", response_model=schemas.RequestPage)
+async def list_requests(
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Lists stored requests, newest first, one page at a time.
+
+    Pass the returned `next_cursor` as `cursor` to get the following page.
+    `created_after` (inclusive) and `created_before` (exclusive) restrict the time range.
+    Served by a read replica when one is configured and caught up.
+    """
+    return await _keyset_page(db, select(models.Request), limit, cursor, created_after, created_before)
+
+@router.get("/search", response_model=schemas.RequestPage)
+async def search_requests(
+    q: str = Query(..., min_length=1, description="Words that must all appear in the request text or response"),
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Full-text search over request texts and responses, newest first, paginated like GET /requests.
+
+    Backed by a GIN `tsvector` index on PostgreSQL and an FTS5 table on SQLite. Responses
+    kept in `dedup` storage (RESPONSE_STORAGE) are compressed outside `requests` and not
+    indexed, so for those rows only the request text is searched.
+    """
+    query = select(models.Request).where(match_condition(db.bind.dialect.name, q))
+    return await _keyset_page(db, query, limit, cursor, created_after, created_before)
+
+@router.get("/export")
+async def export_requests(
+    format: str = Query("ndjson", pattern="^(" + "|".join(EXPORT_FORMATS) + ")$"),
+    since_id: Optional[int] = Query(None, description="Only export rows with a larger id"),
+    since: Optional[datetime] = Query(None, description="Only export rows created at or after this time"),
+    gzip: bool = False,
+    replicas: ReadRouter = Depends(get_replicas),
+):
+    """
+    Streams the whole `requests` table (or the rows after `since_id` / `since`) as NDJSON or CSV.
+
+    Rows are read in chunks through a server-side cursor and serialized as they arrive,
+    so memory use does not grow with the table. Read from a replica when one is configured and caught up.
+    """
+    filename = f"requests.{format}" + (".gz" if gzip else "")
+    media_type = "application/gzip" if gzip else ("application/x-ndjson" if format == "ndjson" else "text/csv")
+    return StreamingResponse(
+        export_stream(replicas.engine(), format, since_id=since_id, since=_as_naive_utc(since), compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/stats")
+async def get_stats(
+    openai_service: OpenAI = Depends(get_openai_service),
+    write_behind: WriteBehindQueue = Depends(get_write_behind),
+    jobs: JobWorkers = Depends(get_jobs),
+    retention: RetentionJob = Depends(get_retention),
+    replicas: ReadRouter = Depends(get_replicas),
+):
+    """
+    Returns this worker's response-cache, single-flight, request-cache, write-behind, job, admission, retention and read-replica counters.
+
+    `cache` is the in-memory LRU (L1), `l2_cache` the stored-request lookups and
+    `single_flight` the coalescing of concurrent identical prompts.
+    """
+    return {
+        **openai_service.stats(),
+        "request_cache": REQUEST_CACHE.stats(),
+        "write_behind": write_behind.stats(),
+        "jobs": jobs.stats(),
+        "admission": admission.stats(),
+        "retention": retention.stats(),
+        "replicas": replicas.stats(),
+    }
+
+def request_etag(request_id: int, body: bytes) -> str:
+    """
+    Returns the strong ETag of a stored request's JSON representation.
+
+    The id comes first so tags of different requests never collide.
+    """
+    return f'"{request_id}-{hashlib.sha256(body).hexdigest()[:16]}"'
+
+def _matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    # Compares `If-None-Match` with the current tag, which must come from the stored row
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]  # If-None-Match uses the weak comparison
+        if tag == etag:
+            return tag
+    return None
 
 @router.get("/{request_id}", response_model=schemas.RequestResponse)
-async def get_request(request_id: int, db: Session = Depends(get_db)):
-    db_request = db.query(models.Request).filter(models.Request.id == request_id).first()
+async def get_request(
+    request_id: int,
+    if_none_match: Optional[str] = Header(None),
+    wait: float = Query(0, ge=0, le=JOB_MAX_WAIT_SECONDS, description="Seconds to wait for an unfinished asynchronous request (long-polling)"),
+    replicas: ReadRouter = Depends(get_replicas),
+    jobs: JobWorkers = Depends(get_jobs),
+):
+    """
+    Retrieves a stored request.
+
+    Finished requests never change, so responses carry a strong `ETag` and a long-lived
+    `Cache-Control`. Recently read requests are served from memory as already serialized
+    JSON, and a matching `If-None-Match` for one of them gets a 304 without a database
+    query; otherwise the tag is checked against the stored row. Requests
+    still `pending` or `running` are neither cached nor tagged; with `wait`, the call
+    returns as soon as they finish, or with their current state after `wait` seconds.
+    """
+    headers = {"Cache-Control": REQUEST_CACHE_CONTROL}
+    cached = REQUEST_CACHE.get(request_id)
+    if cached is None:
+        async with replicas.session() as db:
+            db_request = await first_or_primary(db, select(models.Request).filter(models.Request.id == request_id))
+        if db_request is None:
+            raise HTTPException(status_code=404, detail="Request not found")
+        if db_request.status in UNFINISHED and wait > 0:
+            db_request = await jobs.wait(request_id, wait)
+            if db_request is None:
+                raise HTTPException(status_code=404, detail="Request not found")
+        body = schemas.RequestResponse.model_validate(db_request, from_attributes=True).model_dump_json().encode()
+        if db_request.status in UNFINISHED:
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+        cached = (request_etag(request_id, body), body)
+        REQUEST_CACHE.set(request_id, cached)
+    headers["ETag"] = cached[0]
+    if _matching_etag(if_none_match, cached[0]) is not None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached[1], media_type="application/json", headers=headers)
+
+@router.get("/key/{request_key}", response_model=schemas.RequestResponse)
+async def get_request_by_key(
+    request_key: str,
+    db: AsyncSession = Depends(get_read_db),
+    write_behind: WriteBehindQueue = Depends(get_write_behind),
+):
+    """
+    Retrieves a request by the key returned when it was created.
+
+    Rows still waiting in the write-behind queue are served from memory.
+    """
+    pending = write_behind.get_pending(request_key)
+    if pending is not None:
+        return schemas.RequestResponse(**pending)
+    db_request = await first_or_primary(db, select(models.Request).filter(models.Request.request_key == request_key))
     if db_request is None:
         raise HTTPException(status_code=404, detail="Request not found")
-    return db_request
\ No newline at end of file
+    return db_request
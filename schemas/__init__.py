@@ -0,0 +1 @@
+from .schemas import BatchItemResult, RequestCreate, RequestPage, RequestResponse
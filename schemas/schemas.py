@@ -1,11 +1,36 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
+from typing import List, Optional
 
 class RequestCreate(BaseModel):
     text: str = Field(..., description="Text of the request")
+    # Routing options only steer how the answer is generated; they are not part of the stored request
+    hint: Optional[str] = Field(None, exclude=True, description="Routing hint selecting a configured model route (e.g. \"fast\" or \"quality\"); unknown hints are ignored")
+    max_tokens: Optional[int] = Field(None, ge=1, exclude=True, description="Upper limit on the answer length, in tokens")
 
 class RequestResponse(BaseModel):
-    id: int 
+    id: Optional[int] = Field(None, description="Database id; not yet known when the row is still queued for write-behind")
+    request_key: Optional[str] = Field(None, description="Key assigned when the request is accepted")
     text: str
-    response: str
-    created_at: datetime
\ No newline at end of file
+    response: Optional[str] = Field(None, description="Null until an asynchronous request is done")
+    created_at: datetime
+    status: str = Field("done", description="pending, running, done or failed; requests answered synchronously are done")
+    error: Optional[str] = Field(None, description="Why an asynchronous request failed")
+
+    @field_validator("status", mode="before")
+    @classmethod
+    def _synchronous_is_done(cls, value):
+        # Rows answered synchronously have no status
+        return value or "done"
+
+class BatchItemResult(BaseModel):
+    index: int = Field(..., description="Position of the item in the submitted batch")
+    id: Optional[int] = None
+    text: str
+    response: Optional[str] = None
+    created_at: Optional[datetime] = None
+    error: Optional[str] = Field(None, description="Why this item failed, if it did")
+
+class RequestPage(BaseModel):
+    items: List[RequestResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to fetch the next page; null on the last page")
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from openai import OpenAIError
+from sqlalchemy import and_, func, or_, select, update
+
+import models
+from database.database import AsyncSessionLocal, get_engine
+from database.response_store import to_storage_rows
+from services.openai_service import OpenAI, openai_service
+from settings import JOB_WORKERS
+
+# Asynchronous requests (POST /requests with `Prefer: respond-async`)
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))  # How often idle workers and long-polls check the database
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))  # A claimed request not finished by then is claimed again
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # Claims before a request whose workers keep dying is marked failed
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))  # Longest long-poll accepted by GET /requests/{id}
+
+# Values of `models.Request.status` (NULL for requests answered synchronously)
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+UNFINISHED = (PENDING, RUNNING)
+
+logger = logging.getLogger(__name__)
+
+class JobWorkers:
+    """
+    Generates the responses of asynchronous requests in background workers.
+
+    POST /requests stores such a request as a `pending` row and returns at once. Each
+    worker claims one unfinished row at a time with `SELECT ... FOR UPDATE SKIP LOCKED`,
+    so workers in any number of processes never take the same row, marks it `running`,
+    generates the response and stores it with status `done` (or `failed` and an error).
+    SQLite has no row locks, but it runs one write transaction at a time, so the same
+    single-statement claim is safe there too.
+
+    A row whose worker died stays `running` until its lease expires and is then claimed
+    again; after `max_attempts` claims it is marked `failed`. Idle workers are woken by
+    requests created in this process and otherwise check the database every `poll_interval`.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = AsyncSessionLocal,
+        service: Optional[OpenAI] = None,
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL_SECONDS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ):
+        """
+        Initializes an idle pool; call `start()` from the application's startup hook.
+
+        Args:
+            session_factory (Callable): Factory returning an `AsyncSession` context manager.
+            service (Optional[OpenAI]): Generates the responses (default: the shared `openai_service`).
+            workers (int): Number of concurrent workers.
+            poll_interval (float): Seconds between database checks of an idle worker.
+            lease_seconds (float): Seconds after which a claimed, unfinished row may be claimed again.
+            max_attempts (int): Claims of a row before it is given up.
+        """
+        self._session_factory = session_factory
+        self.service = service if service is not None else openai_service
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._finished: "weakref.WeakValueDictionary[int, asyncio.Event]" = weakref.WeakValueDictionary()
+        self.busy = 0
+        self.claimed = 0
+        self.reclaimed = 0
+        self.completed = 0
+        self.failed = 0
+        self.lost_leases = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    @property
+    def accepting(self) -> bool:
+        """
+        True while asynchronous requests are accepted (workers running and not stopping).
+        """
+        return self.running and not self._stopping
+
+    def start(self, workers: Optional[int] = None) -> None:
+        """
+        Starts the workers on the running event loop.
+
+        Args:
+            workers (Optional[int]): Number of workers (default: the configured number).
+        """
+        if self.running:
+            return
+        if workers is not None:
+            self.workers = workers
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 30) -> None:
+        """
+        Stops the workers, letting the responses being generated finish for up to `timeout` seconds.
+
+        Rows whose worker is cancelled stay `running` and are claimed again once their lease expires.
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+
+    def notify(self) -> None:
+        """
+        Wakes the idle workers after a pending request was committed.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait(self, request_id: int, timeout: float) -> Optional[models.Request]:
+        """
+        Waits until a request is finished or `timeout` seconds have passed (long-polling).
+
+        Completions in this process end the wait at once; those in other processes are
+        noticed by re-reading the row from the primary every `poll_interval` seconds.
+
+        Args:
+            request_id (int): The request to wait for.
+            timeout (float): Longest wait in seconds.
+
+        Returns:
+            Optional[models.Request]: The row as last read (None if it no longer exists).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            finished = self._finished.get(request_id)
+            if finished is None:
+                finished = self._finished[request_id] = asyncio.Event()
+            try:
+                await asyncio.wait_for(finished.wait(), min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+            except asyncio.TimeoutError:
+                pass
+            get_engine()  # Binds AsyncSessionLocal
+            async with self._session_factory() as db:
+                row = (await db.execute(select(models.Request).where(models.Request.id == request_id))).scalars().first()
+            if row is None or row.status not in UNFINISHED or time.monotonic() >= deadline:
+                return row
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns worker and completion counters.
+        """
+        return {
+            "workers": len(self._tasks),
+            "busy": self.busy,
+            "claimed": self.claimed,
+            "reclaimed": self.reclaimed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "lost_leases": self.lost_leases,
+            "errors": self.errors,
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            # Clear before claiming, so a request committed meanwhile is either claimed now or wakes us
+            self._wakeup.clear()
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Claiming an asynchronous request failed: %s", e)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.busy += 1
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Asynchronous request %s could not be stored: %s", job.id, e)
+            finally:
+                self.busy -= 1
+
+    async def _claim(self):
+        """
+        Marks the oldest claimable row `running` and returns it, or None when there is none.
+        """
+        requests = models.Request.__table__
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=self.lease_seconds)
+        candidate = (
+            select(requests.c.id)
+            .where(or_(requests.c.status == PENDING, and_(requests.c.status == RUNNING, requests.c.claimed_at < expired)))
+            .order_by(requests.c.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        claim = (
+            update(requests)
+            .where(requests.c.id == candidate)
+            .values(status=RUNNING, claimed_at=now, attempts=func.coalesce(requests.c.attempts, 0) + 1)
+            .returning(requests.c.id, requests.c.created_at, requests.c.text, requests.c.hint, requests.c.max_tokens, requests.c.attempts, requests.c.claimed_at)
+        )
+        get_engine()  # Binds AsyncSessionLocal
+        async with self._session_factory() as db:
+            job = (await db.execute(claim)).first()
+            await db.commit()
+        if job is not None:
+            self.claimed += 1
+            if job.attempts > 1:
+                self.reclaimed += 1
+        return job
+
+    async def _process(self, job) -> None:
+        # 1. Give up on rows whose workers keep disappearing
+        if job.attempts > self.max_attempts:
+            await self._finish(job, {"status": FAILED, "error": f"Gave up after {self.max_attempts} attempts"})
+            return
+
+        # 2. Generate the response the way POST /requests does
+        try:
+            choice = self.service.route(job.text, job.hint, job.max_tokens)
+            response = await self.service.generate_response(job.text, choice)
+        except HTTPException as e:
+            await self._finish(job, {"status": FAILED, "error": str(e.detail)})
+            return
+        except OpenAIError as e:
+            await self._finish(job, {"status": FAILED, "error": f"OpenAI API request failed: {e}"})
+            return
+        except Exception as e:
+            await self._finish(job, {"status": FAILED, "error": f"Internal server error: {e}"})
+            return
+        await self._finish(job, {
+            "status": DONE,
+            "response": response,
+            "prompt_hash": self.service.prompt_hash(job.text, choice),
+            "model": choice.model,
+        })
+
+    async def _finish(self, job, values: Dict[str, Any]) -> None:
+        """
+        Stores the outcome of a claimed row, unless its lease was taken over meanwhile.
+        """
+        async with self._session_factory() as db:
+            if "response" in values:
+                values = (await to_storage_rows(db, [values]))[0]
+            result = await db.execute(
+                update(models.Request)
+                .where(
+                    models.Request.id == job.id,
+                    models.Request.created_at == job.created_at,  # Lets PostgreSQL prune partitions
+                    models.Request.status == RUNNING,
+                    models.Request.claimed_at == job.claimed_at,
+                )
+                .values(**values, completed_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        if result.rowcount == 0:
+            self.lost_leases += 1
+            logger.warning("Asynchronous request %s was claimed again before it finished; its result was discarded", job.id)
+            return
+        if values["status"] == DONE:
+            self.completed += 1
+        else:
+            self.failed += 1
+        finished = self._finished.get(job.id)
+        if finished is not None:
+            finished.set()
+
+# Shared worker pool for this process (started only when JOB_WORKERS > 0)
+jobs = JobWorkers()
+
+
+def get_jobs(request: Request) -> JobWorkers:
+    """
+    Returns the job workers of the app serving `request` (see `main.create_app`), or the shared ones for other apps.
+    """
+    return getattr(request.app.state, "jobs", jobs)
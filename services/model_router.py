@@ -0,0 +1,248 @@
+import json
+import math
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# Model routing
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")  # JSON list of routes (see README); empty sends every prompt to the default route
+MODEL_ROUTER_ADAPTIVE_MAX_TOKENS = os.getenv("MODEL_ROUTER_ADAPTIVE_MAX_TOKENS", "false").lower() in ("1", "true", "yes")  # Size max_tokens from observed answers
+MODEL_ROUTER_PROBE_EVERY = int(os.getenv("MODEL_ROUTER_PROBE_EVERY", "10"))  # While a route is over its latency budget, every Nth prompt still tries it
+
+# Parameters of the default route, used when MODEL_ROUTES is empty
+DEFAULT_MODEL = "gpt-3.5-turbo"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 1000
+
+# Feedback tuning
+LATENCY_EWMA_ALPHA = 0.2  # Weight of the newest call in a route's smoothed latency
+MIN_LATENCY_SAMPLES = 5  # Calls before a route's latency is compared with its budget
+MIN_TOKEN_SAMPLES = 50  # Answers before max_tokens is adapted
+TOKEN_WINDOW = 500  # Recent answer lengths kept per route
+MIN_ADAPTIVE_MAX_TOKENS = 64
+
+@dataclass(frozen=True)
+class Route:
+    """
+    A routing rule: which prompts it takes and how they are answered.
+
+    Attributes:
+        name (str): Unique name, reported in stats and metrics.
+        model (str): OpenAI model.
+        temperature (float): Sampling temperature.
+        max_tokens (int): Longest answer, in tokens.
+        max_prompt_chars (Optional[int]): Only prompts up to this length match by length (None: any length).
+        hints (Tuple[str, ...]): Request hints that select this route whatever the prompt length.
+        latency_budget_seconds (Optional[float]): Smoothed latency above which prompts are diverted to `fallback`.
+        fallback (Optional[str]): Route used while this one is over its latency budget.
+        cost_per_1k_tokens (float): Price used for the per-route cost stats.
+    """
+
+    name: str
+    model: str = DEFAULT_MODEL
+    temperature: float = DEFAULT_TEMPERATURE
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    max_prompt_chars: Optional[int] = None
+    hints: Tuple[str, ...] = ()
+    latency_budget_seconds: Optional[float] = None
+    fallback: Optional[str] = None
+    cost_per_1k_tokens: float = 0.0
+
+@dataclass(frozen=True)
+class RouteChoice:
+    """
+    The route and parameters chosen for one prompt.
+    """
+
+    route: str
+    model: str
+    temperature: float
+    max_tokens: int
+
+    def params(self, text: str) -> dict:
+        """
+        Builds the chat-completions request parameters for a prompt.
+
+        Args:
+            text (str): The user's text request.
+
+        Returns:
+            dict: Keyword arguments for `chat.completions.create`.
+        """
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": text}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+class _RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.diverted = 0
+        self.calls = 0
+        self.latency = None  # Exponentially weighted moving average, in seconds
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.truncated = 0
+        self.answer_tokens = deque(maxlen=TOKEN_WINDOW)
+
+class ModelRouter:
+    """
+    Picks the model and parameters for each prompt from configurable routes.
+
+    A prompt goes to the first route listing the request's hint, otherwise to the first
+    route whose `max_prompt_chars` fits the prompt. Completed calls feed back into the
+    choice: a route whose smoothed latency exceeds its budget sends prompts to its
+    fallback (still trying the route every `probe_every` prompts so it can recover), and
+    with `adaptive_max_tokens` a route's `max_tokens` shrinks to what its answers
+    actually need. Adapted limits are rounded up to a power of two, so they, and the
+    cache keys derived from them, change rarely.
+    """
+
+    def __init__(
+        self,
+        routes: Sequence[Route] = (),
+        adaptive_max_tokens: bool = MODEL_ROUTER_ADAPTIVE_MAX_TOKENS,
+        probe_every: int = MODEL_ROUTER_PROBE_EVERY,
+    ):
+        """
+        Initializes the router.
+
+        Args:
+            routes (Sequence[Route]): Routes in priority order; empty for a single default route.
+            adaptive_max_tokens (bool): Lower each route's `max_tokens` to fit its observed answers.
+            probe_every (int): While a route is over budget, every Nth prompt for it still uses it.
+
+        Raises:
+            ValueError: If route names repeat, a fallback is unknown, or no route accepts every prompt.
+        """
+        self.routes = list(routes) or [Route(name="default")]
+        self._by_name = {route.name: route for route in self.routes}
+        if len(self._by_name) != len(self.routes):
+            raise ValueError("Model route names must be unique")
+        for route in self.routes:
+            if route.fallback is not None and route.fallback not in self._by_name:
+                raise ValueError(f"Unknown fallback route {route.fallback!r} for route {route.name!r}")
+        if all(route.max_prompt_chars is not None for route in self.routes):
+            raise ValueError("One model route must accept prompts of any length (no max_prompt_chars)")
+        self.adaptive_max_tokens = adaptive_max_tokens
+        self.probe_every = max(1, probe_every)
+        self._stats = {route.name: _RouteStats() for route in self.routes}
+
+    @classmethod
+    def from_config(cls, config: str, **kwargs) -> "ModelRouter":
+        """
+        Builds a router from a JSON list of route objects (the `MODEL_ROUTES` format).
+
+        Example:
+            `[{"name": "short", "model": "gpt-4o-mini", "max_prompt_chars": 200, "max_tokens": 256},
+            {"name": "default", "model": "gpt-3.5-turbo", "hints": ["quality"]}]`
+        """
+        if not config.strip():
+            return cls(**kwargs)
+        routes = []
+        for item in json.loads(config):
+            item = dict(item)
+            item["hints"] = tuple(item.get("hints", ()))
+            routes.append(Route(**item))
+        return cls(routes, **kwargs)
+
+    def choose(self, text: str, hint: Optional[str] = None, max_tokens: Optional[int] = None) -> RouteChoice:
+        """
+        Chooses the route and parameters for a prompt.
+
+        Args:
+            text (str): The user's text request.
+            hint (Optional[str]): A route hint from the request; unknown hints are ignored.
+            max_tokens (Optional[int]): A client limit on the answer length, applied below the route's own.
+
+        Returns:
+            RouteChoice: The route name and completion parameters.
+        """
+        # 1. Match on the hint, then on the prompt length
+        route = next((route for route in self.routes if hint is not None and hint in route.hints), None)
+        if route is None:
+            route = next(route for route in self.routes if route.max_prompt_chars is None or len(text) <= route.max_prompt_chars)
+        stats = self._stats[route.name]
+        stats.requests += 1
+
+        # 2. Divert from a route that is currently too slow (probing it now and then)
+        if route.fallback is not None and self._over_budget(route) and stats.requests % self.probe_every != 0:
+            stats.diverted += 1
+            route = self._by_name[route.fallback]
+
+        # 3. Size the answer
+        limit = self._max_tokens(route)
+        if max_tokens is not None:
+            limit = min(limit, max_tokens)
+        return RouteChoice(route=route.name, model=route.model, temperature=route.temperature, max_tokens=limit)
+
+    def record(self, route: str, latency: Optional[float], prompt_tokens: int = 0, completion_tokens: int = 0, truncated: bool = False) -> None:
+        """
+        Feeds a completed call back into the routing.
+
+        Args:
+            route (str): The route the call was made for.
+            latency (Optional[float]): Duration of the call in seconds (None for streams, whose duration depends on the reader).
+            prompt_tokens (int): Prompt tokens reported by OpenAI.
+            completion_tokens (int): Completion tokens reported by OpenAI.
+            truncated (bool): The answer was cut off by `max_tokens`.
+        """
+        stats = self._stats.get(route)
+        if stats is None:
+            return
+        stats.calls += 1
+        if latency is not None:
+            stats.latency = latency if stats.latency is None else stats.latency + LATENCY_EWMA_ALPHA * (latency - stats.latency)
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        if truncated:
+            stats.truncated += 1
+        if completion_tokens or truncated:
+            # A truncated answer needed at least the route's full limit
+            stats.answer_tokens.append(self._by_name[route].max_tokens if truncated else completion_tokens)
+
+    def _over_budget(self, route: Route) -> bool:
+        stats = self._stats[route.name]
+        return (
+            route.latency_budget_seconds is not None
+            and stats.calls >= MIN_LATENCY_SAMPLES
+            and stats.latency is not None
+            and stats.latency > route.latency_budget_seconds
+        )
+
+    def _max_tokens(self, route: Route) -> int:
+        answers = self._stats[route.name].answer_tokens
+        if not self.adaptive_max_tokens or len(answers) < MIN_TOKEN_SAMPLES:
+            return route.max_tokens
+        # Twice the 95th percentile answer, rounded up to a power of two
+        p95 = sorted(answers)[math.ceil(0.95 * len(answers)) - 1]
+        limit = 2 ** math.ceil(math.log2(max(MIN_ADAPTIVE_MAX_TOKENS, 2 * p95)))
+        return min(route.max_tokens, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns per-route traffic, latency, token and cost counters.
+        """
+        routes = {}
+        for route in self.routes:
+            stats = self._stats[route.name]
+            tokens = stats.prompt_tokens + stats.completion_tokens
+            routes[route.name] = {
+                "model": route.model,
+                "requests": stats.requests,
+                "diverted": stats.diverted,
+                "calls": stats.calls,
+                "latency_seconds": stats.latency,
+                "over_budget": self._over_budget(route),
+                "max_tokens": self._max_tokens(route),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "truncated": stats.truncated,
+                "cost": tokens / 1000 * route.cost_per_1k_tokens,
+            }
+        return routes
@@ -1,29 +1,124 @@
+import asyncio
+import hashlib
+import math
 import os
-from typing import Optional
-from fastapi import HTTPException
-from dotenv import load_dotenv
+import json
+import logging
+import random
+import time
+from typing import AsyncIterator, Dict, Iterable, Optional, Union
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Request
+import httpx
 import openai
-from datetime import datetime
 
 # Import necessary packages
 from openai import OpenAIError
-from openai.types import ChatCompletionRequestMessage
+from sqlalchemy import and_, func, or_, select
 
-# Load environment variables from .env file
-load_dotenv()
+import models
+from database import AsyncSessionLocal, get_engine
+from database.response_store import resolve_response
+from services.model_router import MODEL_ROUTES, ModelRouter, RouteChoice
+from utils.cache import LRUCache, load_snapshot, save_snapshot
+from utils.circuitbreaker import CircuitBreaker, CircuitOpenError
+from utils.near_duplicates import SimHashIndex, max_distance_for, normalize_prompt, parse_normalization, simhash
+from utils.metrics import OPENAI_REQUESTS_IN_FLIGHT, OPENAI_TOKENS, STAGE_DURATION_SECONDS
+from utils.ratelimit import RateLimiter, RateLimitTimeout
+from utils.singleflight import SingleFlight
+from settings import CACHE_SNAPSHOT_PATH, CACHE_WARM_TOP, OPENAI_API_KEY, OPENAI_BASE_URL
 
-# API Key for OpenAI (from .env file)
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# HTTP connection pool settings for the OpenAI client (one pool per worker)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
 
-# OpenAI service for generating responses
-openai_service = openai.OpenAI(api_key=OPENAI_API_KEY)
+def create_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Builds the pooled HTTP client shared by every OpenAI call in this worker.
+
+    Args:
+        transport (Optional[httpx.AsyncBaseTransport]): Custom transport (used by tests and benchmarks).
+
+    Returns:
+        httpx.AsyncClient: A keep-alive client configured from the `OPENAI_*` settings.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+        transport=transport,
+    )
 
 # Constants for caching (defined in `helpers.py`)
-CACHE_TTL_SECONDS = 3600  # Cache validity in seconds
-CACHE_MAX_SIZE = 1000  # Maximum number of cached responses
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))  # Cache validity in seconds
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1000"))  # Maximum number of cached responses
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", "0")) or None  # Optional limit on cached bytes
+
+# Cache warm-up across restarts: CACHE_SNAPSHOT_PATH and CACHE_WARM_TOP (see settings.py)
+
+# Looser cache matching (both off by default)
+CACHE_KEY_NORMALIZATION = parse_normalization(os.getenv("CACHE_KEY_NORMALIZATION", ""))  # e.g. "case,punctuation,whitespace"; prompts equal after these share answers
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0"))  # SimHash similarity (1 - differing bits / 64) at which a cached answer to a similar prompt is reused; 0 disables
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "100000"))  # Fingerprints kept in the near-duplicate index
+NEAR_DUPLICATE_MIN_CHARS = int(os.getenv("NEAR_DUPLICATE_MIN_CHARS", "40"))  # Shorter prompts are only matched exactly
+
+# Initialize the cache (bounded LRU with per-entry TTL)
+CACHE = LRUCache(max_entries=CACHE_MAX_SIZE, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES)
+
+logger = logging.getLogger(__name__)
 
-# Initialize the cache (using a simple dictionary for MVP)
-CACHE = {}
+# Outbound rate limits for this worker (0 disables a limit); callers queue in arrival order instead of failing
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))  # Requests per minute
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))  # Tokens per minute (prompt estimate + max_tokens)
+OPENAI_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("OPENAI_RATE_LIMIT_MAX_WAIT_SECONDS", "30"))  # Longest a call queues
+CHARS_PER_TOKEN = 4  # Rough prompt-size estimate used before the real usage is known
+
+def create_rate_limiter() -> RateLimiter:
+    """
+    Builds the outbound rate limiter from the `OPENAI_*_LIMIT` settings.
+    """
+    return RateLimiter(
+        requests_per_period=OPENAI_RPM_LIMIT,
+        tokens_per_period=OPENAI_TPM_LIMIT,
+        period=60.0,
+        max_wait=OPENAI_RATE_LIMIT_MAX_WAIT_SECONDS,
+    )
+
+# Retries, circuit breaker and hedging for OpenAI calls
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))  # Extra attempts after a retryable failure
+OPENAI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_DELAY_SECONDS", "0.5"))  # Doubled per attempt, full jitter
+OPENAI_RETRY_MAX_DELAY_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_DELAY_SECONDS", "8"))  # Backoff cap
+OPENAI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("OPENAI_CIRCUIT_FAILURE_THRESHOLD", "5"))  # Consecutive failures that open it (0 disables)
+OPENAI_CIRCUIT_RESET_SECONDS = float(os.getenv("OPENAI_CIRCUIT_RESET_SECONDS", "30"))  # How long it stays open
+OPENAI_HEDGE_AFTER_SECONDS = float(os.getenv("OPENAI_HEDGE_AFTER_SECONDS", "0"))  # Start a second attempt after this (0 disables)
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Tells whether an OpenAI client error is transient (connection problems, timeouts, 408/409/429 and 5xx).
+    """
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+# Per-stage latency histograms and token counters (see utils.metrics)
+CACHE_LOOKUP_SECONDS = STAGE_DURATION_SECONDS.labels(stage="cache_lookup")
+L2_LOOKUP_SECONDS = STAGE_DURATION_SECONDS.labels(stage="l2_lookup")
+RATE_LIMIT_WAIT_SECONDS = STAGE_DURATION_SECONDS.labels(stage="rate_limit_wait")
+UPSTREAM_SECONDS = STAGE_DURATION_SECONDS.labels(stage="upstream")
+UPSTREAM_STREAM_OPEN_SECONDS = STAGE_DURATION_SECONDS.labels(stage="upstream_stream_open")
+PROMPT_TOKENS = OPENAI_TOKENS.labels(type="prompt")
+COMPLETION_TOKENS = OPENAI_TOKENS.labels(type="completion")
+
+# Second cache tier: stored rows in the `requests` table newer than this are reused (0 disables it)
+L2_CACHE_TTL_SECONDS = float(os.getenv("L2_CACHE_TTL_SECONDS", "86400"))
 
 class OpenAI:
     """
@@ -32,21 +127,113 @@ class OpenAI:
     This class provides a `generate_response` method to process user requests and obtain responses from OpenAI.
     """
 
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        retry_base_delay: float = OPENAI_RETRY_BASE_DELAY_SECONDS,
+        hedge_after: float = OPENAI_HEDGE_AFTER_SECONDS,
+        router: Optional[ModelRouter] = None,
+        key_normalization: Iterable[str] = CACHE_KEY_NORMALIZATION,
+        near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD,
+    ):
         """
         Initializes the OpenAI service with the provided API key.
 
+        The async client is not created here; call `startup()` from the application's
+        startup hook (it is also created lazily on first use).
+
         Args:
             api_key (str): The OpenAI API key.
+            base_url (Optional[str]): Override for the OpenAI API base URL.
+            http_client (Optional[httpx.AsyncClient]): Pre-built pooled HTTP client to use.
+            rate_limiter (Optional[RateLimiter]): Outbound scheduler; built from the `OPENAI_*_LIMIT` settings by default.
+            circuit_breaker (Optional[CircuitBreaker]): Breaker for upstream outages; built from the `OPENAI_CIRCUIT_*` settings by default.
+            max_retries (int): Extra attempts after a retryable failure.
+            retry_base_delay (float): First backoff step in seconds; doubled per attempt with full jitter.
+            hedge_after (float): Seconds before a second, parallel attempt is started (0 disables hedging).
+            router (Optional[ModelRouter]): Chooses the model and parameters per prompt; built from `MODEL_ROUTES` by default.
+            key_normalization (Iterable[str]): Normalizations applied to prompts before hashing them (see `utils.near_duplicates`).
+            near_duplicate_threshold (float): Similarity at which a cached answer to a similar prompt is reused (0 disables).
         """
         self.api_key = api_key
+        self.base_url = base_url
+        self._http_client = http_client
+        self.client: Optional[openai.AsyncOpenAI] = None
+        # Identical prompts that miss the cache at the same time share one upstream call
+        self.in_flight = SingleFlight()
+        # Upstream calls wait here for their share of the RPM/TPM budget
+        self.rate_limiter = rate_limiter if rate_limiter is not None else create_rate_limiter()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker(
+            failure_threshold=OPENAI_CIRCUIT_FAILURE_THRESHOLD, reset_timeout=OPENAI_CIRCUIT_RESET_SECONDS
+        )
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.hedge_after = hedge_after
+        self.router = router if router is not None else ModelRouter.from_config(MODEL_ROUTES)
+        self.key_normalization = tuple(key_normalization)
+        # Fingerprints of cached prompts, for answering near-duplicates from the cache
+        self.near_duplicates = SimHashIndex(
+            max_distance=max_distance_for(near_duplicate_threshold), max_entries=NEAR_DUPLICATE_MAX_ENTRIES
+        ) if near_duplicate_threshold > 0 else None
+        self.near_duplicate_hits = 0
+        self.near_duplicate_misses = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.stale_served = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+
+    async def startup(self) -> None:
+        """
+        Creates the async OpenAI client and its pooled HTTP connections.
+        """
+        if self.client is None:
+            if self._http_client is None:
+                self._http_client = create_http_client()
+            # Retries are done by `_call_upstream`, which coordinates them with the rate limiter and circuit breaker
+            self.client = openai.AsyncOpenAI(
+                api_key=self.api_key, base_url=self.base_url, http_client=self._http_client, max_retries=0
+            )
+
+    async def close(self) -> None:
+        """
+        Closes the async OpenAI client and releases its pooled connections.
+        """
+        if self.client is not None:
+            await self.client.close()
+        elif self._http_client is not None:
+            await self._http_client.aclose()
+        self.client = None
+        self._http_client = None
+
+    def route(self, text: str, hint: Optional[str] = None, max_tokens: Optional[int] = None) -> RouteChoice:
+        """
+        Chooses the model and parameters for a prompt (see `ModelRouter.choose`).
+
+        Args:
+            text (str): The user's text request.
+            hint (Optional[str]): The request's routing hint.
+            max_tokens (Optional[int]): The request's limit on the answer length.
+
+        Returns:
+            RouteChoice: Pass it to `generate_response`, `prompt_hash` and `model_name` for the same prompt.
+        """
+        return self.router.choose(text, hint, max_tokens)
 
-    async def generate_response(self, text: str) -> str:
+    async def generate_response(self, text: str, choice: Optional[RouteChoice] = None) -> str:
         """
         Processes a user text request and generates a response using OpenAI's API.
 
         Args:
             text (str): The user's text request.
+            choice (Optional[RouteChoice]): The route from `route()`; chosen here if not given.
 
         Returns:
             str: The response generated by OpenAI.
@@ -54,91 +241,684 @@ class OpenAI:
         Raises:
             HTTPException: If an error occurs during API communication.
         """
-        # 1. Check for cached responses:
-        cached_response = self._get_cached_response(text)
+        choice = choice or self.route(text)
+        key = self.cache_key(text, choice)
+
+        # 1. Check for cached responses, then for cached answers to near-duplicate prompts:
+        cached_response = self._get_cached_response(key) or self._get_near_duplicate_response(text, choice)
         if cached_response:
             return cached_response
 
-        # 2. Send the request to OpenAI API:
+        # 2. Join an identical request already in flight, or become its leader:
+        return await self.in_flight.do(key, lambda: self._fetch_response(text, choice))
+
+    async def _fetch_response(self, text: str, choice: Optional[RouteChoice] = None) -> str:
+        """
+        Resolves a prompt that missed the in-memory cache, from stored requests or the OpenAI API.
+
+        Args:
+            text (str): The user's text request.
+            choice (Optional[RouteChoice]): The route to answer it with.
+
+        Returns:
+            str: The response generated by OpenAI.
+
+        Raises:
+            HTTPException: If an error occurs during API communication.
+        """
+        choice = choice or self.route(text)
+
+        # 1. Reuse a fresh stored answer for the same prompt:
+        stored_response = await self._get_stored_response(text, choice)
+        if stored_response is not None:
+            self._cache_response(self.cache_key(text, choice), stored_response, text, choice)
+            return stored_response
+
+        # 2. Send the request to OpenAI API (rate-limited, retried and hedged), or fall back to a stale answer:
+        await self.startup()
+        params = self._completion_params(text, choice)
+        estimated_tokens = self._estimate_tokens(params)
         try:
-            response = await openai_service.chat.completions.create(
-                model="gpt-3.5-turbo",  # Choose the OpenAI model
-                messages=[
-                    {"role": "user", "content": text}  # Format the user request
-                ],
-                temperature=0.7,  # Adjust the creativity of the response
-                max_tokens=1000,  # Limit the length of the response
-            )
-        except OpenAIError as e:
-            raise HTTPException(status_code=500, detail=f"OpenAI API request failed: {e}")
+            response = await self._call_upstream(params, estimated_tokens, hedge=True, route=choice.route)
+        except (CircuitOpenError, OpenAIError) as e:
+            return await self._fallback_response(text, e, choice)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
 
-        # 3. Format and return the response:
+        # 3. Give back the part of the token estimate the call did not use:
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.total_tokens:
+            self.rate_limiter.refund(estimated_tokens - usage.total_tokens)
+
+        # 4. Format and return the response:
         formatted_response = self._format_response(response)
 
-        # 4. Cache the response for future use:
-        self._cache_response(text, formatted_response)
+        # 5. Cache the response for future use:
+        self._cache_response(self.cache_key(text, choice), formatted_response, text, choice)
 
         return formatted_response
 
-    def _get_cached_response(self, text: str) -> Optional[str]:
+    async def generate_responses(
+        self,
+        texts: Iterable[str],
+        max_concurrency: int = 8,
+        choice: Optional[RouteChoice] = None,
+    ) -> Dict[str, Union[str, Exception]]:
         """
-        Retrieves a cached response based on the user request text.
+        Generates responses for many user text requests at once.
+
+        Identical texts are handled once, the cache is checked once per unique text, and
+        uncached texts are sent to OpenAI with at most `max_concurrency` calls in flight.
+        A failure for one text does not affect the others.
+
+        Args:
+            texts (Iterable[str]): The user's text requests (duplicates allowed).
+            max_concurrency (int): Maximum number of concurrent upstream calls.
+            choice (Optional[RouteChoice]): One route for every text; otherwise each text is routed on its own.
+
+        Returns:
+            Dict[str, Union[str, Exception]]: The response, or the raised exception, for each unique text.
+        """
+        results: Dict[str, Union[str, Exception]] = {}
+        uncached = []
+        for text in dict.fromkeys(texts):
+            text_choice = choice or self.route(text)
+            cached_response = self._get_cached_response(self.cache_key(text, text_choice)) or self._get_near_duplicate_response(text, text_choice)
+            if cached_response:
+                results[text] = cached_response
+            else:
+                uncached.append((text, text_choice))
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(text: str, text_choice: RouteChoice) -> str:
+            async with semaphore:
+                return await self.in_flight.do(self.cache_key(text, text_choice), lambda: self._fetch_response(text, text_choice))
+
+        outcomes = await asyncio.gather(*(fetch(text, text_choice) for text, text_choice in uncached), return_exceptions=True)
+        results.update(zip((text for text, _ in uncached), outcomes))
+        return results
+
+    async def stream_response(self, text: str, choice: Optional[RouteChoice] = None) -> AsyncIterator[str]:
+        """
+        Streams a response to a user text request as it is generated.
+
+        Cached responses are yielded as a single chunk. Otherwise the OpenAI stream's
+        content deltas are yielded as they arrive, and the full text is cached once the
+        stream completes. Closing the generator early (e.g. on client disconnect) closes
+        the upstream HTTP response, cancelling the generation.
 
         Args:
             text (str): The user's text request.
+            choice (Optional[RouteChoice]): The route from `route()`; chosen here if not given.
+
+        Yields:
+            str: Successive pieces of the response text.
+
+        Raises:
+            HTTPException: If an error occurs during API communication.
+        """
+        choice = choice or self.route(text)
+        key = self.cache_key(text, choice)
+
+        # 1. Check for cached, near-duplicate or stored responses:
+        cached_response = self._get_cached_response(key) or self._get_near_duplicate_response(text, choice)
+        if cached_response is None:
+            cached_response = await self._get_stored_response(text, choice)
+            if cached_response is not None:
+                self._cache_response(key, cached_response, text, choice)
+        if cached_response:
+            yield cached_response
+            return
+
+        # 2. Open the streaming request to OpenAI API (rate-limited and retried), or fall back to a stale answer:
+        await self.startup()
+        params = self._completion_params(text, choice)
+        try:
+            stream = await self._call_upstream({**params, "stream": True}, self._estimate_tokens(params), route=choice.route)
+        except (CircuitOpenError, OpenAIError) as e:
+            yield await self._fallback_response(text, e, choice)
+            return
+
+        # 3. Forward deltas while building up the full text:
+        parts = []
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except OpenAIError as e:
+            raise HTTPException(status_code=500, detail=f"OpenAI API request failed: {e}")
+        finally:
+            await stream.close()
+
+        # 4. Cache the completed response for future use:
+        self._cache_response(key, "".join(parts), text, choice)
+
+    def stats(self) -> dict:
+        """
+        Returns cache and request-coalescing counters for this service.
+
+        `cache` is the in-memory (L1) tier and `l2_cache` the stored-requests tier, which is
+        only consulted on L1 misses. `near_duplicates` counts L1 misses answered from the cache
+        entry of a similar prompt. `single_flight.coalesced` is the number of upstream calls
+        saved by sharing an in-flight request.
+        """
+        l2_lookups = self.l2_hits + self.l2_misses
+        return {
+            "cache": CACHE.stats(),
+            "l2_cache": {
+                "hits": self.l2_hits,
+                "misses": self.l2_misses,
+                "errors": self.l2_errors,
+                "hit_ratio": self.l2_hits / l2_lookups if l2_lookups else 0.0,
+                "ttl_seconds": L2_CACHE_TTL_SECONDS,
+            },
+            "near_duplicates": self._near_duplicate_stats(),
+            "single_flight": self.in_flight.stats(),
+            "rate_limit": self.rate_limiter.stats(),
+            "routing": self.router.stats(),
+            "resilience": {
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "stale_served": self.stale_served,
+                "circuit": self.circuit_breaker.stats(),
+            },
+        }
+
+    def prompt_hash(self, text: str, choice: Optional[RouteChoice] = None) -> str:
+        """
+        Hashes a prompt together with the completion parameters used to answer it.
+
+        Stored as `Request.prompt_hash`, so a stored answer is only reused for the same
+        prompt sent with the same model settings. The prompt is normalized first when
+        `CACHE_KEY_NORMALIZATION` is set, so prompts equal after it share answers.
+
+        Args:
+            text (str): The user's text request.
+            choice (Optional[RouteChoice]): The route answering it; chosen here if not given.
 
         Returns:
-            Optional[str]: The cached response if found, otherwise None.
+            str: The hex SHA-256 digest.
+        """
+        choice = choice or self.route(text)
+        if self.key_normalization:
+            text = normalize_prompt(text, self.key_normalization)
+        params = self._completion_params(text, choice)
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def cache_key(self, text: str, choice: Optional[RouteChoice] = None) -> str:
+        """
+        Returns the in-memory cache and single-flight key of a prompt: its `prompt_hash`.
+
+        Answers from different models or parameters never share an entry.
+        """
+        return self.prompt_hash(text, choice)
+
+    def is_cached(self, text: str, choice: Optional[RouteChoice] = None) -> bool:
+        """
+        Returns whether a prompt would be answered from the in-memory cache, without counting a lookup.
+        """
+        return self.cache_key(text, choice) in CACHE
+
+    def model_name(self, text: str, choice: Optional[RouteChoice] = None) -> str:
+        """
+        Returns the model used to answer a prompt (stored as `Request.model`).
+        """
+        return self._completion_params(text, choice)["model"]
+
+    async def _get_stored_response(self, text: str, choice: Optional[RouteChoice] = None) -> Optional[str]:
+        """
+        Looks up the most recent fresh stored answer for a prompt (the L2 cache tier).
+
+        Database errors are counted and treated as misses, so the L2 tier can never fail a request.
+
+        Args:
+            text (str): The user's text request.
+            choice (Optional[RouteChoice]): The route answering it.
+
+        Returns:
+            Optional[str]: The stored response if one is fresh enough, otherwise None.
+        """
+        if L2_CACHE_TTL_SECONDS <= 0:
+            return None
+        oldest = datetime.utcnow() - timedelta(seconds=L2_CACHE_TTL_SECONDS)
+        try:
+            with L2_LOOKUP_SECONDS.time():
+                async with AsyncSessionLocal() as db:
+                    row = (await db.execute(self._stored_response_query(text, oldest, choice))).first()
+            stored_response = resolve_response(*row) if row else None
+        except Exception:
+            self.l2_errors += 1
+            return None
+        if stored_response is None:
+            self.l2_misses += 1
+        else:
+            self.l2_hits += 1
+        return stored_response
+
+    async def popular_responses(self, top: int, max_age_seconds: float = L2_CACHE_TTL_SECONDS) -> list:
+        """
+        Finds the most frequent prompts stored within `max_age_seconds` and their latest answers, for pre-warming.
+
+        Prompts are grouped by `prompt_hash`, which is also the in-memory cache key, so the
+        results can be loaded into `CACHE` as they are. Each entry lives only as long as its
+        answer would still be served from storage.
+
+        Args:
+            top (int): Number of prompts.
+            max_age_seconds (float): How far back to count.
+
+        Returns:
+            list: `(cache key, response, seconds left)` tuples, least frequent first (see `LRUCache.restore`).
+        """
+        now = datetime.utcnow()
+        answered = or_(models.Request.response.isnot(None), models.Request.response_hash.isnot(None))
+        uses = func.count().label("uses")
+        popular = (
+            select(models.Request.prompt_hash, uses, func.max(models.Request.created_at).label("newest"))
+            .where(models.Request.created_at >= now - timedelta(seconds=max_age_seconds), models.Request.prompt_hash.isnot(None), answered)
+            .group_by(models.Request.prompt_hash)
+            .order_by(uses.desc())
+            .limit(top)
+            .subquery()
+        )
+        query = (
+            select(popular.c.prompt_hash, popular.c.newest, models.Request.response, models.ResponseBody.codec, models.ResponseBody.data)
+            .join(models.Request, and_(models.Request.prompt_hash == popular.c.prompt_hash, models.Request.created_at == popular.c.newest))
+            .outerjoin(models.ResponseBody, models.ResponseBody.hash == models.Request.response_hash)
+            .where(answered)
+            .order_by(popular.c.uses, popular.c.newest)
+        )
+        get_engine()  # Binds AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+        entries = {}
+        for prompt_hash, newest, inline, codec, data in rows:
+            entries.pop(prompt_hash, None)  # Keep one answer per prompt, at its most popular position
+            seconds_left = max_age_seconds - (now - newest).total_seconds()
+            entries[prompt_hash] = (prompt_hash, resolve_response(inline, codec, data), seconds_left)
+        return list(entries.values())
+
+    def load_cache_snapshot(self, path: str = CACHE_SNAPSHOT_PATH) -> int:
+        """
+        Loads the unexpired entries of a snapshot (see `save_cache_snapshot`) into the in-memory cache.
+
+        A missing or unreadable snapshot only costs the warm start, so errors are logged, not raised.
+
+        Returns:
+            int: The number of entries loaded.
+        """
+        try:
+            return load_snapshot(CACHE, path)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load the cache snapshot %s: %s", path, e)
+            return 0
+
+    def save_cache_snapshot(self, path: str = CACHE_SNAPSHOT_PATH) -> int:
+        """
+        Writes the in-memory cache to a snapshot file, for the next start of a worker.
+
+        Returns:
+            int: The number of entries saved (0 if the file could not be written).
+        """
+        try:
+            return save_snapshot(CACHE, path)
+        except OSError as e:
+            logger.warning("Could not save the cache snapshot %s: %s", path, e)
+            return 0
+
+    async def warm_cache(self, top: int = CACHE_WARM_TOP) -> int:
+        """
+        Loads the answers to the `top` most frequent recent prompts into the in-memory cache.
+
+        Returns:
+            int: The number of entries loaded.
+        """
+        if top <= 0:
+            return 0
+        return CACHE.restore(await self.popular_responses(top))
+
+    async def _get_stale_response(self, text: str, choice: Optional[RouteChoice] = None) -> Optional[str]:
+        """
+        Looks up the most recent stored answer for a prompt regardless of its age (used while upstream is down).
+
+        Args:
+            text (str): The user's text request.
+            choice (Optional[RouteChoice]): The route answering it.
+
+        Returns:
+            Optional[str]: The stored response, or None if there is none or the database is unavailable.
         """
-        global CACHE
-        cache_key = text
-        if cache_key in CACHE:
-            response, cached_timestamp = CACHE[cache_key]
-            if (datetime.utcnow() - cached_timestamp).total_seconds() <= CACHE_TTL_SECONDS:
-                return response
-        return None
+        try:
+            async with AsyncSessionLocal() as db:
+                row = (await db.execute(self._stored_response_query(text, choice=choice))).first()
+            return resolve_response(*row) if row else None
+        except Exception:
+            return None
+
+    def _stored_response_query(self, text: str, oldest: Optional[datetime] = None, choice: Optional[RouteChoice] = None):
+        """
+        Builds the query for the most recent stored answer to a prompt, optionally no older than `oldest`.
+
+        Selects the inline response with the codec and data of its deduplicated body, for `resolve_response`.
+        """
+        conditions = [
+            models.Request.prompt_hash == self.prompt_hash(text, choice),
+            or_(models.Request.response.isnot(None), models.Request.response_hash.isnot(None)),
+        ]
+        if not self.key_normalization:
+            conditions.append(models.Request.text == text)  # With normalization, other spellings of the prompt match too
+        if oldest is not None:
+            conditions.append(models.Request.created_at >= oldest)
+        return (
+            select(models.Request.response, models.ResponseBody.codec, models.ResponseBody.data)
+            .outerjoin(models.ResponseBody, models.ResponseBody.hash == models.Request.response_hash)
+            .where(*conditions)
+            .order_by(models.Request.created_at.desc())
+            .limit(1)
+        )
 
-    def _cache_response(self, text: str, response: str) -> None:
+    def _completion_params(self, text: str, choice: Optional[RouteChoice] = None) -> dict:
         """
-        Caches the generated response based on the user request text.
+        Builds the chat-completions request parameters for a user text request.
 
         Args:
             text (str): The user's text request.
+            choice (Optional[RouteChoice]): The model, temperature and `max_tokens` to use; chosen by the router if not given.
+
+        Returns:
+            dict: Keyword arguments for `chat.completions.create`.
+        """
+        return (choice or self.route(text)).params(text)
+
+    def _estimate_tokens(self, params: dict) -> int:
+        """
+        Estimates the tokens a completion can consume: the prompt length plus `max_tokens`.
+
+        Args:
+            params (dict): Keyword arguments for `chat.completions.create`.
+
+        Returns:
+            int: The estimated token count.
+        """
+        prompt_chars = sum(len(message["content"]) for message in params["messages"])
+        return prompt_chars // CHARS_PER_TOKEN + 1 + params.get("max_tokens", 0)
+
+    async def _call_upstream(self, params: dict, estimated_tokens: int, hedge: bool = False, route: Optional[str] = None):
+        """
+        Calls chat completions behind the circuit breaker, retrying transient failures.
+
+        Each attempt waits for the rate limiter. Retryable failures are retried up to
+        `max_retries` times after a full-jitter exponential backoff; after a 429 the rate
+        limiter is paused for the upstream's Retry-After instead. Connection errors, timeouts
+        and 5xx count towards opening the circuit; any other answer from upstream closes it.
+
+        Args:
+            params (dict): Keyword arguments for `chat.completions.create`.
+            estimated_tokens (int): Token estimate reserved from the rate limiter per attempt.
+            hedge (bool): Race a second attempt against a slow first one (if `hedge_after` is set).
+            route (Optional[str]): The model route the call is made for, fed back to the router.
+
+        Returns:
+            The `ChatCompletion` (or stream) returned by the OpenAI client.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            OpenAIError: The last error once retries are exhausted, or any non-retryable error.
+            HTTPException: 503 if the rate-limit queue timed out.
+        """
+        attempt = 0
+        while True:
+            self.circuit_breaker.check()
+            try:
+                if hedge and self.hedge_after > 0:
+                    response = await self._hedged_attempt(params, estimated_tokens, route)
+                else:
+                    response = await self._attempt(params, estimated_tokens, route)
+            except OpenAIError as e:
+                if isinstance(e, openai.RateLimitError):
+                    self.circuit_breaker.release()
+                    self.rate_limiter.backoff(self._retry_after(e))
+                    delay = 0.0  # The paused rate limiter holds the next attempt
+                elif is_retryable_error(e):
+                    self.circuit_breaker.record_failure()
+                    delay = random.uniform(0, min(OPENAI_RETRY_MAX_DELAY_SECONDS, self.retry_base_delay * 2 ** attempt))
+                else:
+                    self.circuit_breaker.record_success()  # Upstream is up; the request itself was rejected
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.circuit_breaker.release()
+                raise
+            self.circuit_breaker.record_success()
+            return response
+
+    async def _attempt(self, params: dict, estimated_tokens: int, route: Optional[str] = None):
+        """
+        Makes one rate-limited chat-completions call, recording its latency and token usage (also per route).
+        """
+        await self._acquire_rate_limit(estimated_tokens)
+        OPENAI_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            with (UPSTREAM_STREAM_OPEN_SECONDS if params.get("stream") else UPSTREAM_SECONDS).time():
+                response = await self.client.chat.completions.create(**params)
+        finally:
+            OPENAI_REQUESTS_IN_FLIGHT.dec()
+        latency = time.perf_counter() - started
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            PROMPT_TOKENS.inc(usage.prompt_tokens)
+            COMPLETION_TOKENS.inc(usage.completion_tokens)
+        if route is not None:
+            choices = getattr(response, "choices", None)
+            self.router.record(
+                route,
+                None if params.get("stream") else latency,
+                prompt_tokens=usage.prompt_tokens if usage is not None else 0,
+                completion_tokens=usage.completion_tokens if usage is not None else 0,
+                truncated=bool(choices) and getattr(choices[0], "finish_reason", None) == "length",
+            )
+        return response
+
+    async def _hedged_attempt(self, params: dict, estimated_tokens: int, route: Optional[str] = None):
+        """
+        Makes one call and, if it has not finished after `hedge_after` seconds, a second identical one.
+
+        The first successful answer wins and the other call is cancelled. If both fail, the
+        first failure is raised.
+        """
+        first = asyncio.ensure_future(self._attempt(params, estimated_tokens, route))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return first.result()
+            self.hedges += 1
+            second = asyncio.ensure_future(self._attempt(params, estimated_tokens, route))
+            pending.add(second)
+            errors = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    errors[task] = task.exception()
+            raise errors.get(first, errors.get(second))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fallback_response(self, text: str, error: Exception, choice: Optional[RouteChoice] = None) -> str:
+        """
+        Answers with a stale stored response while upstream is unavailable, or raises the matching HTTP error.
+
+        Args:
+            text (str): The user's text request.
+            error (Exception): The `CircuitOpenError` or `OpenAIError` from `_call_upstream`.
+            choice (Optional[RouteChoice]): The route the prompt was sent with.
+
+        Returns:
+            str: The most recent stored answer for the prompt, however old.
+
+        Raises:
+            HTTPException: 503 if the circuit is open or upstream is rate limiting, 500 for other errors.
+        """
+        if isinstance(error, CircuitOpenError) or is_retryable_error(error):
+            stale_response = await self._get_stale_response(text, choice)
+            if stale_response is not None:
+                self.stale_served += 1
+                return stale_response
+        if isinstance(error, CircuitOpenError):
+            raise HTTPException(
+                status_code=503,
+                detail="OpenAI API temporarily unavailable, please retry.",
+                headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+            )
+        if isinstance(error, openai.RateLimitError):
+            raise self._upstream_rate_limited(error)
+        raise HTTPException(status_code=500, detail=f"OpenAI API request failed: {error}")
+
+    def _retry_after(self, error: "openai.APIStatusError") -> float:
+        """
+        Reads the upstream's Retry-After header in seconds (1 if missing or unparsable).
+        """
+        try:
+            return float(error.response.headers.get("retry-after", "1"))
+        except ValueError:
+            return 1.0
+
+    async def _acquire_rate_limit(self, tokens: int) -> None:
+        """
+        Waits for this call's share of the RPM/TPM budget.
+
+        Raises:
+            HTTPException: 503 if the call queued longer than the limiter's `max_wait`.
+        """
+        try:
+            with RATE_LIMIT_WAIT_SECONDS.time():
+                await self.rate_limiter.acquire(tokens)
+        except RateLimitTimeout:
+            raise HTTPException(status_code=503, detail="OpenAI rate limit reached, please retry.", headers={"Retry-After": "1"})
+
+    def _upstream_rate_limited(self, error: "openai.RateLimitError") -> HTTPException:
+        """
+        Builds the 503 returned to the caller when upstream is still rate limiting after the retries.
+
+        Args:
+            error (openai.RateLimitError): The error raised by the OpenAI client.
+
+        Returns:
+            HTTPException: A 503 carrying the upstream's Retry-After.
+        """
+        retry_after = self._retry_after(error)
+        return HTTPException(
+            status_code=503,
+            detail=f"OpenAI API rate limit exceeded: {error}",
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+
+    def _get_cached_response(self, key: str) -> Optional[str]:
+        """
+        Retrieves a cached response.
+
+        Args:
+            key (str): The prompt's `cache_key`.
+
+        Returns:
+            Optional[str]: The cached response if found, otherwise None.
+        """
+        with CACHE_LOOKUP_SECONDS.time():
+            return CACHE.get(key)
+
+    def _cache_response(self, key: str, response: str, text: Optional[str] = None, choice: Optional[RouteChoice] = None) -> None:
+        """
+        Caches the generated response.
+
+        The cache evicts least-recently-used and expired entries itself, so no cleanup pass is needed.
+
+        Args:
+            key (str): The prompt's `cache_key`.
             response (str): The generated response from OpenAI.
+            text (Optional[str]): The prompt, indexed for near-duplicate lookups when given.
+            choice (Optional[RouteChoice]): The route that answered it.
+        """
+        CACHE.set(key, response)
+        if self.near_duplicates is not None and text is not None and len(text) >= NEAR_DUPLICATE_MIN_CHARS:
+            self.near_duplicates.add(key, simhash(text), choice or self.route(text))
+
+    def _get_near_duplicate_response(self, text: str, choice: RouteChoice) -> Optional[str]:
         """
-        global CACHE
-        cache_key = text
-        CACHE[cache_key] = (response, datetime.utcnow())
-        if len(CACHE) > CACHE_MAX_SIZE:
-            self._cleanup_cache()
+        Returns the cached answer to the most similar indexed prompt of the same route, if one is within the threshold.
+
+        Index entries whose answer has left the cache are dropped when found.
+        """
+        if self.near_duplicates is None or len(text) < NEAR_DUPLICATE_MIN_CHARS:
+            return None
+        match = self.near_duplicates.find(simhash(text), choice)
+        response = CACHE.peek(match[0]) if match is not None else None  # The exact lookup already counted a miss
+        if response is None:
+            if match is not None:
+                self.near_duplicates.remove(match[0])
+            self.near_duplicate_misses += 1
+            return None
+        self.near_duplicate_hits += 1
+        return response
+
+    def _near_duplicate_stats(self) -> dict:
+        lookups = self.near_duplicate_hits + self.near_duplicate_misses
+        return {
+            "enabled": self.near_duplicates is not None,
+            "normalization": list(self.key_normalization),
+            "hits": self.near_duplicate_hits,
+            "misses": self.near_duplicate_misses,
+            "hit_ratio": self.near_duplicate_hits / lookups if lookups else 0.0,
+            **(self.near_duplicates.stats() if self.near_duplicates is not None else {}),
+        }
 
     def _cleanup_cache(self) -> None:
         """
-        Removes expired or unused cached data to manage cache size and efficiency.
+        Removes expired cached data to manage cache size and efficiency.
         """
-        global CACHE
-        for cache_key, (response, cached_timestamp) in list(CACHE.items()):
-            if (datetime.utcnow() - cached_timestamp).total_seconds() > CACHE_TTL_SECONDS:
-                del CACHE[cache_key]
+        CACHE.purge_expired()
 
-    def _format_response(self, response: dict) -> str:
+    def _format_response(self, response) -> str:
         """
         Formats the response from the OpenAI API into a user-friendly format.
 
         Args:
-            response (dict): The raw response from the OpenAI API.
+            response: The raw response from the OpenAI API (a `ChatCompletion` or its dict form).
 
         Returns:
             str: The formatted response.
         """
         if isinstance(response, str):
             return response
+        elif getattr(response, "choices", None):
+            return response.choices[0].message.content
         elif isinstance(response, dict) and "choices" in response:
             return response["choices"][0]["message"]["content"]
         else:
             return json.dumps(response, indent=2)
 
 # Create a global instance of the OpenAI service
-openai_service = OpenAI(api_key=OPENAI_API_KEY)
\ No newline at end of file
+openai_service = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+
+def get_openai_service(request: Request) -> OpenAI:
+    """
+    Returns the OpenAI service of the app serving `request` (see `main.create_app`), or the shared one for other apps.
+    """
+    return getattr(request.app.state, "openai_service", openai_service)
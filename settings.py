@@ -0,0 +1,77 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# Settings the app factory acts on at startup. The modules of the components take their
+# defaults from here, so this module imports nothing from the application itself.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./requests.db")
+DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")  # Comma-separated replica URLs; empty reads from the primary
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "true").lower() in ("1", "true", "yes")  # Run schema setup (create tables, add missing columns, search index) when a worker starts
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # Override for the OpenAI API base URL
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))  # Background workers per process; 0 answers every request synchronously
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "")  # Saved on shutdown and loaded on startup; empty disables
+CACHE_WARM_TOP = int(os.getenv("CACHE_WARM_TOP", "0"))  # Most frequent recent prompts loaded from storage on startup; 0 disables
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Fraction of requests profiled, 0..1
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "0"))  # Also profile every request slower than this; 0 disables
+
+def parse_replica_urls(value: str) -> Tuple[str, ...]:
+    """
+    Splits a comma-separated `DATABASE_REPLICA_URLS` value.
+    """
+    return tuple(url.strip() for url in value.split(",") if url.strip())
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Application-level settings passed to `main.create_app`.
+
+    Tuning knobs of the individual components (pool sizes, cache limits, retries, ...)
+    stay with their modules; these are the ones the app factory acts on. Each app gets
+    its own components built from them (see `main.create_app`).
+
+    Attributes:
+        database_url (str): Database the shared engine connects to.
+        replica_urls (Tuple[str, ...]): Read replicas for the read-only endpoints.
+        openai_api_key (Optional[str]): OpenAI API key for the shared service.
+        openai_base_url (Optional[str]): Override for the OpenAI API base URL.
+        init_db (bool): Run `init_db` at startup; turn off when schema changes are applied separately.
+        write_behind_enabled (bool): Start the write-behind flusher.
+        job_workers (int): Background workers for asynchronous requests; 0 answers every request synchronously.
+        cache_snapshot_path (str): Response-cache snapshot loaded at startup and saved at shutdown; empty disables.
+        cache_warm_top (int): Load the answers to this many of the most frequent recent prompts at startup.
+        profile_sample_rate (float): Fraction of requests to profile; with `profile_slow_seconds` at 0 too, the profiler is not installed.
+        profile_slow_seconds (float): Profile every request at least this slow (0 disables).
+    """
+
+    database_url: str = DATABASE_URL
+    replica_urls: Tuple[str, ...] = ()
+    openai_api_key: Optional[str] = None
+    openai_base_url: Optional[str] = None
+    init_db: bool = True
+    write_behind_enabled: bool = False
+    job_workers: int = 0
+    cache_snapshot_path: str = ""
+    cache_warm_top: int = 0
+    profile_sample_rate: float = 0.0
+    profile_slow_seconds: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """
+        Reads the settings from the environment (load the `.env` file first).
+        """
+        return cls(
+            database_url=DATABASE_URL,
+            replica_urls=parse_replica_urls(DATABASE_REPLICA_URLS),
+            openai_api_key=OPENAI_API_KEY,
+            openai_base_url=OPENAI_BASE_URL,
+            init_db=DB_INIT_ON_STARTUP,
+            write_behind_enabled=WRITE_BEHIND_ENABLED,
+            job_workers=JOB_WORKERS,
+            cache_snapshot_path=CACHE_SNAPSHOT_PATH,
+            cache_warm_top=CACHE_WARM_TOP,
+            profile_sample_rate=PROFILE_SAMPLE_RATE,
+            profile_slow_seconds=PROFILE_SLOW_SECONDS,
+        )
@@ -0,0 +1,38 @@
+"""
+Shared pytest configuration.
+
+Points the application at a throwaway SQLite database (via aiosqlite) before any
+application module is imported, and gives every test a freshly created schema.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="requests-test-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_TEST_DB_DIR, 'test.db')}"
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Base, engine, init_db  # noqa: E402
+from routers.requests import REQUEST_CACHE  # noqa: E402
+
+async def _reset_db() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    """
+    Recreates all tables before each test so tests never see each other's rows.
+
+    Requests cached in memory are dropped too, since ids start over.
+    """
+    asyncio.run(_reset_db())
+    REQUEST_CACHE.clear()
+    yield
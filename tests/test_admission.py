@@ -0,0 +1,200 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+import schemas
+from routers import requests
+from services.openai_service import CACHE, openai_service
+from utils.admission import AdmissionController, Overloaded, client_id
+
+# Tables are created for the test database in conftest.py.
+
+test_app = FastAPI()
+test_app.include_router(requests.router)
+
+def http_request(host: str = "10.0.0.1", headers=()) -> Request:
+    return Request({"type": "http", "headers": [(name.lower().encode(), value.encode()) for name, value in headers], "client": (host, 1)})
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+# Define a test function for the concurrency limits.
+@pytest.mark.asyncio
+async def test_limits_and_queue():
+    """
+    Tests that waiters get freed slots in order, and that a full queue and a client over its limit are rejected at once.
+    """
+    gate = AdmissionController(max_concurrency=1, max_per_client=2, max_queue=1, max_wait=5)
+    await gate.acquire("a")
+
+    waiter = asyncio.create_task(gate.acquire("b"))
+    await asyncio.sleep(0)
+    assert gate.stats()["waiting"] == 1
+
+    with pytest.raises(Overloaded) as queue_full:
+        await gate.acquire("c")
+    assert queue_full.value.status_code == 503
+
+    gate.release("a", held_seconds=3.0)
+    await waiter
+    assert gate.stats()["active"] == 1
+    assert gate.retry_after() == 3
+
+    gate.max_queue = 5
+    second = asyncio.create_task(gate.acquire("b"))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as client_limit:
+        await gate.acquire("b")
+    assert client_limit.value.status_code == 429
+
+    gate.release("b")
+    await second
+    gate.release("b")
+    stats = gate.stats()
+    assert (stats["active"], stats["waiting"], stats["clients"]) == (0, 0, 0)
+    assert (stats["rejected_client"], stats["rejected_queue_full"]) == (1, 1)
+
+# Define a test function for client identification.
+def test_client_header_is_only_trusted_when_enabled():
+    """
+    Tests that clients are keyed on their address unless the client header is explicitly trusted.
+    """
+    request = http_request("10.0.0.7", headers=[("X-Client-ID", "tenant-1")])
+    assert client_id(request) == "10.0.0.7"
+    assert client_id(request, trust_header=True) == "tenant-1"
+    assert client_id(http_request("10.0.0.7"), trust_header=True) == "10.0.0.7"
+
+# Define a test function for CoDel-style shedding.
+@pytest.mark.asyncio
+async def test_standing_queue_sheds_early():
+    """
+    Tests that a queue delay over the target for a whole interval switches to short waits and LIFO hand-over.
+    """
+    clock = FakeClock()
+    gate = AdmissionController(max_concurrency=1, max_wait=5, target_delay=0.05, interval=1.0, clock=clock)
+    await gate.acquire("a")
+
+    # The first interval saw an empty queue; in the second every waiter waited longer than the target
+    for client, now in (("b", 2.0), ("c", 4.0)):
+        waiter = asyncio.create_task(gate.acquire(client))
+        await asyncio.sleep(0)
+        clock.now = now
+        gate.release("a" if client == "b" else "b")
+        await waiter
+    assert gate.overloaded
+
+    # The oldest waiter is skipped in favour of the newest one, and waits only the target delay
+    oldest = asyncio.create_task(gate.acquire("d"))
+    newest = asyncio.create_task(gate.acquire("e"))
+    await asyncio.sleep(0)
+    gate.release("c")
+    await newest
+    with pytest.raises(Overloaded) as shed:
+        await oldest
+    assert shed.value.status_code == 503
+    assert gate.stats()["shed"] == 1
+
+    # A slot taken without waiting shows the queue drained
+    gate.release("e")
+    clock.now = 6.0
+    await gate.acquire("f")
+    assert not gate.overloaded
+
+# Define a test function for the HTTP edge.
+@pytest.mark.asyncio
+async def test_overloaded_generations_are_rejected_but_cache_hits_served():
+    """
+    Tests that uncached generations beyond the limit get 503 with Retry-After, while cached prompts and reads pass.
+    """
+    release = asyncio.Event()
+
+    async def slow_answer(text, choice=None):
+        await release.wait()
+        return f"Answer to {text}"
+
+    gate = AdmissionController(max_concurrency=1, max_queue=0)
+    CACHE.set(openai_service.cache_key("Cached"), "From cache")
+    transport = httpx.ASGITransport(app=test_app)
+    with patch.object(requests, "admission", gate), patch.object(openai_service, "_fetch_response", slow_answer):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            busy = asyncio.create_task(client.post("/", json={"text": "Slow"}))
+            while gate.stats()["active"] == 0:
+                await asyncio.sleep(0.01)
+
+            rejected = await client.post("/", json={"text": "Another"})
+            assert rejected.status_code == 503
+            assert rejected.headers["retry-after"] == "1"
+
+            cached = await client.post("/", json={"text": "Cached"})
+            assert cached.status_code == 200
+            assert cached.json()["response"] == "From cache"
+            assert gate.stats()["active"] == 1
+
+            release.set()
+            created = await busy
+            assert created.status_code == 200
+            assert (await client.get(f"/{created.json()['id']}")).status_code == 200
+
+    stats = gate.stats()
+    assert (stats["admitted"], stats["bypassed"], stats["rejected_queue_full"], stats["active"]) == (1, 1, 1, 0)
+
+# Define a test function for a stream cancelled before its first delta.
+@pytest.mark.asyncio
+async def test_stream_cancelled_before_first_chunk_releases_slot():
+    """
+    Tests that cancelling POST /requests/stream while it waits for the first delta frees its slot.
+    """
+    started = asyncio.Event()
+
+    async def never_answers(text, choice=None):
+        started.set()
+        await asyncio.Event().wait()
+        yield "unreachable"
+
+    gate = AdmissionController(max_concurrency=1, max_per_client=1)
+    with patch.object(requests, "admission", gate), patch.object(openai_service, "stream_response", never_answers):
+        handler = asyncio.create_task(requests.create_request_stream(schemas.RequestCreate(text="Uncached"), http_request(), openai_service))
+        await started.wait()
+        assert gate.stats()["active"] == 1
+        handler.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await handler
+    assert (gate.stats()["active"], gate.stats()["clients"]) == (0, 0)
+
+# Define a test function for a client gone before the body starts.
+@pytest.mark.asyncio
+async def test_stream_disconnect_before_body_releases_slot():
+    """
+    Tests that a client disconnecting before the streamed body starts frees the slot, although the body never runs.
+    """
+    body_started = upstream_closed = False
+
+    async def answer(text, choice=None):
+        nonlocal body_started, upstream_closed
+        try:
+            yield "first"
+            body_started = True
+            yield "second"
+        finally:
+            upstream_closed = True
+
+    async def disconnected():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await asyncio.Event().wait()  # The response start never goes out, so the body never starts
+
+    gate = AdmissionController(max_concurrency=1, max_per_client=1)
+    with patch.object(requests, "admission", gate), patch.object(openai_service, "stream_response", answer):
+        response = await requests.create_request_stream(schemas.RequestCreate(text="Uncached"), http_request(), openai_service)
+        assert gate.stats()["active"] == 1
+        await response({"type": "http"}, disconnected, send)
+    assert not body_started and upstream_closed
+    assert (gate.stats()["active"], gate.stats()["clients"]) == (0, 0)
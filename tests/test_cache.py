@@ -0,0 +1,143 @@
+"""
+Unit tests for the bounded LRU/TTL cache in `utils/cache.py`.
+"""
+
+from utils.cache import LRUCache, load_snapshot, save_snapshot
+
+class FakeClock:
+    """
+    A manually advanced stand-in for `time.monotonic`.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_get_and_set():
+    """
+    Tests that stored values are returned and counted as hits, missing keys as misses.
+    """
+    cache = LRUCache(max_entries=10)
+    cache.set("a", "1")
+
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_evicts_least_recently_used_entry():
+    """
+    Tests that the entry count limit evicts the least recently used key.
+    """
+    cache = LRUCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")  # "b" is now the least recently used entry
+    cache.set("c", "3")
+
+    assert len(cache) == 2
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.evictions == 1
+
+def test_expired_entries_are_dropped_lazily():
+    """
+    Tests that entries past their TTL are treated as misses and removed on access.
+    """
+    clock = FakeClock()
+    cache = LRUCache(max_entries=10, ttl_seconds=5, clock=clock)
+    cache.set("a", "1")
+
+    clock.now = 4.9
+    assert cache.get("a") == "1"
+
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.expirations == 1
+
+def test_expired_entries_are_evicted_before_live_ones():
+    """
+    Tests that inserting past the limit drops expired entries at the LRU end before live entries.
+    """
+    clock = FakeClock()
+    cache = LRUCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.set("old", "1", ttl_seconds=1)
+    cache.set("live", "2")
+
+    clock.now = 2
+    cache.set("new", "3")
+
+    assert "live" in cache
+    assert "new" in cache
+    assert cache.expirations == 1
+    assert cache.evictions == 0
+
+def test_byte_size_limit():
+    """
+    Tests that the byte limit evicts entries and rejects values larger than the whole cache.
+    """
+    cache = LRUCache(max_entries=None, max_bytes=10)
+    cache.set("a", "1234")  # 5 bytes
+    cache.set("b", "1234")  # 10 bytes total
+    cache.set("c", "1234")  # evicts "a"
+
+    assert "a" not in cache
+    assert cache.current_bytes == 10
+
+    cache.set("d", "x" * 20)
+    assert "d" not in cache
+    assert cache.current_bytes == 10
+
+def test_oversized_overwrite_removes_old_value():
+    """
+    Tests that replacing a value with one too large to cache drops the old value instead of keeping it.
+    """
+    cache = LRUCache(max_entries=None, max_bytes=20)
+    cache.set("k", "old")
+    cache.set("k", "x" * 100)
+
+    assert cache.get("k") is None
+    assert cache.current_bytes == 0
+
+def test_overwrite_updates_size_and_recency():
+    """
+    Tests that re-setting a key replaces its value and size accounting.
+    """
+    cache = LRUCache(max_entries=None, max_bytes=100)
+    cache.set("a", "1")
+    cache.set("a", "12345")
+
+    assert cache.get("a") == "12345"
+    assert len(cache) == 1
+    assert cache.current_bytes == 6
+
+def test_snapshot_round_trip(tmp_path):
+    """
+    Tests that a saved snapshot restores live entries in recency order with their remaining lifetime, and drops expired ones.
+    """
+    clock = FakeClock()
+    cache = LRUCache(max_entries=10, ttl_seconds=100, clock=clock)
+    cache.set("short", "1", ttl_seconds=10)
+    cache.set("a", "2")
+    cache.set("b", "3")
+    cache.get("a")  # "a" is now the most recently used entry
+    clock.now = 20  # "short" has expired
+    path = str(tmp_path / "snapshot.gz")
+
+    assert save_snapshot(cache, path) == 2
+
+    restored_clock = FakeClock()
+    restored = LRUCache(max_entries=10, ttl_seconds=50, clock=restored_clock)
+    assert load_snapshot(restored, path) == 2
+    assert [key for key, _, _ in restored.snapshot()] == ["b", "a"]
+    assert restored.peek("short") is None
+    restored_clock.now = 49
+    assert restored.peek("a") == "2"  # Capped at the new cache's TTL of 50 seconds
+    restored_clock.now = 51
+    assert restored.peek("a") is None
+
+    assert load_snapshot(restored, str(tmp_path / "missing.gz")) == 0
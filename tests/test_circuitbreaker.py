@@ -0,0 +1,81 @@
+"""
+Unit tests for the circuit breaker in `utils/circuitbreaker.py`.
+"""
+
+import pytest
+
+from utils.circuitbreaker import CircuitBreaker, CircuitOpenError
+
+class FakeClock:
+    """
+    A manually advanced stand-in for `time.monotonic`.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_opens_after_consecutive_failures():
+    """
+    Tests that the circuit opens only after `failure_threshold` failures in a row.
+    """
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=FakeClock())
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.check()
+    assert excinfo.value.retry_after == 10
+    assert breaker.stats()["opened"] == 1
+
+def test_half_open_lets_one_trial_through():
+    """
+    Tests that after the reset timeout a single trial call is allowed, and its failure re-opens the circuit.
+    """
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.check()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now = 20
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_released_trial_can_be_retried():
+    """
+    Tests that a half-open trial that ended without an outcome does not block the next trial.
+    """
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+
+    breaker.check()
+    breaker.release()
+    breaker.check()
+
+def test_zero_threshold_disables_the_breaker():
+    """
+    Tests that a threshold of 0 never opens the circuit.
+    """
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(100):
+        breaker.record_failure()
+
+    breaker.check()
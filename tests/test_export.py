@@ -0,0 +1,90 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+from click.testing import CliRunner
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import cli
+import models
+from database import AsyncSessionLocal, engine
+from database.export import EXPORT_COLUMNS, export_stream
+from routers import requests
+
+# Tables are created for the test database in conftest.py.
+
+test_app = FastAPI()
+test_app.include_router(requests.router)
+client = TestClient(test_app)
+
+def _store_requests(count):
+    async def store():
+        async with AsyncSessionLocal() as db:
+            db.add_all(
+                models.Request(request_key=f"key-{i}", text=f'Prompt {i}, with "quotes"\nand a newline', response=f"Answer {i}", created_at=datetime(2024, 1, 1 + i))
+                for i in range(count)
+            )
+            await db.commit()
+
+    asyncio.run(store())
+
+# Define a test function for exporting as NDJSON.
+def test_export_ndjson_in_chunks():
+    """
+    Tests that the export streams every row in id order, one piece per chunk of rows.
+    """
+    _store_requests(5)
+
+    async def collect():
+        return [piece async for piece in export_stream(engine, "ndjson", chunk_size=2)]
+
+    pieces = asyncio.run(collect())
+    rows = [json.loads(line) for line in b"".join(pieces).splitlines()]
+
+    assert len(pieces) == 3
+    assert [row["id"] for row in rows] == [1, 2, 3, 4, 5]
+    assert set(rows[0]) == set(EXPORT_COLUMNS)
+    assert rows[0]["text"] == 'Prompt 0, with "quotes"\nand a newline'
+    assert rows[0]["created_at"] == "2024-01-01T00:00:00"
+
+# Define a test function for the export endpoint.
+def test_export_endpoint_csv_gzip_incremental():
+    """
+    Tests GET /requests/export as gzipped CSV, with `since_id` and `since` filters.
+    """
+    _store_requests(4)
+
+    response = client.get("/export", params={"format": "csv", "gzip": "true", "since_id": 1})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="requests.csv.gz"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert [row["id"] for row in rows] == ["2", "3", "4"]
+    assert rows[0]["text"] == 'Prompt 1, with "quotes"\nand a newline'
+
+    response = client.get("/export", params={"since": "2024-01-03T00:00:00Z"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [3, 4]
+
+    empty = client.get("/export", params={"format": "csv", "since_id": 100})
+    assert empty.text.splitlines() == [",".join(EXPORT_COLUMNS)]
+
+    assert client.get("/export", params={"format": "xml"}).status_code == 422
+
+# Define a test function for the export command.
+def test_export_cli(tmp_path):
+    """
+    Tests that `cli.py export` writes the file and reports the last id for the next incremental run.
+    """
+    _store_requests(3)
+    output = tmp_path / "requests.ndjson.gz"
+
+    result = CliRunner().invoke(cli.cli, ["export", "--gzip", "--output", str(output), "--chunk-size", "2"])
+
+    assert result.exit_code == 0, result.output
+    assert "Exported 3 rows (last id: 3)" in result.output
+    assert [json.loads(line)["id"] for line in gzip.decompress(output.read_bytes()).splitlines()] == [1, 2, 3]
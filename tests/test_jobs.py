@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import models
+from database import AsyncSessionLocal
+from routers import requests
+from services.jobs import FAILED, RUNNING, JobWorkers, jobs
+from services.openai_service import openai_service
+
+# Tables are created for the test database in conftest.py.
+
+# The workers must live on the same event loop as the handlers, so run them from the app's lifespan.
+jobs_app = FastAPI(on_startup=[lambda: jobs.start(2)], on_shutdown=[jobs.stop])
+jobs_app.include_router(requests.router)
+
+ASYNC = {"Prefer": "respond-async"}
+
+# Define a test function for the asynchronous mode.
+def test_async_request_is_answered_in_background():
+    """
+    Tests that POST returns 202 with a pending request, and that a long-poll returns it once a worker has answered it.
+    """
+    async def slow_answer(text, choice=None):
+        await asyncio.sleep(0.2)
+        return f"Answer to {text}"
+
+    with patch.object(openai_service, "generate_response", slow_answer):
+        with TestClient(jobs_app) as client:
+            response = client.post("/", json={"text": "Take your time"}, headers=ASYNC)
+            assert response.status_code == 202
+            assert response.headers["preference-applied"] == "respond-async"
+            data = response.json()
+            assert data["status"] == "pending"
+            assert data["response"] is None
+            assert response.headers["location"].endswith(f"/{data['id']}")
+
+            unfinished = client.get(f"/{data['id']}", headers={"If-None-Match": f'"{data["id"]}-0000000000000000"'})
+            assert unfinished.status_code == 200
+            assert unfinished.json()["status"] in ("pending", "running")
+            assert unfinished.headers["cache-control"] == "no-store"
+            assert "etag" not in unfinished.headers
+
+            finished = client.get(f"/{data['id']}", params={"wait": 5})
+            assert finished.json()["status"] == "done"
+            assert finished.json()["response"] == "Answer to Take your time"
+            assert "etag" in finished.headers
+            assert jobs.stats()["completed"] >= 1
+
+# Define a test function for failed asynchronous requests.
+def test_async_request_failure_is_reported():
+    """
+    Tests that a request whose generation fails ends up `failed` with the error.
+    """
+    with patch.object(openai_service, "generate_response", side_effect=HTTPException(status_code=503, detail="Upstream unavailable")):
+        with TestClient(jobs_app) as client:
+            request_id = client.post("/", json={"text": "Doomed"}, headers=ASYNC).json()["id"]
+            data = client.get(f"/{request_id}", params={"wait": 5}).json()
+            assert data["status"] == "failed"
+            assert data["error"] == "Upstream unavailable"
+
+# Define a test function for the synchronous fallback.
+def test_prefer_async_is_ignored_without_workers():
+    """
+    Tests that without running workers, `Prefer: respond-async` is answered synchronously.
+    """
+    with patch.object(openai_service, "generate_response", return_value="Right away"):
+        response = TestClient(jobs_app).post("/", json={"text": "Now please"}, headers=ASYNC)
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+    assert response.json()["response"] == "Right away"
+
+# Define a test function for expired leases.
+@pytest.mark.asyncio
+async def test_expired_leases_are_claimed_again():
+    """
+    Tests that rows whose worker disappeared are claimed again after the lease, and given up after the last attempt.
+    """
+    old = datetime.utcnow() - timedelta(hours=1)
+    async with AsyncSessionLocal() as db:
+        rows = [
+            models.Request(text="Still running", created_at=old, status=RUNNING, claimed_at=datetime.utcnow(), attempts=1),
+            models.Request(text="Abandoned", created_at=old, status=RUNNING, claimed_at=old, attempts=1),
+            models.Request(text="Hopeless", created_at=old, status=RUNNING, claimed_at=old, attempts=3),
+        ]
+        db.add_all(rows)
+        await db.commit()
+
+    workers = JobWorkers(lease_seconds=60, max_attempts=3)
+    abandoned = await workers._claim()
+    assert (abandoned.text, abandoned.attempts) == ("Abandoned", 2)
+
+    hopeless = await workers._claim()
+    await workers._process(hopeless)
+    assert await workers._claim() is None
+    assert workers.stats()["reclaimed"] == 2
+
+    async with AsyncSessionLocal() as db:
+        row = await db.get(models.Request, rows[2].id)
+        assert row.status == FAILED
+        assert row.error == "Gave up after 3 attempts"
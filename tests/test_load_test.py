@@ -0,0 +1,91 @@
+"""
+Smoke tests for the benchmark harness in `benchmarks/` (fake upstream and load-test helpers).
+"""
+
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from load_test import LoadResult, percentile, prompt_sampler  # noqa: E402
+from services import openai_service as openai_service_module  # noqa: E402
+from services.openai_service import OpenAI, create_http_client  # noqa: E402
+
+def service_for(fake: FakeOpenAI) -> OpenAI:
+    return OpenAI(
+        api_key="sk-fake",
+        base_url="http://fake-openai/v1",
+        http_client=create_http_client(transport=httpx.ASGITransport(app=fake.app)),
+        retry_base_delay=0.001,
+    )
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    openai_service_module.CACHE.clear()
+    yield
+    openai_service_module.CACHE.clear()
+
+@pytest.mark.asyncio
+async def test_fake_upstream_answers_plain_and_streamed_calls():
+    """
+    Tests that the fake upstream speaks the chat-completions protocol the service expects.
+    """
+    fake = FakeOpenAI(latency_ms=1, jitter_ms=0, chunk_delay_ms=0, response_tokens=6, chunk_tokens=4)
+    service = service_for(fake)
+
+    assert await service.generate_response("alpha beta") == "alpha beta alpha beta alpha beta"
+    deltas = [delta async for delta in service.stream_response("gamma")]
+
+    assert deltas == ["gamma gamma gamma gamma ", "gamma gamma "]
+    assert fake.stats()["calls"] == 2
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_fake_upstream_injects_errors():
+    """
+    Tests that an error rate of 1 fails every call, including the service's retries.
+    """
+    fake = FakeOpenAI(latency_ms=1, jitter_ms=0, error_rate=1.0)
+    service = service_for(fake)
+
+    with pytest.raises(HTTPException):
+        await service.generate_response("doomed")
+
+    assert fake.stats()["errors"] == 1 + service.max_retries
+
+    await service.close()
+
+def test_summary_percentiles_and_error_rate():
+    """
+    Tests the nearest-rank percentiles and the error accounting of a run.
+    """
+    assert percentile([float(i) for i in range(1, 101)], 99) == 99.0
+    assert percentile([1.0], 50) == 1.0
+
+    result = LoadResult()
+    result.started, result.finished = 0.0, 2.0
+    for i in range(10):
+        result.record(0.01 * (i + 1), 200 if i else 500)
+    summary = result.summary()
+
+    assert summary["rps"] == 5.0
+    assert summary["error_rate"] == 0.1
+    assert summary["p50_ms"] == pytest.approx(50.0)
+    assert summary["statuses"] == {"200": 9, "500": 1}
+
+def test_zipf_sampler_favours_popular_prompts():
+    """
+    Tests that the prompt sampler is reproducible and skewed towards the first prompts.
+    """
+    first = prompt_sampler(100, 1.1, seed=1)
+    second = prompt_sampler(100, 1.1, seed=1)
+    texts = [first() for _ in range(2000)]
+
+    assert texts[:10] == [second() for _ in range(10)]
+    assert sum(text.startswith("Benchmark prompt number 0:") for text in texts) > 2000 / 100 * 5
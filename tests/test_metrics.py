@@ -0,0 +1,82 @@
+"""
+Unit tests for the metrics primitives in `utils/metrics.py` and the GET /metrics endpoint.
+"""
+
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from main import app
+from utils.metrics import Counter, Gauge, Histogram, Registry
+
+def test_render_counter_and_gauge():
+    """
+    Tests the text exposition of counters (with `_total`) and labelled gauges.
+    """
+    registry = Registry()
+    counter = Counter("jobs", "Jobs run.", registry=registry)
+    gauge = Gauge("queue_depth", "Items queued.", labelnames=("queue",), registry=registry)
+
+    counter.inc()
+    counter.inc(2)
+    gauge.labels(queue='high "prio"').set(4)
+
+    assert registry.render() == (
+        "# HELP jobs Jobs run.\n"
+        "# TYPE jobs counter\n"
+        "jobs_total 3\n"
+        "# HELP queue_depth Items queued.\n"
+        "# TYPE queue_depth gauge\n"
+        'queue_depth{queue="high \\"prio\\""} 4\n'
+    )
+
+def test_histogram_buckets_are_cumulative():
+    """
+    Tests that observations land in the first bucket whose bound is >= the value and buckets render cumulatively.
+    """
+    registry = Registry()
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 3.65" in lines
+    assert "latency_seconds_count 4" in lines
+
+def test_histogram_timer_observes_block_duration():
+    """
+    Tests that `time()` records one observation per block.
+    """
+    histogram = Histogram("block_seconds", "Block time.", labelnames=("stage",), registry=Registry())
+    stage = histogram.labels(stage="work")
+
+    with stage.time():
+        pass
+
+    assert stage.count == 1
+    assert 0 <= stage.sum < 0.1
+
+def test_metrics_endpoint_exposes_stages_routes_and_caches():
+    """
+    Tests that GET /metrics reports per-route latency, per-stage latency and the service's cache counters.
+    """
+    client = TestClient(app)
+    with patch.object(app.state.openai_service, "generate_response", return_value="Measured answer"):
+        assert client.post("/requests/", json={"text": "Measure me"}).status_code == 200
+    assert client.get("/requests/12345").status_code == 404
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/requests/",status="200"}' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/requests/{request_id}",status="404"}' in body
+    assert 'app_stage_duration_seconds_count{stage="db_commit"}' in body
+    assert "http_requests_in_flight 1" in body  # The scrape itself
+    assert "# TYPE response_cache_hits counter" in body
+    assert 'openai_circuit_state{state="half_open"}' in body
@@ -0,0 +1,137 @@
+"""
+Unit tests for `services/model_router.py`, and for routed calls through the OpenAI
+service against an in-process fake of the chat-completions endpoint.
+"""
+
+import json
+
+import httpx
+import pytest
+
+from services import openai_service as openai_service_module
+from services.model_router import MIN_LATENCY_SAMPLES, MIN_TOKEN_SAMPLES, ModelRouter, Route
+from services.openai_service import OpenAI, create_http_client
+
+ROUTES = [
+    Route(name="short", model="gpt-4o-mini", max_prompt_chars=20, max_tokens=256, latency_budget_seconds=1.0, fallback="default"),
+    Route(name="default", model="gpt-3.5-turbo", hints=("quality",), cost_per_1k_tokens=2.0),
+]
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Starts every test with an empty response cache.
+    """
+    openai_service_module.CACHE.clear()
+    yield
+    openai_service_module.CACHE.clear()
+
+# Define a test function for matching routes.
+def test_routes_by_length_and_hint():
+    """
+    Tests that short prompts take the short route, long ones the catch-all, and hints override the length.
+    """
+    router = ModelRouter(ROUTES)
+
+    assert router.choose("Hi").route == "short"
+    assert router.choose("Hi").model == "gpt-4o-mini"
+    assert router.choose("A prompt well over twenty characters").route == "default"
+    assert router.choose("Hi", hint="quality").route == "default"
+    assert router.choose("Hi", hint="unknown").route == "short"
+    assert router.choose("Hi", max_tokens=50).max_tokens == 50
+    assert router.choose("Hi", max_tokens=5000).max_tokens == 256
+
+# Define a test function for latency feedback.
+def test_slow_route_diverts_to_fallback():
+    """
+    Tests that a route over its latency budget sends prompts to its fallback, still probing it now and then.
+    """
+    router = ModelRouter(ROUTES, probe_every=4)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        router.record("short", 3.0)
+
+    routes = [router.choose("Hi").route for _ in range(8)]
+    assert routes.count("short") == 2
+    assert router.stats()["short"]["diverted"] == 6
+    assert router.stats()["short"]["over_budget"]
+
+    for _ in range(20):
+        router.record("short", 0.1)
+    assert router.choose("Hi").route == "short"
+
+# Define a test function for adaptive max_tokens.
+def test_adaptive_max_tokens():
+    """
+    Tests that max_tokens shrinks to fit observed answers, and grows back when answers are cut off.
+    """
+    router = ModelRouter(ROUTES, adaptive_max_tokens=True)
+    assert router.choose("Hi").max_tokens == 256
+
+    for _ in range(MIN_TOKEN_SAMPLES):
+        router.record("short", 0.1, prompt_tokens=5, completion_tokens=40)
+    assert router.choose("Hi").max_tokens == 128  # 2 x 40, rounded up to a power of two
+
+    for _ in range(MIN_TOKEN_SAMPLES):
+        router.record("short", 0.1, completion_tokens=128, truncated=True)
+    assert router.choose("Hi").max_tokens == 256
+    assert router.stats()["short"]["truncated"] == MIN_TOKEN_SAMPLES
+
+# Define a test function for the MODEL_ROUTES format.
+def test_from_config():
+    """
+    Tests parsing of the `MODEL_ROUTES` JSON and rejection of inconsistent routes.
+    """
+    router = ModelRouter.from_config(json.dumps([
+        {"name": "fast", "model": "gpt-4o-mini", "hints": ["fast"], "max_prompt_chars": 100},
+        {"name": "default"},
+    ]))
+    assert [route.name for route in router.routes] == ["fast", "default"]
+    assert router.choose("x" * 200, hint="fast").route == "fast"
+    assert [route.name for route in ModelRouter.from_config("").routes] == ["default"]
+
+    with pytest.raises(ValueError):
+        ModelRouter([Route(name="short", max_prompt_chars=10)])
+    with pytest.raises(ValueError):
+        ModelRouter([Route(name="default", fallback="missing")])
+    with pytest.raises(ValueError):
+        ModelRouter([Route(name="default"), Route(name="default")])
+
+# Define a test function for routed calls.
+@pytest.mark.asyncio
+async def test_service_routes_and_records_usage():
+    """
+    Tests that the service sends the routed model and limits, keys the cache by them, and records usage per route.
+    """
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        sent.append((body["model"], body["max_tokens"]))
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": f"From {body['model']}"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 400, "completion_tokens": 600, "total_tokens": 1000},
+        })
+
+    service = OpenAI(
+        api_key="sk-test",
+        http_client=create_http_client(transport=httpx.MockTransport(handler)),
+        router=ModelRouter(ROUTES),
+    )
+
+    assert await service.generate_response("Hi") == "From gpt-4o-mini"
+    assert await service.generate_response("Hi", service.route("Hi", hint="quality")) == "From gpt-3.5-turbo"
+    assert await service.generate_response("Hi") == "From gpt-4o-mini"  # Cached per route
+    assert sent == [("gpt-4o-mini", 256), ("gpt-3.5-turbo", 1000)]
+    assert service.cache_key("Hi", service.route("Hi")) != service.cache_key("Hi", service.route("Hi", hint="quality"))
+
+    routing = service.stats()["routing"]
+    assert routing["short"]["calls"] == 1
+    assert routing["short"]["latency_seconds"] is not None
+    assert routing["default"]["completion_tokens"] == 600
+    assert routing["default"]["cost"] == pytest.approx(2.0)
+
+    await service.close()
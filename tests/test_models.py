@@ -1,40 +1,35 @@
 import pytest
-from sqlalchemy.orm import Session
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from unittest.mock import patch  # Import for mocking OpenAI responses
 
 import models
 import schemas
-from database import get_db, engine  # Import database functions for testing
+from database import AsyncSessionLocal  # Import database functions for testing
 from services.openai_service import openai_service  # Import OpenAI service for mocking responses
 
-# Create all tables in the database (run once for the entire test suite)
-models.Base.metadata.create_all(bind=engine)
+# Tables are created once for the entire test suite in conftest.py.
 
 # Define fixture for creating a database session for each test function
-@pytest.fixture(scope="function")
-def db():
+@pytest_asyncio.fixture(scope="function")
+async def db():
     """
     Creates a database session for each test function, ensuring a clean state for each test.
 
     Yields:
-        Session: A database session for testing.
+        AsyncSession: A database session for testing.
 
     """
-    db = get_db()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # Define test function for verifying the Request model definition
-def test_request_model(db: Session):
+def test_request_model():
     """
     Tests the definition of the `Request` model, ensuring it has the expected attributes, data types, and relationships.
 
-    Args:
-        db (Session): A database session for testing.
-
     """
     assert hasattr(models.Request, "id")
     assert models.Request.id.primary_key is True
@@ -47,40 +42,43 @@ def test_request_model(db: Session):
     assert models.Request.created_at.type is datetime
 
 # Define test function for creating a new Request record
-def test_create_request(db: Session):
+@pytest.mark.asyncio
+async def test_create_request(db: AsyncSession):
     """
     Tests creating a new `Request` record in the database, verifying the record is inserted correctly.
 
     Args:
-        db (Session): A database session for testing.
+        db (AsyncSession): A database session for testing.
 
     """
     test_request_data = schemas.RequestCreate(text="Test request")
     new_request = models.Request(**test_request_data.dict(), created_at=datetime.utcnow())
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
+    await db.commit()
+    await db.refresh(new_request)
 
     assert new_request.text == test_request_data.text
     assert new_request.response is None  # Initially, response is None
     assert new_request.created_at is not None
 
 # Define test function for reading an existing Request record
-def test_read_request(db: Session):
+@pytest.mark.asyncio
+async def test_read_request(db: AsyncSession):
     """
     Tests retrieving an existing `Request` record from the database, verifying the retrieved data is correct.
 
     Args:
-        db (Session): A database session for testing.
+        db (AsyncSession): A database session for testing.
 
     """
     test_request_data = schemas.RequestCreate(text="Test request")
     new_request = models.Request(**test_request_data.dict(), created_at=datetime.utcnow())
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
+    await db.commit()
+    await db.refresh(new_request)
 
-    fetched_request = db.query(models.Request).filter(models.Request.id == new_request.id).first()
+    result = await db.execute(select(models.Request).filter(models.Request.id == new_request.id))
+    fetched_request = result.scalars().first()
 
     assert fetched_request is not None
     assert fetched_request.text == test_request_data.text
@@ -88,19 +86,20 @@ def test_read_request(db: Session):
     assert fetched_request.created_at == new_request.created_at
 
 # Define test function for updating an existing Request record
-def test_update_request(db: Session):
+@pytest.mark.asyncio
+async def test_update_request(db: AsyncSession):
     """
     Tests updating an existing `Request` record in the database, verifying the updated data is correct.
 
     Args:
-        db (Session): A database session for testing.
+        db (AsyncSession): A database session for testing.
 
     """
     test_request_data = schemas.RequestCreate(text="Test request")
     new_request = models.Request(**test_request_data.dict(), created_at=datetime.utcnow())
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
+    await db.commit()
+    await db.refresh(new_request)
 
     # Mock OpenAI response for testing
     mock_response = "This is a mock response"
@@ -108,28 +107,30 @@ def test_update_request(db: Session):
     # Patch the OpenAI service's generate_response method with a mock function
     with patch.object(openai_service, "generate_response", return_value=mock_response):
         new_request.response = mock_response
-        db.commit()
-        db.refresh(new_request)
+        await db.commit()
+        await db.refresh(new_request)
 
         assert new_request.response == mock_response
 
 # Define test function for deleting an existing Request record
-def test_delete_request(db: Session):
+@pytest.mark.asyncio
+async def test_delete_request(db: AsyncSession):
     """
     Tests deleting an existing `Request` record from the database, verifying the record is removed.
 
     Args:
-        db (Session): A database session for testing.
+        db (AsyncSession): A database session for testing.
 
     """
     test_request_data = schemas.RequestCreate(text="Test request")
     new_request = models.Request(**test_request_data.dict(), created_at=datetime.utcnow())
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
+    await db.commit()
+    await db.refresh(new_request)
 
-    db.delete(new_request)
-    db.commit()
+    await db.delete(new_request)
+    await db.commit()
 
-    fetched_request = db.query(models.Request).filter(models.Request.id == new_request.id).first()
+    result = await db.execute(select(models.Request).filter(models.Request.id == new_request.id))
+    fetched_request = result.scalars().first()
     assert fetched_request is None
\ No newline at end of file
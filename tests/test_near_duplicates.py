@@ -0,0 +1,127 @@
+"""
+Unit tests for prompt normalization and the SimHash index in `utils/near_duplicates.py`,
+and for the looser cache matching of the OpenAI service built on them.
+"""
+
+import json
+
+import httpx
+import pytest
+
+from services import openai_service as openai_service_module
+from services.openai_service import OpenAI, create_http_client
+from utils.near_duplicates import SimHashIndex, hamming_distance, max_distance_for, normalize_prompt, parse_normalization, simhash
+
+PROMPT = "Summarize the main causes of the French Revolution in three short bullet points."
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Starts every test with an empty response cache.
+    """
+    openai_service_module.CACHE.clear()
+    yield
+    openai_service_module.CACHE.clear()
+
+def test_normalization():
+    """
+    Tests each normalization, and that unknown names are rejected.
+    """
+    text = "  What's   2+2?\nTell ME! "
+    assert normalize_prompt(text, ("whitespace",)) == "What's 2+2? Tell ME!"
+    assert normalize_prompt(text, ("case", "whitespace")) == "what's 2+2? tell me!"
+    assert normalize_prompt(text) == "whats 2+2 tell me"  # Symbols such as + are kept
+    assert parse_normalization("Whitespace, case") == ("case", "whitespace")
+    assert parse_normalization("") == ()
+    with pytest.raises(ValueError):
+        parse_normalization("case,stemming")
+
+def test_simhash_distances():
+    """
+    Tests that small edits move the fingerprint a little, and unrelated prompts a lot.
+    """
+    fingerprint = simhash(PROMPT)
+    assert simhash(PROMPT.upper() + "  ") == fingerprint
+    assert hamming_distance(fingerprint, simhash(PROMPT.replace("French", "Frenhc"))) <= 10
+    assert hamming_distance(fingerprint, simhash("Write a limerick about a cat who learns to play the violin.")) > 16
+    assert max_distance_for(0.95) == 3
+    assert max_distance_for(1.0) == 0
+
+def test_index_finds_closest_within_distance():
+    """
+    Tests that lookups return the closest entry within the distance of the same namespace only.
+    """
+    index = SimHashIndex(max_distance=3)
+    index.add("a", 0b1111)
+    index.add("b", 0b0111 << 40)
+    index.add("c", 0b1111, namespace="other")
+
+    assert index.find(0b1110) == ("a", 1)
+    assert index.find(0b1111 << 20) is None
+    assert index.find(0b1111, namespace="other") == ("c", 0)
+    assert index.find(0b1111 << 40) == ("b", 1)
+
+    assert index.remove("a")
+    assert index.find(0b1110) is None
+    assert not index.remove("a")
+
+def test_index_is_bounded():
+    """
+    Tests that the least recently used entries are dropped beyond `max_entries`, and that lookups touch few entries.
+    """
+    index = SimHashIndex(max_distance=3, max_entries=1000)
+    fingerprints = [simhash(f"Request number {i} about topic {i * 7919 % 1000}") for i in range(2000)]
+    for i, fingerprint in enumerate(fingerprints):
+        index.add(i, fingerprint)
+
+    assert len(index) == 1000
+    assert index.stats()["evictions"] == 1000
+    assert index.find(fingerprints[1999])[0] == 1999
+    match = index.find(fingerprints[0])
+    assert match is None or match[0] >= 1000
+    assert index.stats()["compared_per_lookup"] < 50
+
+# Define a test function for the service's near-duplicate tier.
+@pytest.mark.asyncio
+async def test_service_reuses_answers_to_similar_prompts():
+    """
+    Tests that normalized prompts share a key, and that near-duplicates are answered from the cache without a call.
+    """
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        content = json.loads(request.content)["messages"][-1]["content"]
+        calls.append(content)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": f"Answer {len(calls)}"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        })
+
+    service = OpenAI(
+        api_key="sk-test",
+        http_client=create_http_client(transport=httpx.MockTransport(handler)),
+        key_normalization=("whitespace", "case"),
+        near_duplicate_threshold=0.85,
+    )
+
+    assert await service.generate_response(PROMPT) == "Answer 1"
+    assert service.cache_key(PROMPT) == service.cache_key("  " + PROMPT.lower())
+    assert await service.generate_response(PROMPT.lower()) == "Answer 1"
+    assert await service.generate_response(PROMPT.replace("short ", "")) == "Answer 1"
+    assert await service.generate_response("Explain how photosynthesis works to a ten year old child.") == "Answer 2"
+    assert await service.generate_response("Hi") == "Answer 3"
+    assert calls == [PROMPT, "Explain how photosynthesis works to a ten year old child.", "Hi"]
+
+    stats = service.stats()["near_duplicates"]
+    assert (stats["hits"], stats["entries"]) == (1, 2)
+
+    # An indexed prompt whose answer left the cache is dropped from the index
+    openai_service_module.CACHE.clear()
+    assert await service.generate_response(PROMPT.replace("short ", "")) == "Answer 4"
+    assert service.stats()["near_duplicates"]["entries"] == 2
+
+    await service.close()
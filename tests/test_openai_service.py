@@ -0,0 +1,539 @@
+"""
+Unit tests for `services/openai_service.py`, run against an in-process fake of the
+chat-completions endpoint (no network access required).
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from click.testing import CliRunner
+from fastapi import HTTPException
+
+import cli
+import models
+from database import AsyncSessionLocal
+from services import openai_service as openai_service_module
+from services.openai_service import OpenAI, create_http_client
+from utils.circuitbreaker import CircuitBreaker
+from utils.ratelimit import RateLimiter
+
+def completion_payload(content: str) -> dict:
+    """
+    Builds a minimal chat-completions response body.
+    """
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-3.5-turbo",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Starts every test with an empty response cache.
+    """
+    openai_service_module.CACHE.clear()
+    yield
+    openai_service_module.CACHE.clear()
+
+@pytest.mark.asyncio
+async def test_generate_response_uses_shared_async_client():
+    """
+    Tests that every call goes through the same pooled async HTTP client.
+    """
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200, json=completion_payload("Hi there"))
+
+    http_client = create_http_client(transport=httpx.MockTransport(handler))
+    service = OpenAI(api_key="sk-test", http_client=http_client)
+    await service.startup()
+    client = service.client
+
+    assert await service.generate_response("Hello") == "Hi there"
+    assert await service.generate_response("Hello again") == "Hi there"
+
+    assert service.client is client
+    assert len(seen) == 2
+    assert seen[0].url.path.endswith("/chat/completions")
+
+    await service.close()
+    assert service.client is None
+    assert http_client.is_closed
+
+@pytest.mark.asyncio
+async def test_generate_response_starts_client_lazily():
+    """
+    Tests that the client is created on first use when `startup()` was not called.
+    """
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json=completion_payload("Lazy")))
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=transport))
+
+    assert service.client is None
+    assert await service.generate_response("Hello") == "Lazy"
+    assert service.client is not None
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_prompts_share_one_upstream_call():
+    """
+    Tests that concurrent cache misses for the same prompt are coalesced into one upstream call.
+    """
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=completion_payload("Shared answer"))
+
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=httpx.MockTransport(handler)))
+
+    results = await asyncio.gather(*(service.generate_response("Popular prompt") for _ in range(10)))
+
+    assert results == ["Shared answer"] * 10
+    assert calls == 1
+    assert service.stats()["single_flight"] == {"executions": 1, "coalesced": 9, "in_flight": 0}
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_coalesced_errors_reach_every_waiter_and_are_not_cached():
+    """
+    Tests that an upstream failure is raised to all coalesced callers and the next call retries upstream.
+    """
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        if calls == 1:
+            return httpx.Response(400, json={"error": {"message": "bad request", "type": "invalid_request_error"}})
+        return httpx.Response(200, json=completion_payload("Recovered"))
+
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=httpx.MockTransport(handler)))
+
+    results = await asyncio.gather(*(service.generate_response("Failing prompt") for _ in range(5)), return_exceptions=True)
+
+    assert calls == 1
+    assert all(isinstance(result, HTTPException) for result in results)
+    assert all("OpenAI API request failed" in result.detail for result in results)
+
+    assert await service.generate_response("Failing prompt") == "Recovered"
+    assert calls == 2
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_stream_response_yields_deltas_and_caches_full_text():
+    """
+    Tests that streamed deltas are yielded in order and the assembled text is cached at the end.
+    """
+    def chunk(content: str) -> str:
+        payload = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    body = "".join(chunk(piece) for piece in ["Hel", "lo", "!"]) + "data: [DONE]\n\n"
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body.encode())
+    )
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=transport))
+
+    deltas = [delta async for delta in service.stream_response("Greet me")]
+
+    assert deltas == ["Hel", "lo", "!"]
+    assert openai_service_module.CACHE.get(service.cache_key("Greet me")) == "Hello!"
+    assert [delta async for delta in service.stream_response("Greet me")] == ["Hello!"]
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_generate_responses_dedupes_and_bounds_concurrency():
+    """
+    Tests that batch generation calls upstream once per unique uncached text, never exceeding the concurrency limit.
+    """
+    in_flight = 0
+    peak = 0
+    prompts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        prompts.append(prompt)
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return httpx.Response(200, json=completion_payload(f"Answer to {prompt}"))
+
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=httpx.MockTransport(handler)))
+    openai_service_module.CACHE.set(service.cache_key("cached"), "From cache")
+
+    texts = [f"prompt {i % 6}" for i in range(12)] + ["cached"]
+    results = await service.generate_responses(texts, max_concurrency=2)
+
+    assert sorted(prompts) == [f"prompt {i}" for i in range(6)]
+    assert peak == 2
+    assert results["cached"] == "From cache"
+    assert results["prompt 3"] == "Answer to prompt 3"
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_stored_requests_serve_as_second_cache_tier():
+    """
+    Tests that an in-memory miss is answered from a fresh stored request without calling upstream.
+    """
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("upstream should not be called")
+
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=httpx.MockTransport(handler)))
+    async with AsyncSessionLocal() as db:
+        db.add(models.Request(text="Stored prompt", response="Stored answer", created_at=datetime.utcnow(), prompt_hash=service.prompt_hash("Stored prompt")))
+        await db.commit()
+
+    assert await service.generate_response("Stored prompt") == "Stored answer"
+    assert openai_service_module.CACHE.get(service.cache_key("Stored prompt")) == "Stored answer"
+
+    stats = service.stats()
+    assert stats["l2_cache"]["hits"] == 1
+    assert stats["cache"]["misses"] >= 1
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_stale_stored_requests_are_ignored():
+    """
+    Tests that stored requests older than the L2 freshness window fall through to upstream.
+    """
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json=completion_payload("Fresh answer")))
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=transport))
+    stale = datetime.utcnow() - timedelta(seconds=openai_service_module.L2_CACHE_TTL_SECONDS + 60)
+    async with AsyncSessionLocal() as db:
+        db.add(models.Request(text="Old prompt", response="Old answer", created_at=stale, prompt_hash=service.prompt_hash("Old prompt")))
+        await db.commit()
+
+    assert await service.generate_response("Old prompt") == "Fresh answer"
+    assert service.stats()["l2_cache"]["misses"] == 1
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_warm_cache_loads_most_frequent_prompts(tmp_path):
+    """
+    Tests that pre-warming loads the latest answers to the most frequent recent prompts, and that the CLI writes them to the snapshot.
+    """
+    service = OpenAI(api_key="sk-test")
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=openai_service_module.L2_CACHE_TTL_SECONDS + 60)
+    rows = [("Popular", "Old answer", now - timedelta(minutes=5))] + [("Popular", "Latest answer", now)] * 2
+    rows += [("Rare", "Rare answer", now), ("Forgotten", "Stale", stale), ("Forgotten", "Stale", stale), ("Forgotten", "Stale", stale)]
+    async with AsyncSessionLocal() as db:
+        db.add_all(models.Request(text=text, response=response, created_at=created_at, prompt_hash=service.prompt_hash(text)) for text, response, created_at in rows)
+        await db.commit()
+
+    entries = await service.popular_responses(top=2)
+    assert [(key, response) for key, response, _ in entries] == [(service.cache_key("Rare"), "Rare answer"), (service.cache_key("Popular"), "Latest answer")]
+
+    assert await service.warm_cache(top=1) == 1
+    assert openai_service_module.CACHE.get(service.cache_key("Popular")) == "Latest answer"
+    assert openai_service_module.CACHE.get(service.cache_key("Rare")) is None
+
+    snapshot = str(tmp_path / "snapshot.gz")
+    result = await asyncio.to_thread(CliRunner().invoke, cli.cli, ["warm-cache", "--top", "5", "--output", snapshot])
+    assert result.exit_code == 0, result.output
+    openai_service_module.CACHE.clear()
+    assert service.load_cache_snapshot(snapshot) == 2
+    assert openai_service_module.CACHE.get(service.cache_key("Rare")) == "Rare answer"
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_closing_stream_early_closes_upstream_response():
+    """
+    Tests that closing the response generator early closes the upstream HTTP stream.
+    """
+    upstream_closed = asyncio.Event()
+    payload = {
+        "id": "chatcmpl-test",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "gpt-3.5-turbo",
+        "choices": [{"index": 0, "delta": {"content": "tick "}, "finish_reason": None}],
+    }
+
+    class EndlessStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            while True:
+                yield f"data: {json.dumps(payload)}\n\n".encode()
+                await asyncio.sleep(0)
+
+        async def aclose(self):
+            upstream_closed.set()
+
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=EndlessStream())
+    )
+    service = OpenAI(api_key="sk-test", http_client=create_http_client(transport=transport))
+
+    stream = service.stream_response("Endless prompt")
+    assert await stream.__anext__() == "tick "
+    await stream.aclose()
+
+    assert upstream_closed.is_set()
+    assert openai_service_module.CACHE.get(service.cache_key("Endless prompt")) is None
+
+    await service.close()
+
+class FakeRateLimitedUpstream:
+    """
+    A chat-completions fake that enforces a requests-per-period token bucket and answers 429 past it.
+    """
+
+    def __init__(self, requests_per_period: int, period: float):
+        self.requests_per_period = requests_per_period
+        self.period = period
+        self.allowance = float(requests_per_period)
+        self.updated_at = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        now = time.monotonic()
+        self.allowance = min(float(self.requests_per_period), self.allowance + (now - self.updated_at) * self.requests_per_period / self.period)
+        self.updated_at = now
+        if self.allowance < 1:
+            self.rejected += 1
+            return httpx.Response(
+                429,
+                headers={"retry-after-ms": "10", "retry-after": "0.01"},
+                json={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            )
+        self.allowance -= 1
+        self.accepted += 1
+        return httpx.Response(200, json=completion_payload("Within budget"))
+
+@pytest.mark.asyncio
+async def test_rate_limiter_keeps_calls_within_upstream_limits():
+    """
+    Tests that calls beyond the RPM budget are queued locally instead of being rejected upstream.
+    """
+    # The local budget sits a little below the upstream's, absorbing the delay between a grant and its arrival upstream.
+    upstream = FakeRateLimitedUpstream(requests_per_period=5, period=0.5)
+    service = OpenAI(
+        api_key="sk-test",
+        http_client=create_http_client(transport=httpx.MockTransport(upstream)),
+        rate_limiter=RateLimiter(requests_per_period=4, period=0.5),
+    )
+
+    results = await asyncio.gather(*(service.generate_response(f"prompt {i}") for i in range(12)))
+
+    assert results == ["Within budget"] * 12
+    assert upstream.accepted == 12
+    assert upstream.rejected == 0
+    stats = service.stats()["rate_limit"]
+    assert stats["acquired"] == 12
+    assert stats["delayed"] >= 8
+    assert stats["max_wait_seconds"] > 0
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_upstream_429_becomes_503_and_pauses_the_limiter():
+    """
+    Tests that upstream 429s pause the local queue before each retry and end as a retryable 503.
+    """
+    upstream = FakeRateLimitedUpstream(requests_per_period=1, period=60)
+    service = OpenAI(
+        api_key="sk-test",
+        http_client=create_http_client(transport=httpx.MockTransport(upstream)),
+        rate_limiter=RateLimiter(requests_per_period=100, period=60),
+    )
+
+    assert await service.generate_response("first") == "Within budget"
+    with pytest.raises(HTTPException) as excinfo:
+        await service.generate_response("second")
+
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.headers["Retry-After"] == "1"
+    assert service.stats()["rate_limit"]["backoffs"] == 1 + service.max_retries
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_rate_limit_queue_timeout_becomes_503():
+    """
+    Tests that a call that cannot get a slot within `max_wait` fails fast with 503 instead of calling upstream.
+    """
+    upstream = FakeRateLimitedUpstream(requests_per_period=10, period=60)
+    service = OpenAI(
+        api_key="sk-test",
+        http_client=create_http_client(transport=httpx.MockTransport(upstream)),
+        rate_limiter=RateLimiter(requests_per_period=1, period=60, max_wait=0.05),
+    )
+
+    await service.generate_response("first")
+    with pytest.raises(HTTPException) as excinfo:
+        await service.generate_response("second")
+
+    assert excinfo.value.status_code == 503
+    assert upstream.accepted == 1
+
+    await service.close()
+
+class FaultInjectingUpstream:
+    """
+    A chat-completions fake that plays a scripted sequence of faults before answering normally.
+
+    Each script entry is an HTTP status to return, `"drop"` to fail the connection, or a
+    number of seconds to stall before answering 200.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        fault = self.script.pop(0) if self.script else 200
+        if fault == "drop":
+            raise httpx.ConnectError("connection reset", request=request)
+        if isinstance(fault, float):
+            await asyncio.sleep(fault)
+            fault = 200
+        if fault != 200:
+            return httpx.Response(fault, json={"error": {"message": f"injected {fault}", "type": "server_error"}})
+        return httpx.Response(200, json=completion_payload(f"Answer #{self.calls}"))
+
+def resilient_service(upstream, **kwargs) -> OpenAI:
+    """
+    Builds a service against `upstream` with fast retries.
+    """
+    kwargs.setdefault("retry_base_delay", 0.001)
+    return OpenAI(api_key="sk-test", http_client=create_http_client(transport=httpx.MockTransport(upstream)), **kwargs)
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried():
+    """
+    Tests that 5xx and connection failures are retried until an attempt succeeds.
+    """
+    upstream = FaultInjectingUpstream([503, "drop"])
+    service = resilient_service(upstream, max_retries=2)
+
+    assert await service.generate_response("Flaky prompt") == "Answer #3"
+    assert service.stats()["resilience"]["retries"] == 2
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    """
+    Tests that a 4xx other than 408/409/429 fails immediately.
+    """
+    upstream = FaultInjectingUpstream([400])
+    service = resilient_service(upstream, max_retries=2)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await service.generate_response("Bad prompt")
+
+    assert excinfo.value.status_code == 500
+    assert upstream.calls == 1
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast_then_recovers():
+    """
+    Tests that repeated failures open the circuit, calls then fail fast with 503, and a trial call closes it again.
+    """
+    upstream = FaultInjectingUpstream([500, 500])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    service = resilient_service(upstream, max_retries=0, circuit_breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await service.generate_response("Outage prompt")
+    with pytest.raises(HTTPException) as excinfo:
+        await service.generate_response("Outage prompt")
+
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.headers["Retry-After"] == "1"
+    assert upstream.calls == 2
+    assert breaker.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.06)
+    assert await service.generate_response("Outage prompt") == "Answer #3"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_open_circuit_serves_stale_stored_answer():
+    """
+    Tests that while the circuit is open, a stored answer older than the L2 window is served instead of an error.
+    """
+    upstream = FaultInjectingUpstream([])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    service = resilient_service(upstream, circuit_breaker=breaker)
+    stale = datetime.utcnow() - timedelta(seconds=openai_service_module.L2_CACHE_TTL_SECONDS + 60)
+    async with AsyncSessionLocal() as db:
+        db.add(models.Request(text="Old prompt", response="Old answer", created_at=stale, prompt_hash=service.prompt_hash("Old prompt")))
+        await db.commit()
+    breaker.record_failure()
+
+    assert await service.generate_response("Old prompt") == "Old answer"
+    assert upstream.calls == 0
+    assert service.stats()["resilience"]["stale_served"] == 1
+    assert openai_service_module.CACHE.get(service.cache_key("Old prompt")) is None  # Stale answers are not re-cached as fresh
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_over_slow_attempt():
+    """
+    Tests that a second attempt is started after `hedge_after` and the faster answer is returned.
+    """
+    upstream = FaultInjectingUpstream([1.0])
+    service = resilient_service(upstream, hedge_after=0.05)
+
+    started = time.monotonic()
+    assert await service.generate_response("Slow prompt") == "Answer #2"
+
+    assert time.monotonic() - started < 0.5
+    assert upstream.calls == 2
+    resilience = service.stats()["resilience"]
+    assert resilience["hedges"] == 1
+    assert resilience["hedge_wins"] == 1
+
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_fast_requests_are_not_hedged():
+    """
+    Tests that an attempt finishing before `hedge_after` never starts a second call.
+    """
+    upstream = FaultInjectingUpstream([])
+    service = resilient_service(upstream, hedge_after=0.5)
+
+    assert await service.generate_response("Quick prompt") == "Answer #1"
+    assert upstream.calls == 1
+    assert service.stats()["resilience"]["hedges"] == 0
+
+    await service.close()
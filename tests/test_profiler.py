@@ -0,0 +1,128 @@
+import asyncio
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import database
+from main import create_app
+from settings import Settings
+from utils.profiler import Profiler, ProfilingMiddleware
+
+def busy_handler(seconds: float):
+    """
+    Keeps the event loop busy in Python code, so the samples land in this function.
+    """
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def profiled_app(profiler: Profiler) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    @app.get("/slow/{item_id}")
+    async def slow(item_id: int):
+        busy_handler(0.1)
+        return {"id": item_id}
+
+    @app.get("/fast")
+    async def fast():
+        return {}
+
+    return app
+
+def wait_for_files(directory, count: int):
+    deadline = time.monotonic() + 5
+    while len(list(directory.iterdir()) if directory.exists() else []) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return sorted(directory.iterdir()) if directory.exists() else []
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    return tmp_path / "profiles"
+
+# Define a test function for profiling slow requests.
+def test_slow_requests_are_profiled(profile_dir):
+    """
+    Tests that requests over the threshold are written as collapsed stacks named after route and request id, and fast ones are not.
+    """
+    profiler = Profiler(sample_rate=0, slow_seconds=0.05, interval=0.001, directory=str(profile_dir))
+    client = TestClient(profiled_app(profiler))
+    try:
+        assert client.get("/fast").status_code == 200
+        response = client.get("/slow/7", headers={"X-Request-ID": "abc123"})
+        assert response.headers["x-request-id"] == "abc123"
+
+        files = wait_for_files(profile_dir, 1)
+        assert [path.name.split("-", 1)[1] for path in files] == ["slow_item_id-abc123.collapsed"]
+        lines = files[0].read_text().splitlines()
+        stack, count = lines[0].rsplit(" ", 1)
+        assert "busy_handler" in stack.split(";")[-1]
+        assert int(count) > 10
+
+        stats = profiler.stats()
+        assert stats["profiled_requests"] == 1
+        assert stats["top_functions"][0]["function"].startswith("busy_handler")
+    finally:
+        profiler.stop()
+
+# Define a test function for sampled requests.
+def test_sample_rate_and_file_limit(profile_dir):
+    """
+    Tests that a sample rate of 1 profiles every request, and that only the newest files are kept.
+    """
+    profiler = Profiler(sample_rate=1.0, interval=0.001, directory=str(profile_dir), max_files=2)
+    client = TestClient(profiled_app(profiler))
+    try:
+        for item_id in range(3):
+            client.get(f"/slow/{item_id}", headers={"X-Request-ID": f"req{item_id}"})
+        deadline = time.monotonic() + 5
+        while (profiler.files_written < 3 or profiler.stats()["pending_writes"]) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert profiler.files_written == 3
+        assert sorted(path.name.rsplit("-", 1)[1] for path in profile_dir.iterdir()) == ["req1.collapsed", "req2.collapsed"]
+    finally:
+        profiler.stop()
+
+# Define a test function for failed profile writes.
+@pytest.mark.asyncio
+async def test_failed_writes_are_counted(profile_dir, monkeypatch):
+    """
+    Tests that an unexpected error in the background write is counted instead of vanishing with its future.
+    """
+    profiler = Profiler(sample_rate=0, slow_seconds=0.05, directory=str(profile_dir))
+
+    def broken_write(name, counts):
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(profiler, "_write", broken_write)
+    profiler._samples.append((1.0, ("main (app.py:1)", "handler (app.py:2)")))
+    profiler.end(False, 0.5, 1.5, "/slow", "req")
+    while profiler.stats()["pending_writes"]:
+        await asyncio.sleep(0.01)
+    assert profiler.write_errors == 1
+    assert profiler.files_written == 0
+
+# Define a test function for the disabled profiler.
+def test_profiling_disabled_by_default(tmp_path):
+    """
+    Tests that the app factory installs no profiler unless one is configured.
+    """
+    try:
+        settings = Settings(database_url=f"sqlite:///{tmp_path / 'app.db'}", openai_api_key="sk-test")
+        with TestClient(create_app(settings)) as client:
+            response = client.get("/debug/profile")
+            assert response.status_code == 404
+            assert "x-request-id" not in response.headers
+
+        settings = Settings(database_url=f"sqlite:///{tmp_path / 'app.db'}", openai_api_key="sk-test", profile_slow_seconds=10)
+        with TestClient(create_app(settings)) as client:
+            response = client.get("/debug/profile")
+            assert response.status_code == 200
+            assert response.json()["slow_seconds"] == 10
+            assert "x-request-id" in response.headers
+    finally:
+        database.configure_engine(os.environ["DATABASE_URL"])
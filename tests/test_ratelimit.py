@@ -0,0 +1,118 @@
+"""
+Unit tests for the outbound RPM/TPM scheduler in `utils/ratelimit.py`.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from utils.ratelimit import RateLimiter, RateLimitTimeout
+
+@pytest.mark.asyncio
+async def test_disabled_limiter_never_waits():
+    """
+    Tests that a limiter without budgets lets every call through immediately.
+    """
+    limiter = RateLimiter()
+
+    for _ in range(100):
+        await limiter.acquire(10_000)
+
+    assert not limiter.enabled
+    assert limiter.stats()["queue_depth"] == 0
+
+@pytest.mark.asyncio
+async def test_requests_beyond_the_budget_wait_for_refill():
+    """
+    Tests that a burst of one period's worth passes at once and the next call waits for the bucket to refill.
+    """
+    limiter = RateLimiter(requests_per_period=5, period=0.5)
+
+    started = time.monotonic()
+    for _ in range(5):
+        await limiter.acquire()
+    assert time.monotonic() - started < 0.05
+
+    await limiter.acquire()
+    assert time.monotonic() - started >= 0.09  # One request refills every 0.1 s
+    assert limiter.stats()["delayed"] == 1
+
+@pytest.mark.asyncio
+async def test_token_budget_limits_large_calls():
+    """
+    Tests that the token budget delays calls whose estimate exceeds what is left.
+    """
+    limiter = RateLimiter(tokens_per_period=1000, period=0.5)
+
+    await limiter.acquire(800)
+    started = time.monotonic()
+    await limiter.acquire(400)  # Needs 200 more tokens: 0.1 s of refill
+
+    assert time.monotonic() - started >= 0.09
+
+@pytest.mark.asyncio
+async def test_refund_returns_unused_tokens():
+    """
+    Tests that refunded tokens are available to the next caller right away.
+    """
+    limiter = RateLimiter(tokens_per_period=1000, period=60)
+
+    await limiter.acquire(1000)
+    limiter.refund(600)
+    started = time.monotonic()
+    await limiter.acquire(500)
+
+    assert time.monotonic() - started < 0.05
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_in_arrival_order():
+    """
+    Tests that queued callers are granted in FIFO order even when a later caller needs fewer tokens.
+    """
+    limiter = RateLimiter(tokens_per_period=100, period=0.2)
+    await limiter.acquire(100)
+    order = []
+
+    async def call(name: str, tokens: int) -> None:
+        await limiter.acquire(tokens)
+        order.append(name)
+
+    tasks = [asyncio.create_task(call("big", 80))]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call("small", 1)))
+    await asyncio.sleep(0)
+    assert limiter.stats()["queue_depth"] == 2
+
+    await asyncio.gather(*tasks)
+
+    assert order == ["big", "small"]
+
+@pytest.mark.asyncio
+async def test_callers_give_up_after_max_wait():
+    """
+    Tests that a caller queued longer than `max_wait` gets `RateLimitTimeout` and leaves the queue.
+    """
+    limiter = RateLimiter(requests_per_period=1, period=60, max_wait=0.05)
+    await limiter.acquire()
+
+    with pytest.raises(RateLimitTimeout):
+        await limiter.acquire()
+
+    stats = limiter.stats()
+    assert stats["timeouts"] == 1
+    assert stats["queue_depth"] == 0
+
+@pytest.mark.asyncio
+async def test_backoff_pauses_the_queue():
+    """
+    Tests that `backoff` holds callers even when the budgets have room.
+    """
+    limiter = RateLimiter(requests_per_period=100, period=60)
+    limiter.backoff(0.1)
+
+    started = time.monotonic()
+    await limiter.acquire()
+
+    assert time.monotonic() - started >= 0.09
+    assert limiter.stats()["backoffs"] == 1
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import models
+from database import AsyncSessionLocal, Base, build_engine
+from database.replicas import ReadRouter, replicas
+from routers import requests
+from routers.metrics import collect_pool_stats
+from utils.metrics import REGISTRY
+
+# Tables are created for the test database in conftest.py; each test gets its own replica database.
+
+test_app = FastAPI()
+test_app.include_router(requests.router)
+client = TestClient(test_app)
+
+async def _store(url, texts):
+    engine = build_engine(url)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for text in texts:
+                await conn.execute(models.Request.__table__.insert(), {"text": text, "response": "Answer", "created_at": datetime(2024, 1, 1)})
+    finally:
+        await engine.dispose()
+
+@pytest.fixture
+def replica_url(tmp_path):
+    """
+    Routes reads to an (already measured) SQLite replica for the duration of a test.
+    """
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    asyncio.run(_store(url, ["Replica row"]))
+    replicas.configure([url])
+    asyncio.run(replicas.refresh())
+    yield url
+    asyncio.run(replicas.close())
+    replicas.configure([])
+
+def _store_primary(text):
+    async def store():
+        async with AsyncSessionLocal() as db:
+            row = models.Request(text=text, response="Answer", created_at=datetime(2024, 1, 2))
+            db.add(row)
+            await db.commit()
+            return row.id
+
+    return asyncio.run(store())
+
+# Define a test function for routing reads to a replica.
+def test_reads_go_to_caught_up_replica(replica_url):
+    """
+    Tests that listing and lookups are served by a replica whose lag is within the limit.
+    """
+    _store_primary("Primary row")
+    reads = replicas.stats()["replicas"]["replica0"]["reads"]
+
+    response = client.get("/")
+    assert response.status_code == 200
+    assert [item["text"] for item in response.json()["items"]] == ["Replica row"]
+    assert replicas.stats()["replicas"]["replica0"]["reads"] == reads + 1
+    assert 'db_reads_total{database="replica0"}' in REGISTRY.render(collect_pool_stats(replicas))
+
+# Define a test function for read-your-writes.
+def test_lookup_falls_back_to_primary(replica_url):
+    """
+    Tests that a lookup missing on the replica (not replicated yet) is answered by the primary.
+    """
+    _store_primary("Older row")
+    request_id = _store_primary("Just written")
+    retries = replicas.primary_retries
+
+    response = client.get(f"/{request_id}")
+    assert response.status_code == 200
+    assert response.json()["text"] == "Just written"
+    assert replicas.primary_retries == retries + 1
+    assert client.get("/999999").status_code == 404
+
+# Define a test function for lagging replicas.
+def test_lagging_replica_is_skipped(replica_url):
+    """
+    Tests that reads go to the primary while the replica is further behind than allowed.
+    """
+    _store_primary("Primary row")
+    replicas.replicas[0].lag = replicas.max_lag + 1
+    fallbacks = replicas.fallbacks
+
+    response = client.get("/")
+    assert [item["text"] for item in response.json()["items"]] == ["Primary row"]
+    assert replicas.fallbacks == fallbacks + 1
+
+# Define a test function for unreachable replicas.
+@pytest.mark.asyncio
+async def test_unreachable_replica_is_skipped(tmp_path):
+    """
+    Tests that a replica whose lag cannot be measured is not used.
+    """
+    router = ReadRouter([f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"])
+    await router.refresh()
+    try:
+        assert router.stats()["replicas"]["replica0"]["failed_checks"] == 1
+        assert router.engine() is router.engines()[0][1]
+        assert router.stats()["fallbacks"] == 1
+    finally:
+        await router.close()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+import cli
+import models
+from database import AsyncSessionLocal, engine, response_store
+from database.export import export_stream
+from database.response_store import decode_body, encode_body, migrate_responses
+from routers import requests
+from services.openai_service import OpenAI, openai_service
+
+# Tables are created for the test database in conftest.py.
+
+test_app = FastAPI()
+test_app.include_router(requests.router)
+client = TestClient(test_app)
+
+LONG_ANSWER = "The same fairly long answer, repeated for every identical prompt. " * 20
+
+async def _count(model):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(model))).scalar()
+
+async def _stored_columns():
+    async with engine.connect() as conn:
+        return (await conn.execute(select(models.Request.__table__.c.response, models.Request.__table__.c.response_hash).order_by(models.Request.id))).all()
+
+# Define a test function for the codecs.
+@pytest.mark.parametrize("codec", ["zlib", "none"])
+def test_encode_decode_round_trip(codec):
+    """
+    Tests that bodies survive compression, and that short bodies are kept uncompressed.
+    """
+    used, data = encode_body(LONG_ANSWER, codec)
+    assert used == codec
+    assert decode_body(used, data) == LONG_ANSWER
+    if codec == "zlib":
+        assert len(data) < len(LONG_ANSWER) / 10
+
+    assert encode_body("Hi", codec) == ("none", b"Hi")
+
+def test_encode_zstd_round_trip():
+    """
+    Tests the optional zstd codec.
+    """
+    pytest.importorskip("zstandard")
+    used, data = encode_body(LONG_ANSWER, "zstd")
+    assert used == "zstd"
+    assert decode_body(used, data) == LONG_ANSWER
+
+# Define a test function for deduplicated storage through the API.
+def test_dedup_storage_stores_each_body_once():
+    """
+    Tests that identical responses share one compressed body and still read back in full.
+    """
+    async def mock_generate_responses(texts, max_concurrency, choice=None):
+        return {text: LONG_ANSWER for text in texts}
+
+    with patch.object(response_store, "RESPONSE_STORAGE", "dedup"), patch.object(openai_service, "generate_response", return_value=LONG_ANSWER), \
+            patch.object(openai_service, "generate_responses", mock_generate_responses):
+        created = [client.post("/", json={"text": f"Prompt {i}"}).json() for i in range(3)]
+        batch = client.post("/batch", json=[{"text": "Batch prompt"}, {"text": "Another batch prompt"}]).json()
+
+    assert [item["response"] for item in created] == [LONG_ANSWER] * 3
+    assert [item["error"] for item in batch] == [None, None]
+    assert asyncio.run(_count(models.ResponseBody)) == 1
+    assert {tuple(row) for row in asyncio.run(_stored_columns())} == {(None, response_store.body_hash(LONG_ANSWER))}
+
+    assert client.get(f"/{created[1]['id']}").json()["response"] == LONG_ANSWER
+    assert client.get(f"/{batch[0]['id']}").json()["response"] == LONG_ANSWER
+    assert [item["response"] for item in client.get("/").json()["items"]] == [LONG_ANSWER] * 5
+
+    async def stored_lookup():
+        return await OpenAI(api_key="sk-test")._get_stored_response("Prompt 0")
+
+    assert asyncio.run(stored_lookup()) == LONG_ANSWER
+
+    async def export():
+        return b"".join([piece async for piece in export_stream(engine)])
+
+    assert [json.loads(line)["response"] for line in asyncio.run(export()).splitlines()] == [LONG_ANSWER] * 5
+
+# Define a test function for migrating existing rows.
+def test_migrate_responses_both_ways():
+    """
+    Tests that inline rows move into deduplicated storage in batches and back again.
+    """
+    async def store():
+        async with AsyncSessionLocal() as db:
+            db.add_all(models.Request(text=f"Prompt {i}", response=LONG_ANSWER if i % 2 else f"Answer {i}", created_at=datetime.utcnow()) for i in range(5))
+            await db.commit()
+
+    asyncio.run(store())
+
+    result = CliRunner().invoke(cli.cli, ["migrate-responses", "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Migrated 5 rows to dedup storage" in result.output
+    assert asyncio.run(_count(models.ResponseBody)) == 4
+    assert all(response is None and response_hash for response, response_hash in asyncio.run(_stored_columns()))
+    assert [client.get(f"/{i}").json()["response"] for i in range(1, 6)] == ["Answer 0", LONG_ANSWER, "Answer 2", LONG_ANSWER, "Answer 4"]
+
+    assert asyncio.run(migrate_responses(engine, to="dedup")) == 0
+    assert asyncio.run(migrate_responses(engine, to="inline", batch_size=3)) == 5
+    assert [tuple(row) for row in asyncio.run(_stored_columns())] == [
+        ("Answer 0", None), (LONG_ANSWER, None), ("Answer 2", None), (LONG_ANSWER, None), ("Answer 4", None),
+    ]
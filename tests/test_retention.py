@@ -0,0 +1,102 @@
+import asyncio
+import gzip
+import json
+from datetime import date, datetime, timedelta
+
+from click.testing import CliRunner
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+import cli
+import models
+from database import AsyncSessionLocal, engine
+from database.partitions import conversion_statements, parse_partition_name, partitioned_table_ddl, upcoming_partitions
+from database.retention import RetentionJob
+
+# Tables are created for the test database in conftest.py.
+
+NOW = datetime(2024, 6, 15, 12, 0, 0)
+
+def _store_requests(ages_in_days, now=NOW):
+    async def store():
+        async with AsyncSessionLocal() as db:
+            db.add_all(
+                models.Request(request_key=f"key-{i}", text=f"Prompt {i}", response=f"Answer {i}", created_at=now - timedelta(days=age))
+                for i, age in enumerate(ages_in_days)
+            )
+            await db.commit()
+
+    asyncio.run(store())
+
+def _stored_texts():
+    async def load():
+        async with AsyncSessionLocal() as db:
+            return list((await db.execute(select(models.Request.text).order_by(models.Request.id))).scalars())
+
+    return asyncio.run(load())
+
+# Define a test function for partition periods.
+def test_upcoming_partitions_and_names():
+    """
+    Tests partition periods across month and year boundaries, and parsing their names back.
+    """
+    assert upcoming_partitions(date(2024, 12, 15), "month", 2) == [
+        ("requests_p202412", date(2024, 12, 1), date(2025, 1, 1)),
+        ("requests_p202501", date(2025, 1, 1), date(2025, 2, 1)),
+        ("requests_p202502", date(2025, 2, 1), date(2025, 3, 1)),
+    ]
+    assert [name for name, _, _ in upcoming_partitions(date(2024, 2, 28), "day", 2)] == ["requests_p20240228", "requests_p20240229", "requests_p20240301"]
+    assert parse_partition_name("requests_p202402") == (date(2024, 2, 1), date(2024, 3, 1))
+    assert parse_partition_name("requests_p20240229") == (date(2024, 2, 29), date(2024, 3, 1))
+    assert parse_partition_name("requests_legacy") is None
+
+# Define a test function for the PostgreSQL DDL.
+def test_partitioned_table_ddl():
+    """
+    Tests that the partitioned table keys on (id, created_at) and that the conversion attaches the old table last.
+    """
+    create_table, request_key_index = partitioned_table_ddl(postgresql.dialect())
+    assert "PARTITION BY RANGE (created_at)" in create_table
+    assert "PRIMARY KEY (id, created_at)" in create_table
+    assert "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL" in create_table
+    assert request_key_index == "CREATE UNIQUE INDEX ix_requests_request_key ON requests (request_key, created_at)"
+
+    online, swap = conversion_statements(date(2024, 7, 1), postgresql.dialect())
+    assert all("CONCURRENTLY" in statement for statement in online if statement.startswith("CREATE INDEX"))
+    assert "VALIDATE CONSTRAINT" in online[2]
+    assert swap[-2] == "ALTER TABLE requests ATTACH PARTITION requests_legacy FOR VALUES FROM (MINVALUE) TO ('2024-07-01')"
+
+# Define a test function for retention with archiving.
+def test_retention_archives_then_deletes_old_rows(tmp_path):
+    """
+    Tests that rows past their retention are archived, deleted in batches, and that a second run finds nothing.
+    """
+    _store_requests([100, 1, 45, 31, 29, 0])
+    job = RetentionJob(engine, retention_days=30, archive_dir=str(tmp_path), batch_size=2, partition_interval="")
+
+    asyncio.run(job.run_once(NOW))
+
+    assert _stored_texts() == ["Prompt 1", "Prompt 4", "Prompt 5"]
+    archives = list(tmp_path.iterdir())
+    assert [archive.name for archive in archives] == ["requests_before_20240516T120000.ndjson.gz"]
+    archived = [json.loads(line) for line in gzip.decompress(archives[0].read_bytes()).splitlines()]
+    assert [row["text"] for row in archived] == ["Prompt 0", "Prompt 2", "Prompt 3"]
+    assert archived[0]["response"] == "Answer 0"
+
+    asyncio.run(job.run_once(NOW))
+    assert job.stats()["rows_deleted"] == 3
+    assert job.stats()["archives_written"] == 1
+    assert job.stats()["runs"] == 2
+
+# Define a test function for the retention command.
+def test_apply_retention_cli_without_archive():
+    """
+    Tests `cli.py apply-retention` removing old rows without archiving them.
+    """
+    _store_requests([400, 0], now=datetime.utcnow())
+
+    result = CliRunner().invoke(cli.cli, ["apply-retention", "--days", "365", "--archive-dir", ""])
+
+    assert result.exit_code == 0, result.output
+    assert "Deleted 1 rows" in result.output
+    assert len(_stored_texts()) == 1
@@ -1,20 +1,28 @@
+import asyncio
+import json
 import pytest
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.testclient import TestClient
 from datetime import datetime
 from unittest.mock import patch, MagicMock
+from openai import OpenAIError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Import necessary packages for testing.
 import models
 import schemas
-from database import get_db, engine
+from database import AsyncSessionLocal
+from database.write_behind import write_behind
 from routers import requests
 from services.openai_service import openai_service
 
-# Create all tables in the database for test setup.
-models.Base.metadata.create_all(bind=engine)
+# Tables are created for the test database in conftest.py.
 
-# Initialize the test client.
-client = TestClient(requests.router)
+# Initialize the test client (mounted on an app so HTTPExceptions are rendered as responses).
+test_app = FastAPI()
+test_app.include_router(requests.router)
+client = TestClient(test_app)
 
 # Define a test function for creating a new request.
 @pytest.mark.asyncio
@@ -42,8 +50,9 @@ async def test_create_request():
     assert response_data.response == mock_openai_response
 
     # Check if the request is saved in the database.
-    with get_db() as db:
-        db_request = db.query(models.Request).filter(models.Request.text == test_request_data.text).first()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(models.Request).filter(models.Request.text == test_request_data.text))
+        db_request = result.scalars().first()
         assert db_request is not None
         assert db_request.response == mock_openai_response
 
@@ -57,12 +66,12 @@ async def test_get_request():
     mock_openai_response = "This is a mock OpenAI response"
 
     # Create a test request and save it to the database.
-    with get_db() as db:
+    async with AsyncSessionLocal() as db:
         with patch.object(openai_service, "generate_response", return_value=mock_openai_response):
             new_request = models.Request(text=test_request_data.text, response=mock_openai_response, created_at=datetime.utcnow())
             db.add(new_request)
-            db.commit()
-            db.refresh(new_request)
+            await db.commit()
+            await db.refresh(new_request)
             request_id = new_request.id
 
     # Send the request to the API endpoint.
@@ -80,6 +89,41 @@ async def test_get_request():
     assert response_data.text == test_request_data.text
     assert response_data.response == mock_openai_response
 
+# Define a test function for HTTP caching of stored requests.
+def test_get_request_etag_and_row_cache():
+    """
+    Tests that GET /requests/{request_id} sends a strong ETag, answers If-None-Match with 304
+    and serves repeat reads from memory, all without querying the database again.
+    """
+    request_id = asyncio.run(_store_request("Cached prompt", "Cached answer"))
+
+    response = client.get(f"/{request_id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag.startswith(f'"{request_id}-') and not etag.startswith("W/")
+    assert "immutable" in response.headers["Cache-Control"]
+    assert response.json()["text"] == "Cached prompt"
+
+    with patch.object(AsyncSession, "execute", side_effect=Exception("Database must not be queried")):
+        assert client.get(f"/{request_id}", headers={"If-None-Match": etag}).status_code == 304
+        assert client.get(f"/{request_id}", headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+        repeat = client.get(f"/{request_id}")
+        changed = client.get(f"/{request_id}", headers={"If-None-Match": f'"{request_id}-0000000000000000"'})
+    assert repeat.content == response.content
+    assert repeat.headers["ETag"] == etag
+    assert changed.status_code == 200
+
+    # A worker that has not cached the request checks the tag against the stored row
+    requests.REQUEST_CACHE.clear()
+    forged = client.get(f"/{request_id}", headers={"If-None-Match": f'"{request_id}-0000000000000000"'})
+    assert forged.status_code == 200
+    assert forged.headers["ETag"] == etag
+    requests.REQUEST_CACHE.clear()
+    not_modified = client.get(f"/{request_id}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert client.get(f"/{request_id + 1000}", headers={"If-None-Match": f'"{request_id + 1000}-0000000000000000"'}).status_code == 404
+
 # Define a test function for handling an OpenAI API error.
 @pytest.mark.asyncio
 async def test_openai_api_error():
@@ -89,7 +133,7 @@ async def test_openai_api_error():
     test_request_data = schemas.RequestCreate(text="This will cause an OpenAI error")
 
     # Mock the OpenAI service to raise an OpenAIError.
-    with patch.object(openai_service, "generate_response", side_effect=openai.error.OpenAIError("Test OpenAI API error")):
+    with patch.object(openai_service, "generate_response", side_effect=OpenAIError("Test OpenAI API error")):
         # Send the request to the API endpoint.
         response = client.post("/", json=test_request_data.dict())
 
@@ -126,8 +170,8 @@ async def test_database_error():
     """
     test_request_data = schemas.RequestCreate(text="This will cause a database error")
 
-    # Mock the database session to raise an exception.
-    with patch.object(Session, "add", side_effect=Exception("Test database error")):
+    # Mock the OpenAI service and make the database session raise an exception.
+    with patch.object(openai_service, "generate_response", return_value="Mock response"), patch.object(AsyncSession, "add", side_effect=Exception("Test database error")):
         # Send the request to the API endpoint.
         response = client.post("/", json=test_request_data.dict())
 
@@ -152,4 +196,234 @@ async def test_request_not_found():
     assert response.status_code == 404
 
     # Assert that the error message is in the response body.
-    assert "Request not found" in response.text
\ No newline at end of file
+    assert "Request not found" in response.text
+# Define a test function for streaming a new request.
+@pytest.mark.asyncio
+async def test_create_request_stream():
+    """
+    Tests the POST /requests/stream endpoint, which relays deltas as server-sent events and stores the request at the end.
+    """
+    test_request_data = schemas.RequestCreate(text="Stream this request")
+
+    async def mock_stream_response(text, choice=None):
+        for delta in ["This ", "is ", "streamed"]:
+            yield delta
+
+    with patch.object(openai_service, "stream_response", mock_stream_response):
+        response = client.post("/stream", json=test_request_data.dict())
+
+    # Assert the response status code and content type.
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/event-stream")
+
+    # Split the body into server-sent events.
+    events = [event for event in response.text.split("\n\n") if event]
+    assert [json.loads(event[len("data: "):])["delta"] for event in events[:-1]] == ["This ", "is ", "streamed"]
+    assert events[-1].startswith("event: done\n")
+    done = json.loads(events[-1].split("data: ", 1)[1])
+    assert done["response"] == "This is streamed"
+
+    # Check if the full request is saved in the database.
+    async with AsyncSessionLocal() as db:
+        db_request = await db.get(models.Request, done["id"])
+        assert db_request is not None
+        assert db_request.response == "This is streamed"
+
+# Define a test function for creating a batch of requests.
+@pytest.mark.asyncio
+async def test_create_requests_batch():
+    """
+    Tests the POST /requests/batch endpoint: duplicates are generated once, failures are reported per item, and successes are stored.
+    """
+    calls = []
+
+    async def mock_fetch_response(text, choice=None):
+        calls.append(text)
+        if text == "Broken":
+            raise HTTPException(status_code=500, detail="OpenAI API request failed: boom")
+        return f"Answer to {text}"
+
+    batch = [{"text": "First"}, {"text": "Second"}, {"text": "First"}, {"text": "Broken"}]
+    with patch.object(openai_service, "_fetch_response", side_effect=mock_fetch_response):
+        response = client.post("/batch", json=batch)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert sorted(calls) == ["Broken", "First", "Second"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert results[0]["response"] == results[2]["response"] == "Answer to First"
+    assert results[0]["id"] != results[2]["id"]
+    assert results[3]["id"] is None
+    assert results[3]["error"] == "OpenAI API request failed: boom"
+
+    # Check that every successful item is saved in the database.
+    async with AsyncSessionLocal() as db:
+        stored = (await db.execute(select(models.Request).order_by(models.Request.id))).scalars().all()
+        assert [row.id for row in stored] == [result["id"] for result in results[:3]]
+        assert [row.text for row in stored] == ["First", "Second", "First"]
+
+# Define a test function for rejecting an oversized batch.
+def test_create_requests_batch_too_large():
+    """
+    Tests that batches larger than BATCH_MAX_ITEMS are rejected.
+    """
+    with patch.object(requests, "BATCH_MAX_ITEMS", 2):
+        response = client.post("/batch", json=[{"text": "a"}, {"text": "b"}, {"text": "c"}])
+
+    assert response.status_code == 400
+
+# Define a test function for write-behind mode.
+def test_create_request_write_behind():
+    """
+    Tests that with the write-behind queue running, POST returns a request key right away and the row is flushed later.
+    """
+    # The queue must live on the same event loop as the handlers, so run it from the app's lifespan.
+    write_behind_app = FastAPI(on_startup=[write_behind.start], on_shutdown=[write_behind.drain])
+    write_behind_app.include_router(requests.router)
+
+    with patch.object(openai_service, "generate_response", return_value="Queued answer"):
+        with TestClient(write_behind_app) as write_behind_client:
+            response = write_behind_client.post("/", json={"text": "Write behind me"})
+            assert response.status_code == 200
+            data = response.json()
+            assert data["id"] is None
+            assert data["response"] == "Queued answer"
+
+            # The row is readable by key before it is flushed.
+            assert write_behind_client.get(f"/key/{data['request_key']}").json()["text"] == "Write behind me"
+
+    # After the shutdown drain, the row is in the database.
+    assert client.get(f"/key/{data['request_key']}").json()["id"] is not None
+
+# Define a test function for a client disconnecting mid-stream.
+@pytest.mark.asyncio
+async def test_create_request_stream_disconnect_closes_upstream():
+    """
+    Tests that closing the stream early (as Starlette does on client disconnect) closes the upstream stream and stores nothing.
+    """
+    closed = asyncio.Event()
+
+    async def mock_stream_response(text, choice=None):
+        try:
+            while True:
+                yield "more "
+                await asyncio.sleep(0)
+        finally:
+            closed.set()
+
+    with patch.object(openai_service, "stream_response", mock_stream_response):
+        response = await requests.create_request_stream(schemas.RequestCreate(text="Never finished"), Request({"type": "http", "headers": [], "client": ("127.0.0.1", 1)}), openai_service)
+        body = response.body_iterator
+        assert json.loads((await body.__anext__())[len("data: "):])["delta"] == "more "
+        await body.aclose()
+
+    assert closed.is_set()
+    async with AsyncSessionLocal() as db:
+        assert (await db.execute(select(models.Request))).scalars().first() is None
+
+# Define a test function for a storage failure at the end of a stream.
+def test_create_request_stream_reports_storage_errors():
+    """
+    Tests that a failure to store the streamed request is reported as an SSE `error` event.
+    """
+    async def mock_stream_response(text, choice=None):
+        yield "Complete answer"
+
+    with patch.object(openai_service, "stream_response", mock_stream_response), patch.object(AsyncSession, "commit", side_effect=Exception("disk full")):
+        response = client.post("/stream", json={"text": "Store me"})
+
+    events = [event for event in response.text.split("\n\n") if event]
+    assert events[-1].startswith("event: error\n")
+    assert "disk full" in events[-1]
+
+# Define a test function for the stats endpoint.
+def test_get_stats():
+    """
+    Tests that GET /requests/stats exposes the cache, single-flight and write-behind counters.
+    """
+    response = client.get("/stats")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert {"cache", "l2_cache", "single_flight", "request_cache", "write_behind", "retention"} <= data.keys()
+    assert {"hits", "misses", "hit_ratio"} <= data["cache"].keys()
+    assert {"hits", "misses", "errors"} <= data["l2_cache"].keys()
+    assert {"executions", "coalesced"} <= data["single_flight"].keys()
+    assert {"queued", "flushed_rows", "dropped_rows"} <= data["write_behind"].keys()
+
+async def _store_request(text, response):
+    async with AsyncSessionLocal() as db:
+        row = models.Request(text=text, response=response, created_at=datetime.utcnow())
+        db.add(row)
+        await db.commit()
+        return row.id
+
+async def _store_requests(rows):
+    async with AsyncSessionLocal() as db:
+        db.add_all(models.Request(request_key=f"key-{i}", text=text, response=response, created_at=created_at) for i, (text, response, created_at) in enumerate(rows))
+        await db.commit()
+
+# Define a test function for listing requests page by page.
+def test_list_requests_paginates_with_cursor():
+    """
+    Tests that GET /requests returns every row once, newest first, across cursor pages and within a time range.
+    """
+    same_time = datetime(2024, 1, 1, 12, 0, 0)
+    rows = [(f"Prompt {i}", f"Answer {i}", datetime(2024, 1, 1, 12, i % 3, 0) if i % 2 else same_time) for i in range(7)]
+    asyncio.run(_store_requests(rows))
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3} | ({"cursor": cursor} if cursor else {})
+        page = client.get("/", params=params).json()
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 7
+    assert len({item["request_key"] for item in seen}) == 7
+    order = [(item["created_at"], item["request_key"]) for item in seen]
+    assert [created_at for created_at, _ in order] == sorted((created_at for created_at, _ in order), reverse=True)
+
+    in_range = client.get("/", params={"created_after": "2024-01-01T12:01:00", "created_before": "2024-01-01T12:02:00"}).json()
+    assert [item["text"] for item in in_range["items"]] == ["Prompt 1"]
+    assert in_range["next_cursor"] is None
+
+    assert client.get("/", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/", params={"limit": 0}).status_code == 422
+
+# Define a test function for full-text search.
+def test_search_requests():
+    """
+    Tests that GET /requests/search matches words in texts and responses, and follows updates and deletes.
+    """
+    created_at = datetime(2024, 1, 1)
+    asyncio.run(_store_requests([
+        ("Tell me about penguins", "They live in Antarctica", created_at),
+        ("Tell me about camels", "They live in deserts", created_at),
+        ("Weather today", "Sunny with penguin-shaped clouds", created_at),
+    ]))
+
+    def search(q):
+        response = client.get("/search", params={"q": q})
+        assert response.status_code == 200
+        return {item["text"] for item in response.json()["items"]}
+
+    assert search("penguins") == {"Tell me about penguins"}
+    assert search("live deserts") == {"Tell me about camels"}
+    assert search('"tell" (about*') == {"Tell me about penguins", "Tell me about camels"}
+    assert search("giraffes") == set()
+
+    async def edit():
+        async with AsyncSessionLocal() as db:
+            camels = (await db.execute(select(models.Request).filter(models.Request.text.like("%camels%")))).scalar_one()
+            camels.response = "They have humps"
+            penguins = (await db.execute(select(models.Request).filter(models.Request.text.like("%penguins%")))).scalar_one()
+            await db.delete(penguins)
+            await db.commit()
+
+    asyncio.run(edit())
+    assert search("deserts") == set()
+    assert search("humps") == {"Tell me about camels"}
+    assert search("Antarctica") == set()
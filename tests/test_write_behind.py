@@ -0,0 +1,132 @@
+"""
+Unit tests for the write-behind persistence queue in `database/write_behind.py`.
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+import models
+from database import AsyncSessionLocal
+from database.write_behind import WriteBehindClosed, WriteBehindFull, WriteBehindQueue
+
+def make_row(i: int) -> dict:
+    """
+    Builds the column values of one queued request.
+    """
+    return {"request_key": f"key-{i}", "text": f"prompt {i}", "response": f"answer {i}", "created_at": datetime.utcnow()}
+
+async def count_rows() -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(models.Request))).scalar()
+
+@pytest.mark.asyncio
+async def test_rows_are_flushed_in_batches():
+    """
+    Tests that queued rows are written with one INSERT per batch and are readable while pending.
+    """
+    queue = WriteBehindQueue(AsyncSessionLocal, batch_size=10, flush_interval=0.05)
+    queue.start()
+
+    for i in range(25):
+        await queue.submit(make_row(i))
+    assert queue.get_pending("key-24")["text"] == "prompt 24"
+
+    await queue.drain()
+
+    assert await count_rows() == 25
+    assert queue.get_pending("key-24") is None
+    assert queue.stats()["flushed_rows"] == 25
+    assert queue.stats()["flushed_batches"] == 3
+
+@pytest.mark.asyncio
+async def test_rows_are_flushed_on_the_time_trigger():
+    """
+    Tests that a partial batch is flushed once the flush interval elapses.
+    """
+    queue = WriteBehindQueue(AsyncSessionLocal, batch_size=100, flush_interval=0.01)
+    queue.start()
+
+    await queue.submit(make_row(1))
+    for _ in range(100):
+        if queue.stats()["flushed_rows"]:
+            break
+        await asyncio.sleep(0.01)
+
+    assert await count_rows() == 1
+    await queue.drain()
+
+@pytest.mark.asyncio
+async def test_full_queue_pushes_back():
+    """
+    Tests that submit fails with WriteBehindFull when the queue stays full.
+    """
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    class BlockedSession:
+        async def __aenter__(self):
+            started.set()
+            await release.wait()
+            raise OperationalError("INSERT", {}, Exception("database unavailable"))
+
+        async def __aexit__(self, *exc):
+            return False
+
+    queue = WriteBehindQueue(BlockedSession, max_queue=2, batch_size=1, flush_interval=0, enqueue_timeout=0.01, retry_delay=0)
+    queue.start()
+
+    await queue.submit(make_row(0))
+    await started.wait()  # row 0 is stuck in a flush
+    await queue.submit(make_row(1))
+    await queue.submit(make_row(2))
+    with pytest.raises(WriteBehindFull):
+        await queue.submit(make_row(3))
+
+    assert queue.stats()["rejected_rows"] == 1
+    assert queue.get_pending("key-3") is None
+
+    # The drain gives up after its timeout even though the queue is full and the flush is stuck.
+    await asyncio.wait_for(queue.drain(timeout=0.05), timeout=1)
+    assert not queue.running
+
+@pytest.mark.asyncio
+async def test_submit_is_rejected_while_draining():
+    """
+    Tests that rows cannot be queued once a drain has started, so none are silently left behind.
+    """
+    queue = WriteBehindQueue(AsyncSessionLocal, batch_size=10, flush_interval=0.05)
+    queue.start()
+    await queue.submit(make_row(0))
+
+    drain = asyncio.create_task(queue.drain())
+    await asyncio.sleep(0)
+    assert not queue.accepting
+    with pytest.raises(WriteBehindClosed):
+        await queue.submit(make_row(1))
+    await drain
+
+    assert await count_rows() == 1
+    assert queue.get_pending("key-1") is None
+
+@pytest.mark.asyncio
+async def test_bad_rows_are_dropped_without_blocking_the_batch():
+    """
+    Tests that a non-retryable error (a duplicate request key) drops only the offending row.
+    """
+    queue = WriteBehindQueue(AsyncSessionLocal, batch_size=10, flush_interval=0.05)
+    queue.start()
+
+    await queue.submit(make_row(0))
+    await queue.submit(make_row(1))
+    duplicate = make_row(2)
+    duplicate["request_key"] = "key-0"
+    await queue.submit(duplicate)
+    await queue.drain()
+
+    assert await count_rows() == 2
+    assert queue.stats()["dropped_rows"] == 1
+    assert queue.stats()["pending"] == 0
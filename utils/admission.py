@@ -0,0 +1,262 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+# Admission control for new generations (off unless a concurrency limit is set)
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0"))  # Generations in flight per worker; 0 disables the global limit
+ADMISSION_MAX_PER_CLIENT = int(os.getenv("ADMISSION_MAX_PER_CLIENT", "0"))  # Generations in flight or queued per client; 0 disables
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))  # Generations waiting for a slot; more are rejected with 503
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))  # Longest wait for a slot while not overloaded
+ADMISSION_TARGET_DELAY_SECONDS = float(os.getenv("ADMISSION_TARGET_DELAY_SECONDS", "0.5"))  # Queue delay considered a standing queue (CoDel target)
+ADMISSION_INTERVAL_SECONDS = float(os.getenv("ADMISSION_INTERVAL_SECONDS", "5"))  # Window over which the minimum queue delay is measured
+ADMISSION_TRUST_CLIENT_HEADER = os.getenv("ADMISSION_TRUST_CLIENT_HEADER", "false").lower() in ("1", "true", "yes")  # Key clients on ADMISSION_CLIENT_HEADER instead of the peer address
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "X-Client-ID")  # Identifies clients when trusted; the peer address when absent
+
+class Overloaded(Exception):
+    """
+    Raised when a generation is not admitted.
+
+    Attributes:
+        status_code (int): 429 when the client is over its own limit, 503 when the server is overloaded.
+        retry_after (int): Suggested seconds before retrying.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Limits the generations in flight, globally and per client, and sheds load when the wait for a slot grows.
+
+    Generations that find no free slot wait in a bounded queue. Whether that queue is
+    healthy is judged as in CoDel: if even the shortest queue delay seen during an
+    `interval` exceeds `target_delay`, the queue never drained and the worker is
+    overloaded. While overloaded, new arrivals wait at most `target_delay` instead of
+    `max_wait`, and freed slots go to the newest waiter (adaptive LIFO), whose client is
+    the most likely to still be waiting, so excess load is rejected quickly instead of
+    every caller timing out late.
+
+    Rejections raise `Overloaded`: 429 for a client over `max_per_client`, 503 for a full
+    queue or a wait that ran out, both with a `Retry-After` estimated from recent slot
+    hold times. Cheap work (cache hits, reads) never takes a slot, so it keeps being
+    served while generations are shed.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        max_per_client: int = ADMISSION_MAX_PER_CLIENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_WAIT_SECONDS,
+        target_delay: float = ADMISSION_TARGET_DELAY_SECONDS,
+        interval: float = ADMISSION_INTERVAL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes the controller with every slot free.
+
+        Args:
+            max_concurrency (int): Slots shared by all clients (0 for no global limit).
+            max_per_client (int): Slots plus queue places one client may hold (0 for no limit).
+            max_queue (int): Waiters beyond which new generations are rejected.
+            max_wait (float): Longest wait for a slot while not overloaded.
+            target_delay (float): Acceptable standing queue delay, and the longest wait while overloaded.
+            interval (float): Seconds over which the minimum queue delay is taken.
+            clock (Callable[[], float]): Monotonic time source (overridable for tests).
+        """
+        self.max_concurrency = max_concurrency
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.target_delay = target_delay
+        self.interval = interval
+        self._clock = clock
+        self._waiters: Deque[Tuple[float, str, asyncio.Future]] = deque()
+        self._clients: Dict[str, int] = {}
+        self._interval_ends = clock() + interval
+        self._min_delay: Optional[float] = None
+        self._hold_seconds: Optional[float] = None  # Moving average of slot hold times
+        self.active = 0
+        self.overloaded = False
+        self.admitted = 0
+        self.queued = 0
+        self.bypassed = 0
+        self.rejected_client = 0
+        self.rejected_queue_full = 0
+        self.shed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0 or self.max_per_client > 0
+
+    async def acquire(self, client: str) -> None:
+        """
+        Waits for a slot for one generation of `client`; pair every successful call with `release`.
+
+        Raises:
+            Overloaded: If the client is over its limit, the queue is full or the wait ran out.
+        """
+        if not self.enabled:
+            return
+
+        # 1. Reject clients over their own share before they take a queue place
+        if self.max_per_client and self._clients.get(client, 0) >= self.max_per_client:
+            self.rejected_client += 1
+            raise Overloaded(429, "Too many concurrent requests from this client.", self.retry_after())
+
+        # 2. Take a free slot at once when nobody is waiting for one
+        if not self.max_concurrency or (self.active < self.max_concurrency and not self._waiters):
+            self._observe(0.0)
+            self._grant(client)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded(503, "Server overloaded, please retry.", self.retry_after())
+
+        # 3. Queue, waiting less while the queue is not draining
+        entry = (self._clock(), client, asyncio.get_running_loop().create_future())
+        self._waiters.append(entry)
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self.queued += 1
+        try:
+            await asyncio.wait_for(entry[2], self.target_delay if self.overloaded else self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(entry)
+            self.shed += 1
+            raise Overloaded(503, "Server overloaded, please retry.", self.retry_after())
+        except asyncio.CancelledError:
+            if entry[2].done() and not entry[2].cancelled():
+                self.release(client)  # The slot was handed over just as the caller went away
+            else:
+                self._abandon(entry)
+            raise
+
+    def release(self, client: str, held_seconds: Optional[float] = None) -> None:
+        """
+        Frees a slot taken by `acquire` and hands it to the next waiter.
+
+        Args:
+            client (str): The client passed to `acquire`.
+            held_seconds (Optional[float]): How long the slot was held, for the `Retry-After` estimate.
+        """
+        if not self.enabled:
+            return
+        self.active -= 1
+        self._forget(client)
+        if held_seconds is not None:
+            self._hold_seconds = held_seconds if self._hold_seconds is None else 0.9 * self._hold_seconds + 0.1 * held_seconds
+        while self._waiters and self.active < self.max_concurrency:
+            enqueued, waiter, future = self._waiters.pop() if self.overloaded else self._waiters.popleft()
+            if future.done():
+                continue  # Timed out or cancelled; it already gave up its place
+            self._observe(self._clock() - enqueued)
+            self.active += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, client: str, cheap: bool = False) -> AsyncIterator[None]:
+        """
+        Holds a slot for the body of an `async with` block.
+
+        Args:
+            client (str): The client the generation is for.
+            cheap (bool): The work needs no slot (e.g. the answer is cached); it is let through at once.
+
+        Raises:
+            Overloaded: If the generation is not admitted.
+        """
+        if cheap or not self.enabled:
+            if cheap and self.enabled:
+                self.bypassed += 1
+            yield
+            return
+        await self.acquire(client)
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.release(client, self._clock() - started)
+
+    def retry_after(self) -> int:
+        """
+        Estimates the seconds until a slot frees up for a new arrival.
+        """
+        if self._hold_seconds is None or not self.max_concurrency:
+            return 1
+        return max(1, math.ceil(self._hold_seconds * (len(self._waiters) + 1) / self.max_concurrency))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the limits, the current load and the admission counters.
+        """
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "max_per_client": self.max_per_client,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "clients": len(self._clients),
+            "overloaded": self.overloaded,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "bypassed": self.bypassed,
+            "rejected_client": self.rejected_client,
+            "rejected_queue_full": self.rejected_queue_full,
+            "shed": self.shed,
+            "hold_seconds": self._hold_seconds,
+        }
+
+    def _grant(self, client: str) -> None:
+        self.active += 1
+        self.admitted += 1
+        self._clients[client] = self._clients.get(client, 0) + 1
+
+    def _abandon(self, entry: Tuple[float, str, asyncio.Future]) -> None:
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            pass
+        self._forget(entry[1])
+
+    def _forget(self, client: str) -> None:
+        remaining = self._clients.get(client, 0) - 1
+        if remaining > 0:
+            self._clients[client] = remaining
+        else:
+            self._clients.pop(client, None)
+
+    def _observe(self, delay: float) -> None:
+        """
+        Records the queue delay of an admitted generation and re-evaluates overload once per interval.
+        """
+        self._min_delay = delay if self._min_delay is None else min(self._min_delay, delay)
+        now = self._clock()
+        if now >= self._interval_ends:
+            self.overloaded = self._min_delay > self.target_delay
+            self._min_delay = None
+            self._interval_ends = now + self.interval
+
+def client_id(request, trust_header: bool = ADMISSION_TRUST_CLIENT_HEADER, header: str = ADMISSION_CLIENT_HEADER) -> str:
+    """
+    Identifies the client of a Starlette request for per-client limits.
+
+    Clients are keyed on the peer address. The client-supplied `header` is only honoured
+    when `trust_header` is set, i.e. behind a gateway that authenticates clients and sets
+    it; otherwise any caller could pick a fresh identity per request and dodge its limit.
+    """
+    if trust_header:
+        client = request.headers.get(header)
+        if client:
+            return client
+    return request.client.host if request.client is not None else "anonymous"
+
+# Shared controller for this process (admits everything unless a limit is configured)
+admission = AdmissionController()
@@ -0,0 +1,298 @@
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Format version of the files written by `save_snapshot`
+SNAPSHOT_VERSION = 1
+
+def default_size_of(value: Any) -> int:
+    """
+    Estimates the memory footprint of a cached key or value in bytes.
+
+    Strings and bytes are measured by their encoded length; anything else falls back to `sys.getsizeof`.
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return sys.getsizeof(value)
+
+class LRUCache:
+    """
+    A bounded least-recently-used cache with per-entry time-to-live.
+
+    Entries live in an `OrderedDict` kept in recency order, so `get` and `set` are O(1):
+    hits move the entry to the back, and capacity evictions pop from the front.
+    Expired entries are dropped lazily when they are read or reach the front of the queue,
+    never by scanning the whole cache.
+
+    Hit, miss, eviction and expiration counters are exposed through `stats()`.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = 1000,
+        ttl_seconds: Optional[float] = 3600,
+        max_bytes: Optional[int] = None,
+        size_of: Callable[[Any], int] = default_size_of,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes an empty cache.
+
+        Args:
+            max_entries (Optional[int]): Maximum number of entries, or None for no count limit.
+            ttl_seconds (Optional[float]): Lifetime of each entry, or None for entries that never expire.
+            max_bytes (Optional[int]): Maximum total size of keys and values, or None for no size limit.
+            size_of (Callable[[Any], int]): Function estimating the size of a key or value in bytes.
+            clock (Callable[[], float]): Monotonic time source (overridable for tests).
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._size_of = size_of
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the cached value for `key` and marks it as most recently used.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any): Value returned on a miss.
+
+        Returns:
+            Any: The cached value, or `default` if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable) -> Any:
+        """
+        Returns the cached value for `key` without touching recency or counters.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= self._clock():
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """
+        Stores `value` under `key`, evicting expired and least-recently-used entries as needed.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to cache.
+            ttl_seconds (Optional[float]): Per-entry override of the cache's TTL.
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = self._clock()
+        expires_at = now + ttl if ttl is not None else None
+        size = self._size_of(key) + self._size_of(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # Too big to cache at all; the stale value for this key is gone too
+            self._entries[key] = (value, expires_at, size)
+            self.current_bytes += size
+            self._evict(now)
+
+    def delete(self, key: Hashable) -> bool:
+        """
+        Removes `key` from the cache.
+
+        Returns:
+            bool: True if the key was present.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        """
+        Removes every entry (counters are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def purge_expired(self) -> int:
+        """
+        Removes every expired entry with a full O(n) scan.
+
+        The cache never needs this to stay bounded; it is only useful for explicit maintenance.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        now = self._clock()
+        with self._lock:
+            expired = [key for key, (_, expires_at, _) in self._entries.items() if expires_at is not None and expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+            return len(expired)
+
+    def snapshot(self) -> List[Tuple[Hashable, Any, Optional[float]]]:
+        """
+        Lists the live entries from least to most recently used, with their remaining lifetime.
+
+        Returns:
+            List[Tuple[Hashable, Any, Optional[float]]]: `(key, value, seconds left)` (None for entries that never expire).
+        """
+        now = self._clock()
+        with self._lock:
+            entries = list(self._entries.items())
+        return [
+            (key, value, None if expires_at is None else expires_at - now)
+            for key, (value, expires_at, _) in entries
+            if expires_at is None or expires_at > now
+        ]
+
+    def restore(self, entries: Iterable[Tuple[Hashable, Any, Optional[float]]]) -> int:
+        """
+        Adds entries in the form returned by `snapshot`, skipping those with no lifetime left.
+
+        Entries are added in order, so the last ones end up most recently used, and the
+        cache's limits apply as usual. A lifetime is never extended beyond the cache's TTL.
+
+        Returns:
+            int: The number of entries added.
+        """
+        restored = 0
+        for key, value, seconds_left in entries:
+            if seconds_left is not None and seconds_left <= 0:
+                continue
+            if self.ttl_seconds is not None:
+                seconds_left = self.ttl_seconds if seconds_left is None else min(seconds_left, self.ttl_seconds)
+            self.set(key, value, ttl_seconds=seconds_left)
+            restored += 1
+        return restored
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the cache's size and hit/miss/eviction counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def _evict(self, now: float) -> None:
+        # Drop expired entries sitting at the LRU end first, then enforce the limits.
+        while self._entries:
+            key, (_, expires_at, _) = next(iter(self._entries.items()))
+            if expires_at is not None and expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+            elif (self.max_entries is not None and len(self._entries) > self.max_entries) or (
+                self.max_bytes is not None and self.current_bytes > self.max_bytes
+            ):
+                self._remove(key)
+                self.evictions += 1
+            else:
+                break
+
+def save_snapshot(cache: LRUCache, path: str) -> int:
+    """
+    Writes a cache's live entries to a gzipped JSON-lines file, for `load_snapshot` after a restart.
+
+    Expiry times are stored as wall-clock timestamps, since the cache's monotonic clock does
+    not survive the process. The file is written next to `path` and renamed into place, so
+    readers never see a partial snapshot. Keys and values must be JSON-serializable.
+
+    Args:
+        cache (LRUCache): The cache to save.
+        path (str): The snapshot file.
+
+    Returns:
+        int: The number of entries written.
+    """
+    entries = cache.snapshot()
+    now = time.time()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(partial, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"version": SNAPSHOT_VERSION, "saved_at": now}) + "\n")
+        for key, value, seconds_left in entries:
+            f.write(json.dumps([key, value, None if seconds_left is None else now + seconds_left]) + "\n")
+    os.replace(partial, path)
+    return len(entries)
+
+def read_snapshot(path: str) -> List[Tuple[Hashable, Any, Optional[float]]]:
+    """
+    Reads the entries of a snapshot file, with their lifetime left as of now (possibly negative).
+
+    Returns:
+        List[Tuple[Hashable, Any, Optional[float]]]: Entries for `LRUCache.restore`; empty if the file is missing.
+
+    Raises:
+        ValueError: If the file is not a snapshot of a supported version.
+    """
+    if not os.path.exists(path):
+        return []
+    now = time.time()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported cache snapshot: {path}")
+        return [(key, value, None if expires_at is None else expires_at - now) for key, value, expires_at in map(json.loads, f)]
+
+def load_snapshot(cache: LRUCache, path: str) -> int:
+    """
+    Adds the unexpired entries of a snapshot file to a cache (nothing if the file is missing).
+
+    Returns:
+        int: The number of entries loaded.
+    """
+    return cache.restore(read_snapshot(path))
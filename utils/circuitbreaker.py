@@ -0,0 +1,110 @@
+import time
+from typing import Any, Callable, Dict, Optional
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose circuit is open.
+
+    Attributes:
+        retry_after (float): Seconds until the circuit lets a trial call through.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry in {retry_after:.1f} seconds")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency until it has had time to recover.
+
+    The circuit starts closed. After `failure_threshold` consecutive failures it opens and
+    `check()` raises `CircuitOpenError` for `reset_timeout` seconds. Then it is half-open:
+    a single trial call is let through, and its outcome closes the circuit again or
+    re-opens it for another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Initializes a closed circuit.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit (0 disables the breaker).
+            reset_timeout (float): Seconds the circuit stays open before a trial call.
+            clock (Callable[[], float]): Monotonic time source (overridable for tests).
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.consecutive_failures = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def check(self) -> None:
+        """
+        Lets a call through, or raises if the circuit is open or a half-open trial is already running.
+
+        Raises:
+            CircuitOpenError: If the call must not be made now.
+        """
+        if self.failure_threshold <= 0:
+            return
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(max(0.0, self._opened_at + self.reset_timeout - self._clock()))
+
+    def record_success(self) -> None:
+        """
+        Records a call that reached the dependency and got an answer; closes the circuit.
+        """
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        """
+        Records a call that failed because the dependency is unavailable.
+        """
+        self.consecutive_failures += 1
+        if self._state == self.HALF_OPEN or (
+            self.failure_threshold > 0 and self._state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+            self.opened += 1
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        """
+        Gives up a call that ended without an outcome (e.g. it was cancelled), so a half-open circuit can try again.
+        """
+        self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the circuit state and its counters.
+        """
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,11 @@
+import os
+from datetime import datetime
+
+def generate_unique_id() -> str:
+    """
+    Generates a unique ID for each request, ensuring data integrity and tracking.
+
+    Kept free of import side effects so request handlers can use it without loading `utils.helpers`.
+    """
+    # Use a combination of timestamp and random string for ID generation 
+    return f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{os.urandom(8).hex()}"
@@ -0,0 +1,254 @@
+import bisect
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a sub-millisecond cache lookup up to a long completion
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# A sample is (name suffix, labels, value); a family is (name, type, help, samples)
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """
+    Base class for a metric family with optional labels.
+
+    Children for each label combination are created on first use and should be bound once
+    (`metric.labels(stage="db_commit")`) and kept, so the hot path is a plain attribute update.
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._default = None if self.labelnames else self.labels()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, **labels: str):
+        """
+        Returns the child metric for one combination of label values.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _unlabelled(self):
+        if self._default is None:
+            raise ValueError(f"{self.name} has labels; use .labels(...)")
+        return self._default
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> Family:
+        samples: List[Sample] = []
+        for key, child in list(self._children.items()):
+            samples.extend(child._samples(dict(zip(self.labelnames, key))))
+        return self.name, self.type_name, self.documentation, samples
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def _samples(self, labels: Dict[str, str]) -> List[Sample]:
+        return [("_total", labels, self.value)]
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count, exposed as `<name>_total`.
+    """
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._unlabelled().inc(amount)
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def _samples(self, labels: Dict[str, str]) -> List[Sample]:
+        return [("", labels, self.value)]
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down, such as the number of requests in flight.
+    """
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._unlabelled().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._unlabelled().set(value)
+
+class _Timer:
+    __slots__ = ("_histogram", "_started")
+
+    def __init__(self, histogram: "_HistogramChild"):
+        self._histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._started)
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)  # Per-bucket (not cumulative) counts; the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """
+        Returns a context manager that observes the duration of its block.
+        """
+        return _Timer(self)
+
+    def _samples(self, labels: Dict[str, str]) -> List[Sample]:
+        samples: List[Sample] = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (math.inf,), self._counts):
+            cumulative += count
+            samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+        samples.append(("_sum", labels, self.sum))
+        samples.append(("_count", labels, cumulative))
+        return samples
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values (usually latencies in seconds) over fixed buckets.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional["Registry"] = None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._unlabelled().observe(value)
+
+    def time(self) -> _Timer:
+        return self._unlabelled().time()
+
+class Registry:
+    """
+    Holds metrics and scrape-time collectors and renders them in the Prometheus text format.
+
+    Metrics are updated in place on the event loop thread without locking; collectors are
+    callables run only when `/metrics` is scraped, so exposing counters that other
+    components already keep (cache, rate limiter, write-behind queue) costs nothing per request.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """
+        Adds a callable returning `(name, type, help, samples)` families, evaluated on every scrape.
+        """
+        self._collectors.append(collector)
+
+    def collect(self) -> List[Family]:
+        families = [metric.collect() for metric in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+        return families
+
+    def render(self, extra: Iterable[Family] = ()) -> str:
+        """
+        Renders every metric, followed by the `extra` families, in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for name, type_name, documentation, samples in [*self.collect(), *extra]:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Registry served at GET /metrics
+REGISTRY = Registry()
+
+# Shared instrumentation (bind label values once at import time, see `_Metric`)
+STAGE_DURATION_SECONDS = Histogram(
+    "app_stage_duration_seconds", "Time spent in each stage of handling a request.", labelnames=("stage",)
+)
+HTTP_REQUEST_DURATION_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", labelnames=("method", "route", "status")
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+OPENAI_REQUESTS_IN_FLIGHT = Gauge("openai_requests_in_flight", "Calls to the OpenAI API currently in flight.")
+OPENAI_TOKENS = Counter("openai_tokens", "Tokens consumed by OpenAI calls, as reported by the API.", labelnames=("type",))
@@ -0,0 +1,209 @@
+import functools
+import hashlib
+import re
+import struct
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# Normalizations applied to prompts before keying, in this order
+NORMALIZATIONS = ("case", "punctuation", "whitespace")
+
+FINGERPRINT_BITS = 64
+SHINGLE_CHARS = 4  # Length of the character n-grams a fingerprint is built from
+SHINGLE_CACHE_SIZE = 65536  # Hashed shingles kept for reuse
+
+_WHITESPACE = re.compile(r"\s+")
+
+def parse_normalization(value: str) -> Tuple[str, ...]:
+    """
+    Parses a comma-separated list of normalizations (e.g. `"whitespace,case"`).
+
+    Returns:
+        Tuple[str, ...]: The named normalizations, in application order.
+
+    Raises:
+        ValueError: If a name is not one of `NORMALIZATIONS`.
+    """
+    names = {name.strip().lower() for name in value.split(",") if name.strip()}
+    unknown = names - set(NORMALIZATIONS)
+    if unknown:
+        raise ValueError(f"Unknown prompt normalization(s): {', '.join(sorted(unknown))} (expected {', '.join(NORMALIZATIONS)})")
+    return tuple(name for name in NORMALIZATIONS if name in names)
+
+def normalize_prompt(text: str, normalizations: Iterable[str] = NORMALIZATIONS) -> str:
+    """
+    Applies the given normalizations to a prompt.
+
+    `case` folds case, `punctuation` drops Unicode punctuation (symbols such as `+` or `$`
+    are kept, since they change the meaning) and `whitespace` collapses runs of whitespace
+    and strips the ends.
+    """
+    normalizations = set(normalizations)
+    if "case" in normalizations:
+        text = text.casefold()
+    if "punctuation" in normalizations:
+        text = "".join(ch for ch in text if not unicodedata.category(ch).startswith("P"))
+    if "whitespace" in normalizations:
+        text = _WHITESPACE.sub(" ", text).strip()
+    return text
+
+def simhash(text: str, shingle_chars: int = SHINGLE_CHARS) -> int:
+    """
+    Computes the 64-bit SimHash of a prompt's character shingles.
+
+    The prompt is fully normalized first, and every distinct shingle votes with its count
+    on each bit of its hash. Prompts differing by a few characters get fingerprints a few
+    bits apart, unrelated prompts about half the bits apart.
+
+    Args:
+        text (str): The prompt.
+        shingle_chars (int): Length of the character n-grams.
+
+    Returns:
+        int: The fingerprint.
+    """
+    text = normalize_prompt(text)
+    if len(text) <= shingle_chars:
+        shingles = Counter([text])
+    else:
+        shingles = Counter(text[i:i + shingle_chars] for i in range(len(text) - shingle_chars + 1))
+    # Add up the votes of all shingles at once, one 32-bit lane per fingerprint bit
+    lanes = 0
+    for shingle, count in shingles.items():
+        lanes += _shingle_lanes(shingle) * count
+    votes = struct.unpack(f"<{FINGERPRINT_BITS}I", lanes.to_bytes(FINGERPRINT_BITS * 4, "little"))
+    total = sum(shingles.values())
+    return sum(1 << bit for bit, count in enumerate(votes) if 2 * count > total)
+
+# Each byte value spread over 8 lanes of 32 bits, one per bit
+_SPREAD = [sum(1 << (32 * bit) for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+@functools.lru_cache(maxsize=SHINGLE_CACHE_SIZE)
+def _shingle_lanes(shingle: str) -> int:
+    # The shingle's 64-bit hash with bit i moved to lane i (common shingles recur across prompts, hence the cache)
+    lanes = 0
+    for value in hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest():
+        lanes = (lanes << 256) | _SPREAD[value]
+    return lanes
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def max_distance_for(threshold: float) -> int:
+    """
+    Converts a similarity threshold (1 - distance / 64) into the largest accepted Hamming distance.
+    """
+    return max(0, int((1.0 - threshold) * FINGERPRINT_BITS + 1e-9))
+
+class SimHashIndex:
+    """
+    Finds stored SimHash fingerprints within `max_distance` bits of a query without scanning them all.
+
+    Fingerprints are split into `max_distance + 1` bands. Two fingerprints at most
+    `max_distance` bits apart agree on at least one whole band, so a lookup only compares
+    the entries sharing one of the query's band values: a few per lookup for distances
+    up to about 6, independent of the number of entries. Entries are partitioned by
+    namespace (e.g. the model route), and beyond `max_entries` the least recently added
+    or matched ones are dropped, which bounds memory.
+    """
+
+    def __init__(self, max_distance: int = 3, max_entries: int = 100_000):
+        """
+        Initializes an empty index.
+
+        Args:
+            max_distance (int): Largest Hamming distance reported as a match (at most 63).
+            max_entries (int): Entries kept before the least recently used are dropped.
+        """
+        if not 0 <= max_distance < FINGERPRINT_BITS:
+            raise ValueError(f"max_distance must be between 0 and {FINGERPRINT_BITS - 1}")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        bands = max_distance + 1
+        self._bands: List[Tuple[int, int]] = []  # (shift, mask) of each band
+        shift = 0
+        for band in range(bands):
+            width = FINGERPRINT_BITS // bands + (1 if band < FINGERPRINT_BITS % bands else 0)
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Any, int], Set[Hashable]] = {}
+        self.lookups = 0
+        self.matches = 0
+        self.compared = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: Hashable, fingerprint: int, namespace: Any = None) -> None:
+        """
+        Stores (or replaces) the fingerprint of `key`.
+        """
+        if key in self._entries:
+            self.remove(key)
+        self._entries[key] = (namespace, fingerprint)
+        for bucket in self._bucket_keys(fingerprint, namespace):
+            self._buckets.setdefault(bucket, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self.remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def find(self, fingerprint: int, namespace: Any = None) -> Optional[Tuple[Hashable, int]]:
+        """
+        Returns the closest stored key within `max_distance` bits, and its distance.
+        """
+        self.lookups += 1
+        best: Optional[Tuple[Hashable, int]] = None
+        seen: Set[Hashable] = set()
+        for bucket in self._bucket_keys(fingerprint, namespace):
+            for key in self._buckets.get(bucket, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                distance = hamming_distance(fingerprint, self._entries[key][1])
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (key, distance)
+        self.compared += len(seen)
+        if best is not None:
+            self.matches += 1
+            self._entries.move_to_end(best[0])
+        return best
+
+    def remove(self, key: Hashable) -> bool:
+        """
+        Removes `key`; returns whether it was present.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        namespace, fingerprint = entry
+        for bucket in self._bucket_keys(fingerprint, namespace):
+            keys = self._buckets.get(bucket)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._buckets[bucket]
+        return True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the size of the index and its lookup counters.
+        """
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "compared_per_lookup": self.compared / self.lookups if self.lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _bucket_keys(self, fingerprint: int, namespace: Any) -> List[Tuple[int, Any, int]]:
+        return [(band, namespace, (fingerprint >> shift) & mask) for band, (shift, mask) in enumerate(self._bands)]
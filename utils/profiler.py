@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from settings import PROFILE_SAMPLE_RATE, PROFILE_SLOW_SECONDS
+from utils.ids import generate_unique_id
+
+# Sampling profiler (off unless a sample rate or a slow-request threshold is set)
+# PROFILE_SAMPLE_RATE and PROFILE_SLOW_SECONDS turn it on (see settings.py)
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))  # Time between stack samples
+PROFILE_BUFFER_SECONDS = float(os.getenv("PROFILE_BUFFER_SECONDS", "60"))  # Samples kept; longer requests keep only their end
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Where the collapsed-stack files are written
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "1000"))  # Older files are deleted beyond this many
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "25"))  # Functions listed in the summary
+
+logger = logging.getLogger(__name__)
+
+Stack = Tuple[str, ...]
+
+class Profiler:
+    """
+    Samples the stack of the event-loop thread and turns the samples taken during a request into a profile.
+
+    A background thread records the loop thread's stack every `interval` seconds into a
+    time-bounded buffer. When a request finishes and was either picked by `sample_rate`
+    or took at least `slow_seconds`, the samples between its start and end are written as
+    a collapsed-stack file (one `frame;frame;frame count` line per distinct stack, the
+    input format of flamegraph.pl and speedscope) and added to the top-functions summary.
+
+    Requests share the event loop, so a profile shows everything the worker ran while the
+    request was in flight, including other requests and time spent idle in the selector
+    (waiting on the database or OpenAI). That is what explains a latency spike. Without
+    `slow_seconds`, sampling only runs while a picked request is in flight.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        slow_seconds: float = PROFILE_SLOW_SECONDS,
+        interval: float = PROFILE_INTERVAL_SECONDS,
+        buffer_seconds: float = PROFILE_BUFFER_SECONDS,
+        directory: str = PROFILE_DIR,
+        max_files: int = PROFILE_MAX_FILES,
+        top_functions: int = PROFILE_TOP_FUNCTIONS,
+    ):
+        """
+        Initializes the profiler; sampling starts with the first request.
+
+        Args:
+            sample_rate (float): Fraction of requests profiled.
+            slow_seconds (float): Requests at least this slow are profiled too (0 disables).
+            interval (float): Seconds between stack samples.
+            buffer_seconds (float): Seconds of samples kept in memory.
+            directory (str): Directory for the collapsed-stack files.
+            max_files (int): Number of files kept in `directory`.
+            top_functions (int): Length of the top-functions summary.
+        """
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.directory = directory
+        self.max_files = max_files
+        self.top_functions = top_functions
+        self._samples: Deque[Tuple[float, Stack]] = deque(maxlen=max(1, math.ceil(buffer_seconds / interval)))
+        self._labels: Dict[Any, str] = {}
+        self._self_samples: Counter = Counter()
+        self._picked = 0  # Picked requests in flight (sampling is needed while > 0)
+        self._wanted = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+        self._written: Deque[str] = deque()
+        self._pending: Set[asyncio.Future] = set()  # Profile writes still running in the executor
+        self.profiled_requests = 0
+        self.files_written = 0
+        self.write_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_seconds > 0
+
+    def start(self) -> None:
+        """
+        Starts sampling the calling thread, which must be the one running the event loop (idempotent).
+        """
+        if self._thread is not None:
+            return
+        self._target = threading.get_ident()
+        self._stop.clear()
+        if self.slow_seconds > 0:
+            self._wanted.set()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the sampling thread.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wanted.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self._wanted.wait(timeout=1):
+                continue
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self._samples.append((time.monotonic(), self._stack(frame)))
+            del frame
+            self._stop.wait(self.interval)
+
+    def _stack(self, frame) -> Stack:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def begin(self) -> bool:
+        """
+        Called when a request starts (on the event-loop thread); returns whether it was picked by the sample rate.
+        """
+        self.start()
+        self._target = threading.get_ident()  # Follows the loop if it is replaced, as in tests
+        picked = self.sample_rate > 0 and random.random() < self.sample_rate
+        if picked:
+            self._picked += 1
+            self._wanted.set()
+        return picked
+
+    def end(self, picked: bool, started: float, finished: float, route: str, request_id: str) -> None:
+        """
+        Called when a request finishes; profiles it if it was picked or slow.
+
+        Args:
+            picked (bool): The result of `begin`.
+            started (float): `time.monotonic()` at the start of the request.
+            finished (float): `time.monotonic()` at its end.
+            route (str): The matched route template, used in the file name.
+            request_id (str): The request id, used in the file name.
+        """
+        if picked:
+            self._picked -= 1
+            if self._picked == 0 and self.slow_seconds <= 0:
+                self._wanted.clear()
+        if not picked and not (0 < self.slow_seconds <= finished - started):
+            return
+
+        # 1. Collect the samples taken while the request was in flight (the newest are at the right);
+        # the sampling thread keeps appending, so iterate over a copy
+        stacks = []
+        samples = list(self._samples)
+        for taken, stack in reversed(samples):
+            if taken < started:
+                break
+            if taken <= finished:
+                stacks.append(stack)
+        self.profiled_requests += 1
+        if not stacks:
+            return
+
+        # 2. Attribute self time to the innermost frame, and write the profile off the event loop
+        counts = Counter(stacks)
+        for stack, count in counts.items():
+            self._self_samples[stack[-1]] += count
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{_slug(route)}-{_slug(request_id)}.collapsed"
+        write = asyncio.get_running_loop().run_in_executor(None, self._write, name, counts)
+        self._pending.add(write)
+        write.add_done_callback(self._write_done)
+
+    def _write_done(self, write: asyncio.Future) -> None:
+        self._pending.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            self.write_errors += 1
+            logger.error("Profile write failed", exc_info=write.exception())
+
+    def _write(self, name: str, counts: Counter) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, name)
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{';'.join(stack)} {count}\n")
+            self._written.append(path)
+            self.files_written += 1
+            while len(self._written) > self.max_files:
+                os.remove(self._written.popleft())
+        except OSError as e:
+            self.write_errors += 1
+            logger.warning("Could not write profile %s: %s", name, e)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the profiling counters and the functions with the most self time across all profiled requests.
+        """
+        top: List[Dict[str, Any]] = [
+            {"function": label, "samples": count, "self_seconds": count * self.interval}
+            for label, count in self._self_samples.most_common(self.top_functions)
+        ]
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_seconds": self.slow_seconds,
+            "profiled_requests": self.profiled_requests,
+            "files_written": self.files_written,
+            "write_errors": self.write_errors,
+            "pending_writes": len(self._pending),
+            "buffered_samples": len(self._samples),
+            "top_functions": top,
+        }
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", value).strip("_")[:80] or "root"
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware handing each HTTP request to a `Profiler`.
+
+    Requests keep their `X-Request-ID` header, or get a generated one, which is echoed in
+    the response and used to name the profile. Only installed while profiling is enabled,
+    so it costs nothing otherwise.
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"x-request-id"), None)
+        request_id = request_id or generate_unique_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        picked = self.profiler.begin()
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = scope.get("route")
+            self.profiler.end(picked, started, time.monotonic(), route.path if route is not None else "unmatched", request_id)
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+class RateLimitTimeout(Exception):
+    """
+    Raised when a caller waited longer than `max_wait` for its turn.
+    """
+
+class RateLimiter:
+    """
+    Schedules outbound calls under a requests-per-period and a tokens-per-period budget.
+
+    Each budget is a token bucket that holds at most one period's worth and refills
+    continuously. Callers are served strictly in arrival order: the caller at the head of
+    the queue waits until both buckets can cover its request, while everyone behind it
+    waits for the head. A budget of None (or 0) is not enforced.
+
+    `backoff()` pauses the whole queue, e.g. after the upstream answers 429 despite the
+    local budgets (other workers share the same account).
+    """
+
+    def __init__(
+        self,
+        requests_per_period: Optional[int] = None,
+        tokens_per_period: Optional[int] = None,
+        period: float = 60.0,
+        max_wait: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes the limiter with both buckets full.
+
+        Args:
+            requests_per_period (Optional[int]): Requests allowed per period, or None for no limit.
+            tokens_per_period (Optional[int]): Tokens allowed per period, or None for no limit.
+            period (float): Length of the budget period in seconds (60 for RPM/TPM).
+            max_wait (Optional[float]): Longest a caller may queue before `RateLimitTimeout`, or None to wait indefinitely.
+            clock (Callable[[], float]): Monotonic time source (overridable for tests).
+        """
+        self.requests_per_period = requests_per_period or None
+        self.tokens_per_period = tokens_per_period or None
+        self.period = period
+        self.max_wait = max_wait
+        self._clock = clock
+        self._request_allowance = float(self.requests_per_period or 0)
+        self._token_allowance = float(self.tokens_per_period or 0)
+        self._updated_at = clock()
+        self._paused_until = 0.0
+        self._head = asyncio.Lock()
+        self.waiting = 0
+        self.acquired = 0
+        self.delayed = 0
+        self.timeouts = 0
+        self.backoffs = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_period is not None or self.tokens_per_period is not None
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """
+        Waits for this caller's turn and spends one request and `tokens` tokens.
+
+        Args:
+            tokens (int): Estimated tokens the call will consume.
+
+        Raises:
+            RateLimitTimeout: If the caller waited longer than `max_wait` seconds.
+        """
+        if not self.enabled and self._clock() >= self._paused_until:
+            return
+        if self.tokens_per_period is not None:
+            tokens = min(tokens, self.tokens_per_period)  # A single oversized call must still get through eventually
+        started = self._clock()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._take(tokens), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise RateLimitTimeout(f"Waited more than {self.max_wait} seconds for the rate limit")
+        finally:
+            self.waiting -= 1
+        waited = self._clock() - started
+        self.acquired += 1
+        if waited > 0.001:
+            self.delayed += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def refund(self, tokens: int) -> None:
+        """
+        Returns tokens that were reserved by `acquire` but not used (e.g. a short completion).
+        """
+        if self.tokens_per_period is not None and tokens > 0:
+            self._refill()
+            self._token_allowance = min(float(self.tokens_per_period), self._token_allowance + tokens)
+
+    def backoff(self, seconds: float) -> None:
+        """
+        Holds every queued caller for `seconds`, e.g. after an upstream 429 (even when no budget is configured).
+        """
+        self.backoffs += 1
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the configured budgets, queue depth and wait-time counters.
+        """
+        return {
+            "enabled": self.enabled,
+            "requests_per_period": self.requests_per_period,
+            "tokens_per_period": self.tokens_per_period,
+            "period_seconds": self.period,
+            "queue_depth": self.waiting,
+            "acquired": self.acquired,
+            "delayed": self.delayed,
+            "timeouts": self.timeouts,
+            "backoffs": self.backoffs,
+            "avg_wait_seconds": self.total_wait_seconds / self.acquired if self.acquired else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+    async def _take(self, tokens: int) -> None:
+        # The lock is FIFO, so whoever holds it is the head of the queue.
+        async with self._head:
+            while True:
+                delay = self._delay_for(tokens)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            if self.requests_per_period is not None:
+                self._request_allowance -= 1
+            if self.tokens_per_period is not None:
+                self._token_allowance -= tokens
+
+    def _delay_for(self, tokens: int) -> float:
+        self._refill()
+        now = self._clock()
+        delay = self._paused_until - now
+        if self.requests_per_period is not None and self._request_allowance < 1:
+            delay = max(delay, (1 - self._request_allowance) * self.period / self.requests_per_period)
+        if self.tokens_per_period is not None and self._token_allowance < tokens:
+            delay = max(delay, (tokens - self._token_allowance) * self.period / self.tokens_per_period)
+        return delay
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_period is not None:
+            self._request_allowance = min(
+                float(self.requests_per_period), self._request_allowance + elapsed * self.requests_per_period / self.period
+            )
+        if self.tokens_per_period is not None:
+            self._token_allowance = min(
+                float(self.tokens_per_period), self._token_allowance + elapsed * self.tokens_per_period / self.period
+            )
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single in-flight execution.
+
+    The first caller for a key (the leader) starts the work as a task; callers that
+    arrive while it is running await the same task instead of starting their own.
+    Results and exceptions are delivered to every waiter, and the key is released
+    as soon as the task finishes, so failures are never remembered.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty in-flight registry and its counters.
+        """
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.executions = 0  # Calls that actually ran the work
+        self.coalesced = 0  # Calls served by another caller's execution (work saved)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `fn()` for `key`, or joins the execution already in flight for it.
+
+        Waiters are shielded from each other: cancelling one caller does not cancel
+        the shared execution the others are waiting on.
+
+        Args:
+            key (Hashable): The deduplication key.
+            fn (Callable[[], Awaitable[Any]]): Factory for the coroutine doing the work.
+
+        Returns:
+            Any: The result of the shared execution.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._release(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of executions, coalesced calls and keys currently in flight.
+        """
+        return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+    def _release(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Mark the exception retrieved even if every waiter went away